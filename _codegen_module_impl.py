@@ -1,17 +1,27 @@
+import hashlib
 import importlib
-import inspect
+import marshal
 import os
-import shutil
+import re
 import sys
+import threading
 import warnings
+from typing import TYPE_CHECKING
 
-from pcpp.pcmd import CmdPreprocessor
-from tree_sitter import QueryCursor
-
+import cache
+import run
+import setup
 import utils
-from setup import PATH_BY_UNIT, SDL_ROOT
+from rules import group_bitflags
+from utils import QueryPool
 from visitor import VisitorBase, _Visitor
 
+if TYPE_CHECKING:
+    from cache import Cache
+
+    # imports pcpp, which is only needed when preprocessing
+    from preprocessor import Prelude
+
 
 def os_defines() -> list[str]:
     match sys.platform:
@@ -65,130 +75,261 @@ def os_defines() -> list[str]:
             return []
 
 
-def parse_file(*args, input: str, output: str):
+# Arguments passed to pcpp for every unit, on top of the platform defines.
+_PCPP_ARGS = [
+    # extern "C" confuses tree-sitter because of "unrelated" closing }
+    # + preprocessed output drops by ~100 lines so why not
+    "-U",
+    "__cplusplus",
+    "-D",
+    "SDL_MAIN_USE_CALLBACKS",  # test
+    "-D",
+    "SDLCALL=",  # tree-sitter has a hard time parsing __cdecl
+    "-D",
+    "SDL_RESTRICT=/* restrict */",  # just for docs
+    "-D",
+    "SDL_PRINTF_VARARG_FUNC(x)=",  # save us some time and headaches
+    "-D",
+    "SDL_PRINTF_VARARG_FUNCV(x)=",  # save us some time and headaches
+    "-D",
+    "SDL_PRINTF_FORMAT_STRING=",  # save us some time and headaches
+    "-D",
+    "SDL_THREAD_ANNOTATION_ATTRIBUTE__(x)=",  # save us some time and headaches
+    "-D",
+    "SDL_DECLSPEC=",  # save us some time and headaches
+    "-D",
+    "SDLMAIN_DECLSPEC=",  # save us some time and headaches
+    "-U",
+    "SDL_MAIN_EXPORTED",  # for now
+    "-U",
+    "SDL_PLATFORM_PRIVATE_MAIN",  # a good default
+    "-D",
+    "SDL_DEPRECATED=",  # save us some time and headaches
+    "-D",
+    "SDL_UNUSED=",  # save us some time and headaches
+    "-D",
+    "SDL_ASSERT_LEVEL=1",  # save us some time and headaches
+    "-D",
+    "SDL_NODISCARD=",  # save us some time and headaches
+    "-D",
+    "SDL_NORETURN=",  # save us some time and headaches
+    "-D",
+    "SDL_ANALYZER_NORETURN=",  # save us some time and headaches
+    "-D",
+    "SDL_HAS_BUILTIN(x)=0",  # save us some time and headaches
+    "-D",
+    "SDL_ALIGNED(x)=",  # save us some time and headaches; ~400 lines removed
+    "-D",
+    "SDL_MALLOC=",  # save us some time and headaches
+    "-D",
+    "SDL_ALLOC_SIZE=",  # save us some time and headaches
+    "-D",
+    "SDL_ALLOC_SIZE2=",  # save us some time and headaches
+    "-D",
+    "SDL_BYTEORDER=SDL_LIL_ENDIAN",  # save us some time and headaches
+    "-D",
+    "SDL_FLOATWORDORDER=SDL_LIL_ENDIAN",  # save us some time and headaches
+    "-D",
+    "SDL_SLOW_MEMCPY",  # save us some time and headaches
+    "-D",
+    "SDL_SLOW_MEMMOVE",  # save us some time and headaches
+    "-D",
+    "SDL_SLOW_MEMSET",  # save us some time and headaches
+    "-D",
+    "SDL_COMPILE_TIME_ASSERT",  # save us some time and headaches
+    "-D",
+    "SDL_AssertBreakpoint",  # save us some time and headaches
+    "-D",
+    "SDL_FALLTHROUGH=",  # save us some time and headaches
+    "-D",
+    "NULL=0",  # save us some time and headaches
+    "-D",
+    "SDL_INLINE=",  # save us some time and headaches
+    "-D",
+    "SDL_FORCE_INLINE=",  # save us some time and headaches
+    "-D",
+    "DOXYGEN_SHOULD_IGNORE_THIS",  # we are not interested anything doxygen doesn't want
+    "-U",
+    "SDL_WIKI_DOCUMENTATION_SECTION",  # this is never defined (we're not building the wiki)
+    "-D",
+    "SDL_BeginThreadFunction",
+    "-D",
+    "SDL_EndThreadFunction",
+    "-D",
+    "SDL_platform_defines_h_",  # save us some time and headaches
+    "-D",
+    "SDL_oldnames_h_",  # save us some time and headaches
+    "-D",
+    "SDL_stdinc_h_",  # save us some time and headaches
+    "-D",
+    "SDL_version_h_",  # save us some time and headaches
+    "-D",
+    "SDL_assert_h_",  # HACK, remove if we care about assertions eventually; this removes ~1300 lines from output
+    "-D",
+    "SDL_hidapi_h_",  # we don't care about this
+    # we are not including SDL_stdinc.h, but this is needed
+    # the cast to `int` is needed since this is used on enums
+    # and enums are considered `int` in C
+    "-D",
+    """SDL_FOURCC(A, B, C, D)=\
+    (int)((SDL_static_cast(Uint32, SDL_static_cast(Uint8, (A))) << 0) | \
+     (SDL_static_cast(Uint32, SDL_static_cast(Uint8, (B))) << 8) | \
+     (SDL_static_cast(Uint32, SDL_static_cast(Uint8, (C))) << 16) | \
+     (SDL_static_cast(Uint32, SDL_static_cast(Uint8, (D))) << 24))""",
+    "-D",
+    "SDL_static_cast(T, V)=((T)(V))",  # save us some time and headaches
+    # skip this as we need them to detect platform-specific code
+    "--passthru-defines",  # keep defines in output
+    "--passthru-unknown-exprs",  # NOTE: this keeps the ifdef/endif blocks
+    "--passthru-unfound-includes",  # skip missing includes
+    "--passthru-comments",  # keep comments in output
+    "--output-encoding",
+    "utf-8",  # output encoding
+    "--line-directive",
+    "",  # don't output line directives
+]
+
+
+def preprocess_file(
+    *args,
+    input: str,
+    output: str,
+    token_cache: str | None = None,
+    prelude: "Prelude | None" = None,
+    keep_comments: bool = False,
+) -> dict[str, str]:
+    """
+    Run pcpp over `input` and write the result to `output`. Returns the files read, with the hashes of their contents.
+    Kept separate from parsing so that it can run on a worker process.
+    `args` should include the platform defines (see `os_defines`).
+    If `token_cache` is set, the tokens of every header read are cached there (see `CachedPreprocessor`).
+    If `prelude` is set, the `-D`/`-U` of `_PCPP_ARGS` are taken from it instead of being parsed again.
+    Comments other than doc comments are dropped from the output (see `filter_comments`), unless `keep_comments` is set.
+    With the shared cache (see `cache.shared`), the output of an earlier run is reused if none of the files it read changed.
+    """
     os.makedirs(os.path.dirname(output), exist_ok=True)
 
-    _ = CmdPreprocessor(
+    shared = cache.shared()
+    if shared is not None:
+        head = _output_key(args, input, keep_comments)
+        cached = _cached_output(shared, head)
+        shared.flush()
+        if cached is not None:
+            data, sources = cached
+            with open(output, "wb") as f:
+                f.write(data)
+            return dict(sources)
+
+    # pcpp is only needed when the output isn't cached
+    from preprocessor import CachedPreprocessor, filter_comments, split_prelude
+
+    pcpp_args = _PCPP_ARGS if prelude is None else split_prelude(_PCPP_ARGS)[1]
+
+    pp = CachedPreprocessor(
+        token_cache=token_cache,
+        prelude=prelude,
         argv=[
             "<dummy-arg-doesnt-matter>",
             input,
             "-o",
             output,
             *args,
-            *os_defines(),
-            # extern "C" confuses tree-sitter because of "unrelated" closing }
-            # + preprocessed output drops by ~100 lines so why not
-            "-U",
-            "__cplusplus",
-            "-D",
-            "SDL_MAIN_USE_CALLBACKS",  # test
-            "-D",
-            "SDLCALL=",  # tree-sitter has a hard time parsing __cdecl
-            "-D",
-            "SDL_RESTRICT=/* restrict */",  # just for docs
-            "-D",
-            "SDL_PRINTF_VARARG_FUNC(x)=",  # save us some time and headaches
-            "-D",
-            "SDL_PRINTF_VARARG_FUNCV(x)=",  # save us some time and headaches
-            "-D",
-            "SDL_PRINTF_FORMAT_STRING=",  # save us some time and headaches
-            "-D",
-            "SDL_THREAD_ANNOTATION_ATTRIBUTE__(x)=",  # save us some time and headaches
-            "-D",
-            "SDL_DECLSPEC=",  # save us some time and headaches
-            "-D",
-            "SDLMAIN_DECLSPEC=",  # save us some time and headaches
-            "-U",
-            "SDL_MAIN_EXPORTED",  # for now
-            "-U",
-            "SDL_PLATFORM_PRIVATE_MAIN",  # a good default
-            "-D",
-            "SDL_DEPRECATED=",  # save us some time and headaches
-            "-D",
-            "SDL_UNUSED=",  # save us some time and headaches
-            "-D",
-            "SDL_ASSERT_LEVEL=1",  # save us some time and headaches
-            "-D",
-            "SDL_NODISCARD=",  # save us some time and headaches
-            "-D",
-            "SDL_NORETURN=",  # save us some time and headaches
-            "-D",
-            "SDL_ANALYZER_NORETURN=",  # save us some time and headaches
-            "-D",
-            "SDL_HAS_BUILTIN(x)=0",  # save us some time and headaches
-            "-D",
-            "SDL_ALIGNED(x)=",  # save us some time and headaches; ~400 lines removed
-            "-D",
-            "SDL_MALLOC=",  # save us some time and headaches
-            "-D",
-            "SDL_ALLOC_SIZE=",  # save us some time and headaches
-            "-D",
-            "SDL_ALLOC_SIZE2=",  # save us some time and headaches
-            "-D",
-            "SDL_BYTEORDER=SDL_LIL_ENDIAN",  # save us some time and headaches
-            "-D",
-            "SDL_FLOATWORDORDER=SDL_LIL_ENDIAN",  # save us some time and headaches
-            "-D",
-            "SDL_SLOW_MEMCPY",  # save us some time and headaches
-            "-D",
-            "SDL_SLOW_MEMMOVE",  # save us some time and headaches
-            "-D",
-            "SDL_SLOW_MEMSET",  # save us some time and headaches
-            "-D",
-            "SDL_COMPILE_TIME_ASSERT",  # save us some time and headaches
-            "-D",
-            "SDL_AssertBreakpoint",  # save us some time and headaches
-            "-D",
-            "SDL_FALLTHROUGH=",  # save us some time and headaches
-            "-D",
-            "NULL=0",  # save us some time and headaches
-            "-D",
-            "SDL_INLINE=",  # save us some time and headaches
-            "-D",
-            "SDL_FORCE_INLINE=",  # save us some time and headaches
-            "-D",
-            "DOXYGEN_SHOULD_IGNORE_THIS",  # we are not interested anything doxygen doesn't want
-            "-U",
-            "SDL_WIKI_DOCUMENTATION_SECTION",  # this is never defined (we're not building the wiki)
-            "-D",
-            "SDL_BeginThreadFunction",
-            "-D",
-            "SDL_EndThreadFunction",
-            "-D",
-            "SDL_platform_defines_h_",  # save us some time and headaches
-            "-D",
-            "SDL_oldnames_h_",  # save us some time and headaches
-            "-D",
-            "SDL_stdinc_h_",  # save us some time and headaches
-            "-D",
-            "SDL_version_h_",  # save us some time and headaches
-            "-D",
-            "SDL_assert_h_",  # HACK, remove if we care about assertions eventually; this removes ~1300 lines from output
-            "-D",
-            "SDL_hidapi_h_",  # we don't care about this
-            # we are not including SDL_stdinc.h, but this is needed
-            # the cast to `int` is needed since this is used on enums
-            # and enums are considered `int` in C
-            "-D",
-            """SDL_FOURCC(A, B, C, D)=\
-    (int)((SDL_static_cast(Uint32, SDL_static_cast(Uint8, (A))) << 0) | \
-     (SDL_static_cast(Uint32, SDL_static_cast(Uint8, (B))) << 8) | \
-     (SDL_static_cast(Uint32, SDL_static_cast(Uint8, (C))) << 16) | \
-     (SDL_static_cast(Uint32, SDL_static_cast(Uint8, (D))) << 24))""",
-            "-D",
-            "SDL_static_cast(T, V)=((T)(V))",  # save us some time and headaches
-            # skip this as we need them to detect platform-specific code
-            "--passthru-defines",  # keep defines in output
-            "--passthru-unknown-exprs",  # NOTE: this keeps the ifdef/endif blocks
-            "--passthru-unfound-includes",  # skip missing includes
-            "--passthru-comments",  # keep comments in output
-            "--output-encoding",
-            "utf-8",  # output encoding
-            "--line-directive",
-            "",  # don't output line directives
-        ]
+            *pcpp_args,
+        ],
     )
 
+    if not keep_comments:
+        # only the doc comments are used by the generators, so don't make tree-sitter parse the others
+        with open(output, "r", encoding="utf-8") as f:
+            text = f.read()
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(filter_comments(text))
+
+    if shared is not None:
+        with open(output, "rb") as f:
+            data = f.read()
+        _cache_output(shared, head, pp.sources, data)
+        shared.flush()
+
+    return pp.sources
+
+
+# bump when the outputs kept in the shared cache change for the same inputs
+_OUTPUT_FORMAT = 1
+
+
+def _output_key(args: tuple[str, ...], input: str, keep_comments: bool) -> str:
+    """
+    Key of what `preprocess_file` outputs for these arguments, whatever the contents of the headers.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        pcpp = version("pcpp")
+    except PackageNotFoundError:
+        pcpp = "?"
+
+    key = [str(_OUTPUT_FORMAT), pcpp, os.path.abspath(input), *args, *_PCPP_ARGS]
+    key.append("comments" if keep_comments else "")
+    return hashlib.sha1("\0".join(key).encode()).hexdigest()
+
+
+def _sources_key(head: str, sources: list[tuple[str, str]]) -> str:
+    key = hashlib.sha1(head.encode())
+    for path, digest in sources:
+        key.update(f"\0{path}\0{digest}".encode())
+    return key.hexdigest()
+
+
+def _current_sources(sources: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """
+    Hash the files of `sources` again, as `(path, digest)` in the same order.
+    """
+    current = []
+    for path, _ in sources:
+        try:
+            current.append((path, cache.file_digest(path)))
+        except OSError:
+            current.append((path, ""))  # removed, so the output can't be the same
+    return current
+
+
+def _cached_output(
+    shared: "Cache", head: str
+) -> tuple[bytes, list[tuple[str, str]]] | None:
+    """
+    Get the output of `preprocess_file` (and the files it read) from the shared cache if none of them changed since.
+    The files read (and their hashes) are kept in the `deps` entry of `head`, like ccache's manifests.
+    Only the lookup of the output itself counts in the stats.
+    """
+    data = shared.get("deps", head, count=False)
+    try:
+        sources = marshal.loads(data) if data is not None else None
+    except (EOFError, ValueError, TypeError):
+        sources = None
+
+    if sources is None:
+        shared.record("pp", False)
+        return None
+
+    current = _current_sources(sources)
+    data = shared.get("pp", _sources_key(head, current))
+    return (data, current) if data is not None else None
+
+
+def _cache_output(shared: "Cache", head: str, sources: dict[str, str], data: bytes):
+    sources = sorted(sources.items())
+    shared.put("pp", _sources_key(head, sources), data)
+    # the files read change with the headers, so this entry does too
+    shared.put("deps", head, marshal.dumps(sources), replace=True)
+
+
+def parse_file(*args, input: str, output: str, **kwargs):
+    preprocess_file(*args, input=input, output=output, **kwargs)
+    return parse_preprocessed(output)
+
+
+def parse_preprocessed(output: str):
     with open(output, "r") as f:
         infile = f.read()
 
@@ -197,68 +338,396 @@ def parse_file(*args, input: str, output: str):
     return tree
 
 
-def parse_query(file: str):
-    with open(file, "r") as f:
-        query_txt = f.read()
+_QUERIES: dict[str, QueryPool] = {}
+# guards `_QUERIES` and `_PRELUDE`, as runs can be started from several threads (see `api.generate`)
+_LOCK = threading.Lock()
+
+
+def parse_query(file: str) -> QueryPool:
+    # compiling the query is not cheap, so keep it around for the next runs
+    # each thread matches with its own cursor, see `utils.QueryPool`
+    with _LOCK:
+        if file in _QUERIES:
+            return _QUERIES[file]
+
+        with open(file, "r") as f:
+            query_txt = f.read()
+
+        query = utils.query(query_txt)
+        _QUERIES[file] = query
+        return query
+
+
+_PRELUDE = None
+
+
+def _prelude(ctx: run.RunContext) -> "Prelude":
+    # the macros of `_PCPP_ARGS` are the same for every unit, so they are only defined once per process,
+    # or loaded from a previous run
+    global _PRELUDE
 
-    query = utils.query(query_txt)
-    return query
+    with _LOCK:
+        if _PRELUDE is None:
+            from preprocessor import load_prelude, split_prelude
 
+            _PRELUDE = load_prelude(split_prelude(_PCPP_ARGS)[0], _token_cache(ctx))
 
-def parse_main(gen: str, query: QueryCursor, visitor: type[VisitorBase]):
+        return _PRELUDE
+
+
+def _os_args(ctx: run.RunContext) -> list[str]:
+    # with `--platforms`, the OS macros are left undefined so pcpp keeps their `#if` blocks
+    return [] if ctx.platforms else os_defines()
+
+
+def _make_visitor(visitor: type[VisitorBase], unit: str, **kwargs):
+    if not run.current().platforms:
+        return _Visitor(visitor, unit, **kwargs)
+
+    from platforms import _MatrixVisitor
+
+    return _MatrixVisitor(visitor, unit, **kwargs)
+
+
+def _token_cache(ctx: run.RunContext) -> str:
+    # tokens don't depend on the generator nor the defines, so all the runs share them
+    return f"{ctx.work_dir}/tokens"
+
+
+_INCLUDE_REGEX = re.compile(r"^[ \t]*#[ \t]*include[ \t]*[<\"]([^>\"]+)[>\"]", re.M)
+_GUARD_REGEX = re.compile(
+    r"^[ \t]*#[ \t]*ifndef[ \t]+(\w+)\s*#[ \t]*define[ \t]+\1\b", re.M
+)
+
+
+def _sub_headers(main: str) -> list[tuple[str, str]]:
+    """
+    List the `(path, include guard)` of every header included by `main`, in include order.
+    Headers without an include guard (eg. `SDL_begin_code.h`) are not units of their own.
+    """
+    with open(main, "r") as f:
+        text = f.read()
+
+    sdl_root = run.current().sdl_root
+    main_dir = os.path.dirname(main)
+    headers = []
+
+    for inc in _INCLUDE_REGEX.findall(text):
+        for path in (f"{sdl_root}/{inc}", f"{main_dir}/{inc}"):
+            if os.path.exists(path):
+                break
+        else:
+            continue  # not an SDL header (eg. <stdarg.h>)
+
+        with open(path, "r") as f:
+            guard = _GUARD_REGEX.search(f.read())
+
+        # headers whose guard is predefined in `_PCPP_ARGS` would come out empty
+        if guard is None or guard[1] in _PCPP_ARGS:
+            continue
+
+        if (path, guard[1]) not in headers:
+            headers.append((path, guard[1]))
+
+    return headers
+
+
+def _preprocess_unit(
+    args: list[str],
+    input: str,
+    output: str,
+    token_cache: str | None,
+    prelude: "Prelude",
+) -> str:
+    # like the `deps` entries of the shared cache, `<output>.deps` lists every file pcpp read (eg. `SDL_begin_code.h`)
+    # with its hash, under the key of the arguments, so touching one sub-header only re-runs pcpp for the sub-headers
+    # including it
+    head = _output_key(args, input, False)
+    deps = f"{output}.deps"
+
+    try:
+        with open(deps, "rb") as f:
+            key, sources = marshal.load(f)
+        if (
+            key == head
+            and os.path.exists(output)
+            and _current_sources(sources) == sources
+        ):
+            return output
+    except (OSError, EOFError, ValueError, TypeError):
+        pass  # missing or unreadable, so preprocess again
+
+    sources = preprocess_file(
+        *args, input=input, output=output, token_cache=token_cache, prelude=prelude
+    )
+
+    with open(deps, "wb") as f:
+        marshal.dump((head, sorted(sources.items())), f)
+
+    return output
+
+
+def parse_main_split(
+    gen: str,
+    query: QueryPool,
+    visitor: type[VisitorBase],
+    *,
+    jobs: int | None,
+    **kwargs,
+):
+    """
+    Same as `parse_main`, but each header included by `SDL.h` is preprocessed and parsed
+    as a unit of its own. The include guards of all the other headers are predefined,
+    so every declaration ends up in the unit of the header that declares it.
+    Units are preprocessed in parallel, then visited in the original include order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    ctx = run.current()
+    pp = f"{ctx.work_dir}/{gen}/pp"
+
+    headers = _sub_headers(f"{ctx.sdl_root}/{ctx.path_by_unit['SDL']}")
+    guards = [guard for _, guard in headers]
+
+    # the generator may open its output before the first unit is done
+    os.makedirs(f"{pp}/SDL", exist_ok=True)
+
+    # sent to each worker instead of having them parse the defines again
+    prelude = _prelude(ctx)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        outputs = [
+            pool.submit(
+                _preprocess_unit,
+                [
+                    "-I",
+                    ctx.sdl_root,
+                    *_os_args(ctx),
+                    *(arg for g in guards if g != guard for arg in ("-D", g)),
+                ],
+                path,
+                f"{pp}/SDL/{os.path.basename(path)[:-2]}.i",
+                _token_cache(ctx),
+                prelude,
+            )
+            for path, guard in headers
+        ]
+
+        vis = _make_visitor(visitor, "SDL", **kwargs)
+
+        for (path, _), output in zip(headers, outputs):
+            tree = parse_preprocessed(output.result())
+
+            vis.start_header(os.path.basename(path))
+            for _, rules in group_bitflags(
+                tree.root_node, query.matches(tree.root_node)
+            ):
+                vis.visit(rules)
+            vis.end_header()
+
+        vis.finish()
+
+
+def parse_main(gen: str, query: QueryPool, visitor: type[VisitorBase], **kwargs):
+    ctx = run.current()
     tree = parse_file(
         "-I",
-        SDL_ROOT,
-        input=f"{SDL_ROOT}/{PATH_BY_UNIT['SDL']}",
-        output=f"out/{gen}/pp/SDL.i",
+        ctx.sdl_root,
+        *_os_args(ctx),
+        input=f"{ctx.sdl_root}/{ctx.path_by_unit['SDL']}",
+        output=f"{ctx.work_dir}/{gen}/pp/SDL.i",
+        token_cache=_token_cache(ctx),
+        prelude=_prelude(ctx),
     )
     root = tree.root_node
 
-    vis = _Visitor(visitor, "SDL")
+    vis = _make_visitor(visitor, "SDL", **kwargs)
 
-    for _, rules in query.matches(root):
+    for _, rules in group_bitflags(root, query.matches(root)):
         vis.visit(rules)
+    vis.finish()
 
 
-def parse_extension(gen: str, ext: str, query: QueryCursor, visitor: type[VisitorBase]):
+def parse_extension(
+    gen: str, ext: str, query: QueryPool, visitor: type[VisitorBase], **kwargs
+):
+    ctx = run.current()
     sdl_ext = f"SDL_{ext}"
     tree = parse_file(
-        input=f"{SDL_ROOT}/{PATH_BY_UNIT[sdl_ext]}",
-        output=f"out/{gen}/pp/{sdl_ext}.i",
+        *_os_args(ctx),
+        input=f"{ctx.sdl_root}/{ctx.path_by_unit[sdl_ext]}",
+        output=f"{ctx.work_dir}/{gen}/pp/{sdl_ext}.i",
+        token_cache=_token_cache(ctx),
+        prelude=_prelude(ctx),
     )
 
     root = tree.root_node
 
-    vis = _Visitor(visitor, ext)
+    vis = _make_visitor(visitor, ext, **kwargs)
 
-    for i, rules in query.matches(root):
+    for i, rules in group_bitflags(root, query.matches(root)):
         vis.visit(rules)
+    vis.finish()
+
 
+def _parse_args(args: list[str]) -> dict[str, str | bool]:
+    """
+    Turn `--some-arg=value` into `{"some_arg": "value"}`. Flags without a value are `True`.
+    """
+    parsed = {}
 
-def codegen(mod_name: str):
+    for arg in args:
+        if not arg.startswith("--"):
+            print(
+                f"Unexpected argument {arg}. Arguments should be of the form `--name=value`."
+            )
+            sys.exit(1)
+
+        name, eq, value = arg[2:].partition("=")
+        parsed[name.replace("-", "_")] = value if eq else True
+
+    return parsed
+
+
+def generate(
+    mod_name: str,
+    *,
+    sdl_root: str,
+    path_by_unit: dict[str, str],
+    sink: run.Sink,
+    work_dir: str = "out",
+    split_units: bool = False,
+    jobs: int | None = None,
+    platforms: list[str] | None = None,
+    engine: str = "query",
+    pipeline: bool = False,
+    **kwargs,
+):
+    """
+    Run generator `mod_name` over every unit in `path_by_unit`, handing the generated files to `sink`.
+    If `platforms` is given, the headers are preprocessed once and one output is generated per platform,
+    in `<gen>/<platform>/` (see `platforms.PLATFORMS`).
+    `engine` picks how declarations are found: `query` runs `query.scm`, `cursor` uses `classify.CursorEngine`.
+    If `pipeline` is set, the units go through `pipeline.parse_pipelined` and the returned `pipeline.Summary`
+    tells how busy each stage was. Otherwise `None` is returned.
+    `kwargs` are passed to the generator's constructor.
+    """
     mod = importlib.import_module(mod_name)
     assert mod is not None
     gen = mod.__name__[mod.__name__.find(".") + 1 :]
 
-    _vis = [mem for mem in inspect.getmembers(mod) if mem[0] == "Visitor"]
-    if not _vis:
-        print("Module does not contain a class named `Visitor`")
-        sys.exit(1)
+    visitor = getattr(mod, "Visitor", None)
+    if not isinstance(visitor, type):
+        raise run.UsageError(
+            f"Module {mod_name} does not contain a class named `Visitor`"
+        )
 
-    visitor = getattr(mod, _vis[0][0])
-    query = parse_query("query.scm")
+    if platforms:
+        from platforms import PLATFORMS
 
-    parse_main(gen, query, visitor)
+        for platform in platforms:
+            if platform not in PLATFORMS:
+                raise run.UsageError(
+                    f"Unknown platform {platform}. Expected one of {list(PLATFORMS)}."
+                )
 
-    for ext in PATH_BY_UNIT.keys():
-        if ext == "SDL":
-            continue
-        parse_extension(gen, ext[4:], query, visitor)
+    match engine:
+        case "query":
+            query = parse_query(os.path.join(os.path.dirname(__file__), "query.scm"))
+        case "cursor":
+            from classify import CursorEngine
+
+            query = CursorEngine()
+        case _:
+            raise run.UsageError(
+                f"Unknown engine {engine}. Expected one of ['query', 'cursor']."
+            )
+
+    ctx = run.RunContext(
+        sdl_root, path_by_unit, sink, work_dir, platforms=list(platforms or [])
+    )
+    summary = None
+    with run.running(ctx):
+        if pipeline:
+            from pipeline import parse_pipelined
 
-    # copy any file from the gen folder to the out folder
-    if os.path.exists(f"gen/{gen}/"):
-        for file in os.listdir(f"gen/{gen}/"):
-            if os.path.exists(f"out/{gen}/{file}"):
-                os.remove(f"out/{gen}/{file}")
+            summary = parse_pipelined(
+                gen, query, visitor, split_units=split_units, jobs=jobs, **kwargs
+            )
+        elif "SDL" in path_by_unit:
+            if split_units:
+                parse_main_split(gen, query, visitor, jobs=jobs, **kwargs)
+            else:
+                parse_main(gen, query, visitor, **kwargs)
+
+        if not pipeline:
+            for ext in path_by_unit.keys():
+                if ext == "SDL":
+                    continue
+                parse_extension(gen, ext[4:], query, visitor, **kwargs)
+
+    # hand any file from the gen folder to the sink too, once per platform
+    files = os.path.join(os.path.dirname(mod.__file__), gen)
+    if os.path.isdir(files):
+        for file in os.listdir(files):
+            with open(os.path.join(files, file), "rb") as f:
+                data = f.read()
+            for folder in [f"{gen}/{p}" for p in ctx.platforms] or [gen]:
+                sink.write(f"{folder}/{file}", data)
+
+    return summary
+
+
+def codegen(mod_name: str, *args: str):
+    """
+    Run generator `mod_name` over every unit in `setup.PATH_BY_UNIT`, writing the results to `out/<gen>/`.
+
+    `args` are command line arguments of the form `--name=value`. The following are used by the parser itself,
+    anything else is passed to the generator's constructor:
+        --split-units: parse each header included by `SDL.h` as its own unit (see `parse_main_split`).
+        --jobs=N: number of processes used by `--split-units` and `--pipeline`. Defaults to the number of CPUs.
+        --platforms[=windows,linux,...]: generate for each of the given platforms (all of them if no value)
+            from a single preprocessing pass, writing to `out/<gen>/<platform>/`.
+        --engine=query|cursor: how declarations are found, see `generate`. Defaults to `query`.
+        --pipeline: preprocess the next units while the current one is visited (see `pipeline.parse_pipelined`),
+            then print how busy each stage was.
+    """
+    kwargs = _parse_args(list(args))
+    split_units = kwargs.pop("split_units", False)
+    jobs = kwargs.pop("jobs", None)
+    platforms = kwargs.pop("platforms", None)
+    engine = kwargs.pop("engine", "query")
+    pipeline = kwargs.pop("pipeline", False)
+
+    if platforms is True:
+        from platforms import PLATFORMS
+
+        platforms = list(PLATFORMS)
+    elif platforms:
+        platforms = platforms.split(",")
+
+    try:
+        setup.validate(setup.SDL_ROOT, setup.PATH_BY_UNIT)
+    except ValueError as e:
+        print(f"Error: {e} Please edit setup.py.")
+        sys.exit(1)
+
+    try:
+        summary = generate(
+            mod_name,
+            sdl_root=setup.SDL_ROOT,
+            path_by_unit=setup.PATH_BY_UNIT,
+            sink=run.FileSink("out"),
+            split_units=split_units,
+            jobs=jobs and int(jobs),
+            platforms=platforms,
+            engine=engine,
+            pipeline=pipeline,
+            **kwargs,
+        )
+    except run.UsageError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
-            shutil.copy(f"gen/{gen}/{file}", f"out/{gen}/{file}")
+    if summary is not None:
+        print(summary)
@@ -0,0 +1,82 @@
+from typing import Any
+
+import run
+import setup
+from _codegen_module_impl import generate as _generate
+from run import FileSink, MemorySink, Sink, UsageError
+
+__all__ = ["generate", "Sink", "FileSink", "MemorySink", "UsageError"]
+
+
+def generate(
+    generator: str,
+    *,
+    units: dict[str, str],
+    sdl_root: str,
+    options: dict[str, Any] | None = None,
+    sink: Sink | None = None,
+    work_dir: str = "out",
+    split_units: bool = False,
+    jobs: int | None = None,
+    platforms: list[str] | None = None,
+    engine: str = "query",
+    pipeline: bool = False,
+) -> dict[str, str | bytes]:
+    """
+    Run a generator in-process, without going through `sdl_parser.py` or `setup.py`.
+    The parser and the query are loaded once and reused by the following calls.
+    Runs can be started from several threads at once, each thread parsing and matching with its own
+    parser and query cursor (see `utils.QueryPool`), and each run keeping its own generator state.
+
+    Usage example:
+    ```py
+    files = api.generate(
+        "gen.cpp",
+        units={"SDL": "SDL3/SDL.h"},
+        sdl_root="./include",
+        options={"module": "sdl"},
+    )
+    print(files["cpp/SDL.g.cppm"])
+    ```
+
+    Args:
+        generator (str): The generator module (eg. `gen.cpp`).
+        units (dict[str, str]): Header of each unit to parse, relative to `sdl_root`, like `setup.PATH_BY_UNIT`.
+        sdl_root (str): Directory containing the SDL headers, like `setup.SDL_ROOT`.
+        options (dict[str, Any], optional): Arguments of the generator's constructor (eg. `{"shard": True}`).
+        sink (Sink, optional): Where to write the generated files. Defaults to keeping them in memory.
+        work_dir (str, optional): Where to keep intermediate files (preprocessed headers). Defaults to "out".
+        split_units (bool, optional): Same as `--split-units`. Defaults to False.
+        jobs (int, optional): Same as `--jobs`. Defaults to the number of CPUs.
+        platforms (list[str], optional): Same as `--platforms`, eg. `["windows", "linux"]`.
+            The files of each platform are put under `<gen>/<platform>/`. Defaults to the host only.
+        engine (str, optional): Same as `--engine`, `query` (the default) or `cursor`.
+        pipeline (bool, optional): Same as `--pipeline`, without printing the summary. Defaults to False.
+
+    Returns:
+        dict[str, str | bytes]: The generated files by path (eg. `cpp/SDL.g.cppm`) if no `sink` was given,
+            an empty dict otherwise.
+
+    Raises:
+        ValueError: If a unit is unknown or its header doesn't exist. `UsageError` (a `ValueError`) if a platform,
+            the engine or a generator option is unknown, or if the generator has no `Visitor`.
+    """
+    setup.validate(sdl_root, units)
+
+    memory = MemorySink() if sink is None else None
+
+    _generate(
+        generator,
+        sdl_root=sdl_root,
+        path_by_unit=units,
+        sink=memory or sink,
+        work_dir=work_dir,
+        split_units=split_units,
+        jobs=jobs,
+        platforms=platforms,
+        engine=engine,
+        pipeline=pipeline,
+        **(options or {}),
+    )
+
+    return memory.files if memory is not None else {}
@@ -0,0 +1,146 @@
+"""
+Check that `classify.CursorEngine` gives the same matches as `query.scm`, and compare how long each takes.
+The headers of `setup.py` are checked (if any), as well as a few snippets covering the corner cases of the query.
+
+Usage (from the root of the project):
+    python bench/classify.py [--runs=N]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+import setup
+import utils
+from _codegen_module_impl import os_defines, parse_query, preprocess_file
+from classify import CursorEngine
+
+_SNIPPETS = {
+    "bitflag": "typedef Uint32 F;\n#define A 1\n#define M(x) x\n#define B_PROP_X 2\nint x;\n#define C 3\n",
+    "bitflag-break": "typedef Uint32 F;\n#define A 1\n/* c */\n#define B 2\n#define E\n#define C 3\n",
+    "bitflag-fn-macro-only": "typedef Uint32 F;\n#define M(x) x\nint y;\n",
+    "bitflag-many": "typedef Uint32 F, G;\n#define A 1\ntypedef unsigned int H;\n#define B 1",
+    "bitflag-nested": "#ifdef X\ntypedef Uint32 F;\n#define A 1\n#endif\n#define B 2\n",
+    "declarators": "typedef struct X X, *PX;\nextern int a(void), *b(int);\nextern char **c(void);\ntypedef Uint32 *P;\n",
+    "callbacks": "typedef void (*cb)(int);\ntypedef int *(*cb2)(int);\ntypedef void (**cb3)(void);\n",
+    "conditions": "#if A\n#elif B\nextern int f(void);\n#else\nextern int g(void);\n#endif\n#ifndef C\n#define D 1\n#endif\n",
+    "bodies": "typedef enum E { A,\n#if defined(X)\n B,\n#endif\n} E;\ntypedef struct S { int a;\n#ifdef Y\n int b;\n#endif\n} S, *PS;\ntypedef union U { int a; } U;\n",
+}
+
+
+def _synthetic(count: int = 3000) -> str:
+    """
+    A large SDL-like header, to see how both engines scale.
+    """
+    parts = []
+    for i in range(count):
+        parts.append(
+            f"/**\n * Doc {i}.\n */\nextern int SDL_F{i}(SDL_Window *w, const char *s, int n);\n"
+        )
+        if i % 10 == 0:
+            parts.append(
+                f"typedef Uint32 SDL_Flags{i};\n#define SDL_FLAG{i}_A 0x1u\n#define SDL_FLAG{i}_B 0x2u\n"
+            )
+            parts.append(
+                f"typedef struct SDL_S{i} {{ int a; float b; char c[4]; }} SDL_S{i};\n"
+            )
+            parts.append(
+                f"typedef enum SDL_E{i} {{ SDL_E{i}_A, SDL_E{i}_B = 4 }} SDL_E{i};\n"
+            )
+            parts.append(
+                f'#define SDL_PROP_X{i}_STRING "x"\n#ifdef SDL_PLATFORM_WINDOWS\nextern void *SDL_W{i}(void);\n#endif\n'
+            )
+    return "".join(parts)
+
+
+def _key(matches) -> list:
+    return [
+        (i, {k: [(n.type, n.start_byte, n.end_byte) for n in v] for k, v in c.items()})
+        for i, c in matches
+    ]
+
+
+def _time(fn, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def _sources() -> dict[str, bytes]:
+    sources = {name: text.encode() for name, text in _SNIPPETS.items()}
+    sources["synthetic"] = _synthetic().encode()
+
+    try:
+        setup.validate(setup.SDL_ROOT, setup.PATH_BY_UNIT)
+    except ValueError as e:
+        print(f"Skipping the units of setup.py: {e}\n")
+        return sources
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for unit, path in setup.PATH_BY_UNIT.items():
+            output = os.path.join(tmp, f"{unit}.i")
+            preprocess_file(
+                "-I",
+                setup.SDL_ROOT,
+                *os_defines(),
+                input=os.path.join(setup.SDL_ROOT, path),
+                output=output,
+            )
+            with open(output, "rb") as f:
+                sources[unit] = f.read()
+
+    return sources
+
+
+def main():
+    runs = 20
+    for arg in sys.argv[1:]:
+        if arg.startswith("--runs="):
+            runs = int(arg[len("--runs=") :])
+
+    query = parse_query(os.path.join(_ROOT, "query.scm"))
+    engine = CursorEngine()
+    parser = utils.parser()
+
+    failed = False
+    print(
+        f"{'source':<24} {'matches':>8} {'parity':>8} {'query (ms)':>12} {'cursor (ms)':>12}"
+    )
+
+    for name, text in _sources().items():
+        root = parser.parse(text).root_node
+        expected = _key(query.matches(root))
+        got = _key(engine.matches(root))
+
+        same = expected == got
+        failed |= not same
+
+        q = _time(lambda: query.matches(root), runs)
+        c = _time(lambda: engine.matches(root), runs)
+        print(
+            f"{name:<24} {len(expected):>8} {'ok' if same else 'FAIL':>8} {q:>12.3f} {c:>12.3f}"
+        )
+
+        if not same:
+            for i, (e, g) in enumerate(
+                zip(expected + [None] * len(got), got + [None] * len(expected))
+            ):
+                if e != g:
+                    print(
+                        f"  first difference at match {i}:\n    query:  {e}\n    cursor: {g}"
+                    )
+                    break
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
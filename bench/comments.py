@@ -0,0 +1,100 @@
+"""
+Measure what filtering the comments out of the preprocessed headers saves tree-sitter,
+for the units in `setup.py` (eg. SDL3).
+
+Usage (from the root of the project):
+    python bench/comments.py [--runs=N]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import setup
+import utils
+from _codegen_module_impl import os_defines, preprocess_file
+
+
+def _count_nodes(tree) -> int:
+    count = 0
+    cursor = tree.walk()
+
+    while True:
+        count += 1
+        if cursor.goto_first_child() or cursor.goto_next_sibling():
+            continue
+
+        while cursor.goto_parent():
+            if cursor.goto_next_sibling():
+                break
+        else:
+            return count
+
+
+def _parse_time(text: bytes, runs: int) -> float:
+    """
+    Median time to parse `text`, in milliseconds.
+    """
+    parser = utils.parser()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        parser.parse(text)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def _measure(unit: str, path: str, runs: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+
+        for keep_comments in (True, False):
+            output = os.path.join(tmp, f"{unit}.{int(keep_comments)}.i")
+            preprocess_file(
+                "-I",
+                setup.SDL_ROOT,
+                *os_defines(),
+                input=os.path.join(setup.SDL_ROOT, path),
+                output=output,
+                keep_comments=keep_comments,
+            )
+
+            with open(output, "rb") as f:
+                text = f.read()
+
+            nodes = _count_nodes(utils.parser().parse(text))
+            results.append((len(text), nodes, _parse_time(text, runs)))
+
+    print(unit)
+    print(f"  {'':<10} {'bytes':>10} {'nodes':>10} {'parse (ms)':>12}")
+    for label, (size, nodes, ms) in zip(("all", "doc only"), results):
+        print(f"  {label:<10} {size:>10} {nodes:>10} {ms:>12.2f}")
+
+    (size0, nodes0, ms0), (size1, nodes1, ms1) = results
+    print(
+        f"  {'saved':<10} {1 - size1 / size0:>10.1%} {1 - nodes1 / nodes0:>10.1%} {1 - ms1 / ms0:>12.1%}"
+    )
+
+
+def main():
+    runs = 10
+    for arg in sys.argv[1:]:
+        if arg.startswith("--runs="):
+            runs = int(arg[len("--runs=") :])
+
+    try:
+        setup.validate(setup.SDL_ROOT, setup.PATH_BY_UNIT)
+    except ValueError as e:
+        print(f"Error: {e} Please edit setup.py.")
+        sys.exit(1)
+
+    for unit, path in setup.PATH_BY_UNIT.items():
+        _measure(unit, path, runs)
+
+
+if __name__ == "__main__":
+    main()
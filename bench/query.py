@@ -0,0 +1,211 @@
+"""
+Profile each pattern of `query.scm` on its own: how many matches and captures it gives, how long it takes,
+and whether `QueryCursor` hit its match limit (`did_exceed_match_limit`), which means matches were dropped.
+Patterns are sorted by time, slowest first, so a pathological pattern shows up at the top.
+The headers of `setup.py` are profiled (if any), as well as a large synthetic header and a long run of flags.
+
+Usage (from the root of the project):
+    python bench/query.py [--runs=N] [--query=path/to/query.scm] [--match-limit=N] [--sort=time|matches|captures|pattern]
+
+To profile a change to the query before making it, pass the edited copy with `--query=...`.
+"""
+
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+from tree_sitter import Query, QueryCursor
+
+import setup
+import utils
+from _codegen_module_impl import os_defines, preprocess_file
+from rules import _ROOTS
+
+_CAPTURE_REGEX = re.compile(r"@([\w.]+)")
+
+
+@dataclass
+class _Profile:
+    pattern: int
+    label: str
+    matches: int
+    captures: int
+    # median, in milliseconds
+    time: float
+    exceeded: bool
+
+
+def _synthetic(count: int = 3000) -> str:
+    """
+    A large SDL-like header, with every kind of declaration the query looks for.
+    """
+    parts = []
+    for i in range(count):
+        parts.append(
+            f"/**\n * Doc {i}.\n */\nextern int SDL_F{i}(SDL_Window *w, const char *s, int n);\n"
+        )
+        if i % 10 == 0:
+            parts.append(
+                f"typedef Uint32 SDL_Flags{i};\n#define SDL_FLAG{i}_A 0x1u\n#define SDL_FLAG{i}_B 0x2u\n"
+            )
+            parts.append(
+                f"typedef struct SDL_S{i} {{ int a; float b; char c[4]; }} SDL_S{i};\n"
+            )
+            parts.append(
+                f"typedef enum SDL_E{i} {{ SDL_E{i}_A, SDL_E{i}_B = 4 }} SDL_E{i};\n"
+            )
+            parts.append(
+                f'#define SDL_PROP_X{i}_STRING "x"\n#ifdef SDL_PLATFORM_WINDOWS\nextern void *SDL_W{i}(void);\n#endif\n'
+            )
+    return "".join(parts)
+
+
+def _flags(count: int = 2000) -> str:
+    """
+    One `typedef` followed by a long run of `#define`s, the worst case of quantified sibling patterns.
+    """
+    defines = "".join(f"#define SDL_FLAG_{i} 0x{i:x}u\n" for i in range(count))
+    return f"typedef Uint32 SDL_Flags;\n{defines}"
+
+
+def _sources() -> dict[str, bytes]:
+    sources = {"synthetic": _synthetic().encode(), "flags": _flags().encode()}
+
+    try:
+        setup.validate(setup.SDL_ROOT, setup.PATH_BY_UNIT)
+    except ValueError as e:
+        print(f"Skipping the units of setup.py: {e}\n")
+        return sources
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for unit, path in setup.PATH_BY_UNIT.items():
+            output = os.path.join(tmp, f"{unit}.i")
+            preprocess_file(
+                "-I",
+                setup.SDL_ROOT,
+                *os_defines(),
+                input=os.path.join(setup.SDL_ROOT, path),
+                output=output,
+            )
+            with open(output, "rb") as f:
+                sources[unit] = f.read()
+
+    return sources
+
+
+def _label(text: str, query: Query, pattern: int) -> str:
+    """
+    The root captures of a pattern (eg. `function` or `enum/struct/union`), and the line it starts at.
+    """
+    start = query.start_byte_for_pattern(pattern)
+    source = text.encode()[start : query.end_byte_for_pattern(pattern)].decode()
+    line = text.encode()[:start].count(b"\n") + 1
+
+    names = []
+    for name in _CAPTURE_REGEX.findall(source):
+        if name in _ROOTS and name not in names:
+            names.append(name)
+
+    return f"{'/'.join(names) or '?'} (line {line})"
+
+
+def _isolated(text: str, pattern: int) -> Query:
+    # `disable_pattern` can't be undone, so each pattern gets a query of its own
+    query = Query(utils.language(), text)
+    for other in range(query.pattern_count):
+        if other != pattern:
+            query.disable_pattern(other)
+    return query
+
+
+def _profile(
+    query: Query, root, runs: int, match_limit: int | None
+) -> tuple[int, int, float, bool]:
+    cursor = (
+        QueryCursor(query)
+        if match_limit is None
+        else QueryCursor(query, match_limit=match_limit)
+    )
+
+    matches = cursor.matches(root)
+    exceeded = cursor.did_exceed_match_limit
+    captures = sum(len(nodes) for _, match in matches for nodes in match.values())
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor.matches(root)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return len(matches), captures, statistics.median(times), exceeded
+
+
+def main():
+    runs = 20
+    file = os.path.join(_ROOT, "query.scm")
+    match_limit = None
+    sort = "time"
+
+    for arg in sys.argv[1:]:
+        if arg.startswith("--runs="):
+            runs = int(arg[len("--runs=") :])
+        elif arg.startswith("--query="):
+            file = arg[len("--query=") :]
+        elif arg.startswith("--match-limit="):
+            match_limit = int(arg[len("--match-limit=") :])
+        elif arg.startswith("--sort="):
+            sort = arg[len("--sort=") :]
+
+    if sort not in ("time", "matches", "captures", "pattern"):
+        print(
+            f"Unknown sort {sort}. Expected one of ['time', 'matches', 'captures', 'pattern']."
+        )
+        sys.exit(1)
+
+    with open(file, "r") as f:
+        text = f.read()
+
+    full = Query(utils.language(), text)
+    queries = [_isolated(text, i) for i in range(full.pattern_count)]
+    parser = utils.parser()
+
+    exceeded = False
+    for name, source in _sources().items():
+        root = parser.parse(source).root_node
+
+        profiles = [
+            _Profile(i, _label(text, full, i), *_profile(q, root, runs, match_limit))
+            for i, q in enumerate(queries)
+        ]
+        if sort == "pattern":
+            profiles.sort(key=lambda p: p.pattern)
+        else:
+            profiles.sort(key=lambda p: getattr(p, sort), reverse=True)
+
+        total = _profile(full, root, runs, match_limit)
+        exceeded |= total[3] or any(p.exceeded for p in profiles)
+
+        print(f"{name} ({len(source)} bytes)")
+        print(
+            f"    {'#':>3} {'pattern':<32} {'matches':>8} {'captures':>9} {'time (ms)':>10} {'limit':>6}"
+        )
+        for p in profiles + [_Profile(-1, "whole query", *total)]:
+            index = "" if p.pattern < 0 else p.pattern
+            print(
+                f"    {index:>3} {p.label:<32} {p.matches:>8} {p.captures:>9} {p.time:>10.3f} {'HIT' if p.exceeded else '':>6}"
+            )
+        print()
+
+    # a hit match limit means declarations were silently dropped
+    sys.exit(1 if exceeded else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Measure how long it takes to start `sdl_parser.py` and to import the parser's modules.
+
+Usage (from the root of the project):
+    python bench/startup.py [--runs=N]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules whose import cost matters, from the cheapest stage to the most expensive one
+_MODULES = [
+    "setup",
+    "utils",
+    "visitor",
+    "_codegen_module_impl",
+    "api",
+    "pcpp.pcmd",
+    "tree_sitter_c",
+    "gen.cpp",
+    "gen.cs",
+]
+
+
+def _wall(cmd: list[str], runs: int) -> float:
+    """
+    Median wall time of `cmd`, in milliseconds.
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=_ROOT, stdout=subprocess.DEVNULL, check=False)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def _import_time(module: str) -> float:
+    """
+    Cumulative import time of `module` as reported by `-X importtime`, in milliseconds.
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    for line in reversed(out.splitlines()):
+        # import time: self [us] | cumulative | imported package
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1000
+
+    return 0.0
+
+
+def main():
+    runs = 10
+    for arg in sys.argv[1:]:
+        if arg.startswith("--runs="):
+            runs = int(arg[len("--runs=") :])
+
+    python = _wall([sys.executable, "-c", "pass"], runs)
+    help = _wall([sys.executable, "sdl_parser.py", "--help"], runs)
+
+    print(f"{'command':<32} {'median (ms)':>12}")
+    print(f"{'python -c pass':<32} {python:>12.1f}")
+    print(f"{'sdl_parser.py --help':<32} {help:>12.1f}")
+    print()
+
+    print(f"{'module':<32} {'import (ms)':>12}")
+    for module in _MODULES:
+        print(f"{module:<32} {_import_time(module):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Compare walking the children of nodes through lists (`node.named_children`, like `utils.only` used to)
+with the `TreeCursor` helpers of `utils`, in memory and time.
+Two walks are measured: the top level of each unit (as `rules.group_bitflags` does), and the parameters,
+entries and members of every declaration (as the generators do).
+
+Usage (from the root of the project):
+    python bench/traversal.py [--runs=N]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+import setup
+import utils
+from _codegen_module_impl import os_defines, parse_query, preprocess_file
+
+# capture holding the children the generators walk, and the type of those children
+_LISTS = {
+    "function.params": "parameter_declaration",
+    "callback.params": "parameter_declaration",
+    "enum.entries": "enumerator",
+    "struct.members": "field_declaration",
+    "union.members": "field_declaration",
+}
+
+
+def _list_only(ty: str, node):
+    return filter(lambda n: n.type == ty, node.named_children)
+
+
+def _synthetic(count: int = 3000) -> str:
+    parts = []
+    for i in range(count):
+        parts.append(f"extern int SDL_F{i}(SDL_Window *w, const char *s, int n);\n")
+        if i % 10 == 0:
+            parts.append(
+                f"typedef struct SDL_S{i} {{ int a; float b; char c[4]; void *d; }} SDL_S{i};\n"
+            )
+            parts.append(
+                f"typedef enum SDL_E{i} {{ SDL_E{i}_A, SDL_E{i}_B = 4, SDL_E{i}_C }} SDL_E{i};\n"
+            )
+    return "".join(parts)
+
+
+def _sources() -> dict[str, bytes]:
+    try:
+        setup.validate(setup.SDL_ROOT, setup.PATH_BY_UNIT)
+    except ValueError as e:
+        print(
+            f"Using a synthetic header, as the units of setup.py can't be used: {e}\n"
+        )
+        return {"synthetic": _synthetic().encode()}
+
+    sources = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for unit, path in setup.PATH_BY_UNIT.items():
+            output = os.path.join(tmp, f"{unit}.i")
+            preprocess_file(
+                "-I",
+                setup.SDL_ROOT,
+                *os_defines(),
+                input=os.path.join(setup.SDL_ROOT, path),
+                output=output,
+            )
+            with open(output, "rb") as f:
+                sources[unit] = f.read()
+
+    return sources
+
+
+def _top_level(root, *, cursor: bool) -> int:
+    nodes = utils.children(root) if cursor else root.named_children
+    return sum(1 for n in nodes if n.type == "type_definition")
+
+
+def _declarations(lists, *, cursor: bool) -> int:
+    only = utils.only if cursor else _list_only
+    count = 0
+    for node, ty in lists:
+        for child in only(ty, node):
+            count += child.child_by_field_name("type") is not None
+    return count
+
+
+def _measure(fn, runs: int) -> tuple[int, float]:
+    """
+    Peak of the memory traced by `tracemalloc` in bytes, and median time in milliseconds.
+    """
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return peak, statistics.median(times)
+
+
+def main():
+    runs = 20
+    for arg in sys.argv[1:]:
+        if arg.startswith("--runs="):
+            runs = int(arg[len("--runs=") :])
+
+    query = parse_query(os.path.join(_ROOT, "query.scm"))
+    parser = utils.parser()
+
+    print(
+        f"{'source':<16} {'walk':<14} {'lists (KiB)':>12} {'cursor (KiB)':>13} {'lists (ms)':>11} {'cursor (ms)':>12}"
+    )
+
+    for name, text in _sources().items():
+        root = parser.parse(text).root_node
+        lists = [
+            (rules[capture][0], ty)
+            for _, rules in query.matches(root)
+            for capture, ty in _LISTS.items()
+            if capture in rules
+        ]
+
+        walks = {
+            "top level": lambda cursor: _top_level(root, cursor=cursor),
+            "declarations": lambda cursor: _declarations(lists, cursor=cursor),
+        }
+        for walk, fn in walks.items():
+            lp, lt = _measure(lambda: fn(False), runs)
+            cp, ct = _measure(lambda: fn(True), runs)
+            print(
+                f"{name:<16} {walk:<14} {lp / 1024:>12.1f} {cp / 1024:>13.1f} {lt:>11.3f} {ct:>12.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Cache shared by every run on the machine, set with the `SDL_PARSER_CACHE` environment variable, eg.:
+
+    SDL_PARSER_CACHE=~/.cache/sdl_parser python sdl_parser.py gen.cs
+
+It keeps the tokens lexed by pcpp, the preprocessed headers and the prelude, so that runs of other generators,
+work dirs or checkouts (eg. CI jobs running side by side) don't redo each other's work.
+
+- `SDL_PARSER_CACHE_SIZE`: size cap, eg. `512M` or `2G` (1G by default). The least recently used entries
+  are evicted when a new entry goes over it.
+- `SDL_PARSER_CACHE_COMPRESSION`: `zlib` (the default, faster) or `lzma` (smaller). Entries of either kind
+  can be read whatever the setting.
+
+Entries are written to a temporary file and renamed into place while holding a lock on the directory,
+so concurrent runs never see a partial entry nor store the same entry twice.
+
+The prelude is loaded with `pickle` and the tokens with `marshal`, which can run arbitrary code (`pickle`)
+or crash the interpreter (`marshal`) on crafted data. Only point `SDL_PARSER_CACHE` to a directory that
+no one but trusted users can write to (eg. not a world-writable `/tmp` directory on a shared machine).
+
+Use `python sdl_parser.py cache stats` to see the entries and hit rates, and `python sdl_parser.py cache prune`
+to evict entries down to the cap (`--max-size=SIZE` for another size, `--max-size=0` to clear the cache).
+"""
+
+import hashlib
+import json
+import lzma
+import os
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Iterator
+
+from run import UsageError
+
+ENV = "SDL_PARSER_CACHE"
+ENV_SIZE = "SDL_PARSER_CACHE_SIZE"
+ENV_COMPRESSION = "SDL_PARSER_CACHE_COMPRESSION"
+
+_DEFAULT_SIZE = 1 << 30
+
+# first byte of each entry, telling how the rest is compressed
+_CODECS = {
+    "zlib": (b"z", lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (b"x", lzma.compress, lzma.decompress),
+}
+_DECOMPRESS = {tag: decompress for tag, _, decompress in _CODECS.values()}
+
+# eviction goes below the cap, so that the next entries don't evict again right away
+_EVICT_TO = 0.9
+
+_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text: str) -> int:
+    """
+    Parse a size such as `512M`, `2G` or `1048576` (bytes).
+    """
+    text = text.strip().upper().removesuffix("B").removesuffix("I")
+    unit = _UNITS.get(text[-1:], 1)
+    number = text[:-1] if text[-1:] in _UNITS else text
+    try:
+        return int(float(number) * unit)
+    except ValueError:
+        raise UsageError(f"Invalid size {text!r}, expected eg. `512M` or `2G`.")
+
+
+def _format_size(size: int) -> str:
+    for suffix, unit in (("GiB", 1 << 30), ("MiB", 1 << 20), ("KiB", 1 << 10)):
+        if size >= unit:
+            return f"{size / unit:.1f} {suffix}"
+    return f"{size} B"
+
+
+def file_digest(path: str) -> str:
+    """
+    Hash of the contents of a file, as stored in `preprocessor.CachedPreprocessor.sources`.
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class Cache:
+    """
+    A directory of compressed entries, grouped by kind (eg. `tokens`) and keyed by a hex digest.
+    """
+
+    def __init__(
+        self, root: str, max_size: int = _DEFAULT_SIZE, compression: str = "zlib"
+    ) -> None:
+        if compression not in _CODECS:
+            raise UsageError(
+                f"Unknown compression {compression}. Expected one of {list(_CODECS)}."
+            )
+
+        self.root = root
+        self.max_size = max_size
+        self.compression = compression
+
+        # hits and misses of this process by kind, not yet added to `stats.json`
+        self._counts: dict[str, list[int]] = {}
+        self._thread_lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, key[:2], key)
+
+    def record(self, kind: str, hit: bool):
+        """
+        Count a hit or a miss of `kind`, for lookups that don't go through `get` (see `get(count=False)`).
+        """
+        with self._thread_lock:
+            self._counts.setdefault(kind, [0, 0])[0 if hit else 1] += 1
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        Hold the lock of the directory, shared with the other threads and processes using it.
+        """
+        with self._thread_lock, open(os.path.join(self.root, ".lock"), "a+b") as f:
+            if sys.platform == "win32":
+                import msvcrt
+
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, kind: str, key: str, *, count: bool = True) -> bytes | None:
+        """
+        Get the entry `key` of `kind`, if any. Using an entry makes it the last to be evicted.
+        The hit or miss is added to the stats of `kind`, unless `count` is unset.
+        """
+        path = self._path(kind, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            data = _DECOMPRESS[data[:1]](data[1:])
+        except (OSError, KeyError, zlib.error, lzma.LZMAError):
+            # missing, evicted in the meantime or unreadable
+            if count:
+                self.record(kind, False)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        if count:
+            self.record(kind, True)
+        return data
+
+    def put(self, kind: str, key: str, data: bytes, *, replace: bool = False):
+        """
+        Store `data` as the entry `key` of `kind`, unless another run already did.
+        Entries whose contents can change for the same key (eg. lists of dependencies) are replaced if `replace`.
+        """
+        path = self._path(kind, key)
+        if not replace and os.path.exists(path):
+            return
+
+        tag, compress, _ = _CODECS[self.compression]
+        data = tag + compress(data)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written outside the lock, which is only held to move it into place
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+        with self._locked():
+            previous = 0
+            if os.path.exists(path):
+                if not replace:
+                    os.remove(tmp)
+                    return
+                previous = os.path.getsize(path)
+
+            # before the entry is moved in, so that `_read_size` doesn't count it when it has to scan the entries
+            size = self._read_size() + len(data) - previous
+            os.replace(tmp, path)
+
+            if size > self.max_size:
+                self._evict(int(self.max_size * _EVICT_TO))
+            else:
+                self._write_size(size)
+
+    def flush(self):
+        """
+        Add the hits and misses of this process to the stats of the cache.
+        """
+        with self._thread_lock:
+            counts, self._counts = self._counts, {}
+        if not counts:
+            return
+
+        with self._locked():
+            stats = self._read_stats()
+            for kind, (hits, misses) in counts.items():
+                total = stats.setdefault(kind, {"hits": 0, "misses": 0})
+                total["hits"] += hits
+                total["misses"] += misses
+            self._write(os.path.join(self.root, "stats.json"), json.dumps(stats))
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Entries, size, hits and misses of each kind of entry.
+        """
+        with self._locked():
+            stats = self._read_stats()
+            entries = self._entries()
+
+        result = {
+            kind: {"entries": 0, "size": 0, **counts} for kind, counts in stats.items()
+        }
+        for path, size, _ in entries:
+            kind = os.path.relpath(path, self.root).split(os.sep)[0]
+            total = result.setdefault(kind, {"entries": 0, "size": 0})
+            total["entries"] += 1
+            total["size"] += size
+
+        return result
+
+    def prune(self, max_size: int | None = None) -> tuple[int, int]:
+        """
+        Evict the least recently used entries until the cache fits in `max_size` (the cap if `None`).
+        Returns the number of entries evicted and the bytes freed.
+        """
+        with self._locked():
+            return self._evict(self.max_size if max_size is None else max_size)
+
+    # the following are only called while holding the lock
+
+    def _entries(self) -> list[tuple[str, int, float]]:
+        """
+        `(path, size, last use)` of every entry.
+        """
+        entries = []
+        for kind in os.scandir(self.root):
+            if not kind.is_dir():
+                continue
+            for prefix in os.scandir(kind.path):
+                if not prefix.is_dir():
+                    continue
+                for entry in os.scandir(prefix.path):
+                    if entry.name.endswith(".tmp"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self, target: int) -> tuple[int, int]:
+        entries = self._entries()
+        size = sum(size for _, size, _ in entries)
+        evicted, freed = 0, 0
+
+        for path, entry_size, _ in sorted(entries, key=lambda e: e[2]):
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            evicted += 1
+            freed += entry_size
+
+        self._write_size(size)
+        return evicted, freed
+
+    def _read_size(self) -> int:
+        try:
+            with open(os.path.join(self.root, "size"), "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            # lost or never written, count it again
+            return sum(size for _, size, _ in self._entries())
+
+    def _write_size(self, size: int):
+        self._write(os.path.join(self.root, "size"), str(size))
+
+    def _read_stats(self) -> dict[str, dict[str, int]]:
+        try:
+            with open(os.path.join(self.root, "stats.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, path: str, text: str):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+_SHARED: dict[str, Cache] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared() -> Cache | None:
+    """
+    Get the cache set by `SDL_PARSER_CACHE`, if any. There is one `Cache` per directory and process.
+    """
+    root = os.environ.get(ENV)
+    if not root:
+        return None
+
+    root = os.path.abspath(os.path.expanduser(root))
+    with _SHARED_LOCK:
+        if root not in _SHARED:
+            _SHARED[root] = Cache(
+                root,
+                parse_size(os.environ.get(ENV_SIZE, str(_DEFAULT_SIZE))),
+                os.environ.get(ENV_COMPRESSION, "zlib"),
+            )
+        return _SHARED[root]
+
+
+def main(args: list[str]):
+    """
+    `python sdl_parser.py cache stats|prune [--max-size=SIZE]`
+    """
+    if not args or args[0] not in ("stats", "prune"):
+        print("Usage: python sdl_parser.py cache stats|prune [--max-size=SIZE]")
+        sys.exit(1)
+
+    try:
+        cache = shared()
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if cache is None:
+        print(f"No shared cache. Set {ENV} to the directory of the cache.")
+        sys.exit(1)
+
+    if args[0] == "prune":
+        max_size = None
+        for arg in args[1:]:
+            if arg.startswith("--max-size="):
+                try:
+                    max_size = parse_size(arg[len("--max-size=") :])
+                except ValueError as e:
+                    print(f"Error: {e}")
+                    sys.exit(1)
+
+        evicted, freed = cache.prune(max_size)
+        print(f"Evicted {evicted} entries, freed {_format_size(freed)}.")
+        return
+
+    stats = cache.stats()
+    print(
+        f"Cache: {cache.root} ({cache.compression}, cap {_format_size(cache.max_size)})"
+    )
+    print(
+        f"    {'kind':<10} {'entries':>8} {'size':>11} {'hits':>8} {'misses':>8} {'hit rate':>9}"
+    )
+
+    totals = {"entries": 0, "size": 0, "hits": 0, "misses": 0}
+    for kind, row in sorted(stats.items()) + [("total", totals)]:
+        if row is not totals:
+            for name in totals:
+                totals[name] += row.get(name, 0)
+
+        hits, misses = row.get("hits", 0), row.get("misses", 0)
+        rate = f"{hits / (hits + misses):.0%}" if hits + misses else "-"
+        print(
+            f"    {kind:<10} {row['entries']:>8} {_format_size(row['size']):>11} {hits:>8} {misses:>8} {rate:>9}"
+        )
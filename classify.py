@@ -0,0 +1,263 @@
+from typing import Iterator
+
+from tree_sitter import Node, TreeCursor
+
+from rules import _MultiRules
+from utils import first, only
+
+# Index of each pattern in `query.scm`, so that matches look the same as those of `QueryCursor.matches`
+_FUNCTION = 0
+_FUNCTION_PTR = 1
+_CALLBACK = 2
+_CALLBACK_PTR = 3
+_OPAQUE = 4
+_TYPE = 5
+_FN_MACRO = 6
+_ALIAS = 7
+_PROP = 8
+_CONST = 9
+_COND = 10
+
+_Match = tuple[int, _MultiRules]
+
+# nodes whose children are walked as a level of their own
+_CONTAINERS = {
+    "preproc_if",
+    "preproc_ifdef",
+    "preproc_elif",
+    "preproc_elifdef",
+    "preproc_else",
+    "ERROR",
+}
+
+# capture prefix, type of the body and capture of the body for each `[enum|struct|union] X { ... }`
+_BODIES = {
+    "enum_specifier": ("enum", "enumerator_list", "enum.entries"),
+    "struct_specifier": ("struct", "field_declaration_list", "struct.members"),
+    "union_specifier": ("union", "field_declaration_list", "union.members"),
+}
+
+_ALIAS_TYPES = {"type_identifier", "primitive_type"}
+
+
+def _is_named(node: Node | None, type: str) -> bool:
+    return node is not None and node.type == type
+
+
+def _function_declarator(decl: Node) -> tuple[Node, Node] | None:
+    name = decl.child_by_field_name("declarator")
+    params = decl.child_by_field_name("parameters")
+    if _is_named(name, "identifier") and _is_named(params, "parameter_list"):
+        return name, params
+    return None
+
+
+def _callback_declarator(decl: Node) -> tuple[Node, Node] | None:
+    inner = decl.child_by_field_name("declarator")
+    params = decl.child_by_field_name("parameters")
+    if not _is_named(inner, "parenthesized_declarator") or not _is_named(
+        params, "parameter_list"
+    ):
+        return None
+
+    for ptr in only("pointer_declarator", inner):
+        name = ptr.child_by_field_name("declarator")
+        if name is not None and name.is_named:
+            return name, params
+
+    return None
+
+
+def _type_identifier(ptr: Node) -> Node | None:
+    return first("type_identifier", ptr)
+
+
+def _declaration(node: Node) -> Iterator[_Match]:
+    ty = node.child_by_field_name("type")
+    if ty is None:
+        return
+
+    # `(storage_class_specifier)` comes before `type:` in the pattern, so look for it before the type
+    storage = ty.prev_named_sibling
+    while storage is not None and storage.type != "storage_class_specifier":
+        storage = storage.prev_named_sibling
+    if storage is None:
+        return
+
+    for decl in node.children_by_field_name("declarator"):
+        if decl.type == "function_declarator":
+            if (found := _function_declarator(decl)) is not None:
+                yield _FUNCTION, {
+                    "function.return": [ty],
+                    "function.name": [found[0]],
+                    "function.params": [found[1]],
+                    "function.decl": [node],
+                    "function": [node],
+                }
+
+        elif decl.type == "pointer_declarator":
+            inner = decl.child_by_field_name("declarator")
+            if _is_named(inner, "function_declarator") and (
+                (found := _function_declarator(inner)) is not None
+            ):
+                yield _FUNCTION_PTR, {
+                    "function.return": [ty],
+                    "function.name": [found[0]],
+                    "function.params": [found[1]],
+                    "function.return_ptr": [decl],
+                    "function.decl": [node],
+                    "function": [node],
+                }
+
+
+def _type_definition(node: Node) -> Iterator[_Match]:
+    ty = node.child_by_field_name("type")
+    if ty is None:
+        return
+
+    if ty.type in _BODIES:
+        kind, body_type, body_capture = _BODIES[ty.type]
+        name = ty.child_by_field_name("name")
+        body = ty.child_by_field_name("body")
+        if _is_named(name, "type_identifier") and _is_named(body, body_type):
+            yield _TYPE, {f"{kind}.name": [name], body_capture: [body], kind: [ty]}
+
+    for decl in node.children_by_field_name("declarator"):
+        match decl.type:
+            case "function_declarator":
+                if (found := _callback_declarator(decl)) is not None:
+                    yield _CALLBACK, {
+                        "callback.return": [ty],
+                        "callback.name": [found[0]],
+                        "callback.params": [found[1]],
+                        "callback": [node],
+                    }
+
+            case "pointer_declarator":
+                inner = decl.child_by_field_name("declarator")
+                if _is_named(inner, "function_declarator"):
+                    if (found := _callback_declarator(inner)) is not None:
+                        yield _CALLBACK_PTR, {
+                            "callback.return": [ty],
+                            "callback.name": [found[0]],
+                            "callback.params": [found[1]],
+                            "callback.return_ptr": [decl],
+                            "callback": [node],
+                        }
+                elif (name := _type_identifier(decl)) is not None:
+                    if (
+                        ty.type == "struct_specifier"
+                        and ty.child_by_field_name("body") is None
+                    ):
+                        yield _OPAQUE, {"opaque.name": [name], "opaque": [node]}
+                    elif ty.type in _ALIAS_TYPES:
+                        yield _ALIAS, {
+                            "alias.type": [ty],
+                            "alias.name": [name],
+                            "alias.ptr": [decl],
+                            "alias": [node],
+                        }
+
+            case "type_identifier":
+                if (
+                    ty.type == "struct_specifier"
+                    and ty.child_by_field_name("body") is None
+                ):
+                    yield _OPAQUE, {"opaque.name": [decl], "opaque": [node]}
+                elif ty.type in _ALIAS_TYPES:
+                    yield _ALIAS, {
+                        "alias.type": [ty],
+                        "alias.name": [decl],
+                        "alias": [node],
+                    }
+
+
+def _preproc_def(node: Node) -> Iterator[_Match]:
+    name = node.child_by_field_name("name")
+    value = node.child_by_field_name("value")
+    if name is None or value is None:
+        return
+
+    if b"_PROP_" in name.text:
+        yield _PROP, {"prop.name": [name], "prop.key": [value], "prop": [node]}
+    else:
+        yield _CONST, {"const.name": [name], "const.value": [value], "const": [node]}
+
+
+def _preproc_function_def(node: Node) -> Iterator[_Match]:
+    name = node.child_by_field_name("name")
+    params = node.child_by_field_name("parameters")
+    body = node.child_by_field_name("value")
+    if name is not None and params is not None and body is not None:
+        yield _FN_MACRO, {
+            "fn_macro.name": [name],
+            "fn_macro.params": [params],
+            "fn_macro.body": [body],
+            "fn_macro": [node],
+        }
+
+
+class CursorEngine:
+    """
+    Drop-in replacement for the `utils.QueryPool` of `query.scm`, giving the same matches in the same order.
+    Like with the query, bitflags are left to `rules.group_bitflags`.
+
+    Instead of running the query engine over the whole tree, it walks the top level of the tree with a `TreeCursor`,
+    going down only into preprocessor blocks (`#if`, `#ifdef`, `#else`, ...) and the bodies of typedef'd
+    structs, unions and enums, and classifies each node by its type and fields in a single pass.
+    Declarations nested anywhere else (eg. `#define`s inside the body of an inline function) are not seen.
+
+    Use with `--engine=cursor`. See `bench/classify.py` for the parity check with `query.scm`.
+    """
+
+    def matches(self, node: Node) -> list[_Match]:
+        return list(self._level(node.walk()))
+
+    def _level(self, cursor: TreeCursor) -> Iterator[_Match]:
+        """
+        Classify the children of the node at `cursor`, leaving the cursor where it was.
+        """
+        if not cursor.goto_first_child():
+            return
+
+        while True:
+            node = cursor.node
+
+            if node.is_named:
+                match node.type:
+                    case "declaration":
+                        yield from _declaration(node)
+
+                    case "type_definition":
+                        yield from _type_definition(node)
+                        yield from self._body(node)
+
+                    case "preproc_def":
+                        yield from _preproc_def(node)
+
+                    case "preproc_function_def":
+                        yield from _preproc_function_def(node)
+
+                    case ty if ty in _CONTAINERS:
+                        if ty == "preproc_if":
+                            cond = node.child_by_field_name("condition")
+                            if cond is not None:
+                                yield _COND, {"cond.text": [cond], "cond": [node]}
+                        elif ty == "preproc_ifdef":
+                            name = node.child_by_field_name("name")
+                            if name is not None:
+                                yield _COND, {"cond.text": [name], "cond": [node]}
+
+                        yield from self._level(cursor)
+
+            if not cursor.goto_next_sibling():
+                break
+
+        cursor.goto_parent()
+
+    def _body(self, typedef: Node) -> Iterator[_Match]:
+        # members and entries don't match anything, but the preprocessor blocks between them do
+        ty = typedef.child_by_field_name("type")
+        body = ty.child_by_field_name("body") if ty is not None else None
+        if body is not None:
+            yield from self._level(body.walk())
@@ -1,5 +1,9 @@
+import io
+
 from tree_sitter import Node
 
+import run
+from layout import TARGETS, Layout, LayoutEngine
 from rules import (
     AliasRules,
     BitflagRules,
@@ -10,21 +14,21 @@ from rules import (
     FuncRules,
     OpaqueRules,
     PropertyRules,
+    Rules,
     StructRules,
     UnionRules,
 )
-from setup import PATH_BY_UNIT
-from utils import only
-from visitor import VisitorBase
+from utils import first, only
+from visitor import Item, VisitorBase
 
 _PRELUDE: str = """
 module;
 
 #include <type_traits>
-#include <{0}>
+{4}#include <{0}>
 
 export module {1};
-
+{3}
 #define REGULAR_ENUM(ty) \\
     constexpr bool operator ==(std::underlying_type_t<ty> a, ty b) noexcept \\
     {{ \\
@@ -64,11 +68,52 @@ export module {1};
     {{ \\
         return a = a ^ b; \\
     }}
-
+{5}
 export namespace {2}
 {{
 """
 
+_REFLECTION_INCLUDES: str = """#include <algorithm>
+#include <array>
+#include <string_view>
+#include <utility>
+"""
+
+# `ty##_by_name` is generated sorted by name, `ty##_by_value` is sorted by the compiler
+_REFLECTION: str = """
+#define REFLECT_ENUM(ty) \\
+    inline constexpr auto ty##_by_value = [] { \\
+        auto out = std::to_array(ty##_by_name); \\
+        std::ranges::sort(out, [](auto const& a, auto const& b) { \\
+            return a.second < b.second || (a.second == b.second && a.first < b.first); \\
+        }); \\
+        return out; \\
+    }(); \\
+    constexpr std::string_view to_string(ty value) noexcept \\
+    { \\
+        auto it = std::ranges::lower_bound(ty##_by_value, value, {}, &std::pair<std::string_view, ty>::second); \\
+        return it != std::ranges::end(ty##_by_value) && it->second == value ? it->first : std::string_view{}; \\
+    } \\
+    constexpr bool from_string(std::string_view name, ty& value) noexcept \\
+    { \\
+        auto it = std::ranges::lower_bound(ty##_by_name, name, {}, &std::pair<std::string_view, ty>::first); \\
+        if (it == std::ranges::end(ty##_by_name) || it->first != name) \\
+            return false; \\
+        value = it->second; \\
+        return true; \\
+    }
+
+#define REFLECT_BITFLAG(ty) \\
+    REFLECT_ENUM(ty) \\
+    template <class F> \\
+    constexpr void for_each_flag(ty value, F&& f) \\
+    { \\
+        for (auto const& [name, flag] : ty##_by_value) \\
+            if (static_cast<std::underlying_type_t<ty>>(flag) != 0 && (value & flag) == flag) \\
+                f(name, flag); \\
+    }
+"""
+
 
 def _cut_similarity(model: str, target: str) -> str:
     mi, ti = 0, 0
@@ -101,12 +146,19 @@ def _cut_similarity(model: str, target: str) -> str:
 
 
 class Visitor(VisitorBase):
+    # functions need every enum of the header to know which parameters to cast,
+    # so they are written after the types of the header rather than in declaration order
+    phases = ("functions",)
+
     def __init__(
         self,
         unit: str,
         *,
         module: str = "sdl.{ext}",
         namespace: str = "sdl::{ext}",
+        shard: bool = False,
+        alias: bool = False,
+        reflection: bool = False,
     ) -> None:
         """
         Generate a C++ module from the parsed SDL header file.
@@ -115,25 +167,144 @@ class Visitor(VisitorBase):
             unit (str): The SDL unit to generate the module for.
             module (str, optional): The module name to use. Defaults to "sdl.{ext}".
             namespace (str, optional): The namespace to use. Defaults to "sdl::{ext}".
+            shard (bool, optional): Emit one module partition per SDL header (eg. `export module sdl.SDL:video;`)
+                and a primary module that re-exports all of them. Needs `--split-units`. Defaults to False.
+            alias (bool, optional): Export functions that need no enum casts as references to the SDL function
+                (eg. `inline constexpr auto& Init = ::SDL_Init;`) instead of forwarding wrappers. Defaults to False.
+            reflection (bool, optional): Emit name/value tables for every enum and bitflag, together with
+                `to_string`/`from_string` overloads and `for_each_flag` for bitflags. Defaults to False.
         """
         super().__init__(unit)
 
-        self._enum = set()
+        self._layouts = {target: LayoutEngine(target) for target in TARGETS}
+
+        # enum name -> partition declaring it (`None` when not sharding)
+        self._enum: dict[str, str | None] = {}
 
-        mod = module.format(ext=unit)
-        ns = "sdl" if unit == "SDL" else namespace.format(ext=unit)
+        self._mod = module.format(ext=unit)
+        self._ns = "sdl" if unit == "SDL" else namespace.format(ext=unit)
 
         if unit != "SDL":
             unit = f"SDL_{unit}"
 
-        header = PATH_BY_UNIT[unit].split("/")[-1][:-2]  # remove ".h"
-        self._file = open(f"out/cpp/{header}.g.cppm", "w")
-        self._file.write(_PRELUDE.format(PATH_BY_UNIT[unit], mod, ns))
+        self._path = run.current().path_by_unit[unit]
+        self._header = self._path.split("/")[-1][:-2]  # remove ".h"
+
+        self._shard = shard
+        self._alias = alias
+        self._reflection = reflection
+        self._part: str | None = None
+        self._parts: list[str] = []
+        self._deps: set[str] = set()
+
+        if shard:
+            # partitions are only known at the end, so buffer the primary module
+            self._file = io.StringIO()
+        else:
+            self._file = run.open_output(f"cpp/{self._header}.g.cppm")
+            self._file.write(self._prelude(self._path, self._mod, ""))
+
+    def end_unit(self):
+        if self._shard:
+            body = self._file.getvalue()
+            imports = "".join(f"export import :{part};\n" for part in self._parts)
+
+            self._file = run.open_output(f"cpp/{self._header}.g.cppm")
+            self._file.write(self._prelude(self._path, self._mod, imports))
+            self._file.write(body)
 
-    def __del__(self) -> None:
-        self._file.write("}\n\n#undef BITFLAG_ENUM\n#undef REGULAR_ENUM\n")
+        self._file.write(self._epilogue())
         self._file.close()
 
+    def start_header(self, header: str):
+        if not self._shard:
+            return
+
+        self._part_header = header[:-2]  # remove ".h"
+        self._part = self._part_header.removeprefix("SDL_").lower()
+        self._deps = set()
+
+        self._main = self._file
+        self._file = io.StringIO()
+
+    def end_header(self):
+        if not self._shard:
+            return
+
+        # imports go before any declaration, so the partition is written only now
+        header = self._part_header
+        path = f"{self._path[: self._path.rfind('/') + 1]}{header}.h"
+        imports = "".join(f"import :{dep};\n" for dep in sorted(self._deps))
+
+        with run.open_output(f"cpp/{header}.g.cppm") as f:
+            f.write(self._prelude(path, f"{self._mod}:{self._part}", imports))
+            f.write(self._file.getvalue())
+            f.write(self._epilogue())
+
+        self._parts.append(self._part)
+        self._file = self._main
+        self._part = None
+
+    def _prelude(self, path: str, mod: str, imports: str) -> str:
+        if self._reflection:
+            return _PRELUDE.format(
+                path, mod, self._ns, imports, _REFLECTION_INCLUDES, _REFLECTION
+            )
+        return _PRELUDE.format(path, mod, self._ns, imports, "", "")
+
+    def _epilogue(self) -> str:
+        out = "}\n\n#undef BITFLAG_ENUM\n#undef REGULAR_ENUM\n"
+        if self._reflection:
+            out += "#undef REFLECT_BITFLAG\n#undef REFLECT_ENUM\n"
+        return out
+
+    def _reflect(self, name: str, entries: list[str], macro: str):
+        """
+        Write the name table of an enum, sorted by name so it can be binary searched.
+        """
+        if not self._reflection or not entries:
+            return
+
+        self._file.write(
+            f"    inline constexpr std::pair<std::string_view, {name}> {name}_by_name[] = {{\n"
+        )
+        for entry in sorted(set(entries)):
+            self._file.write(f'        {{"{entry}", {name}::{entry}}},\n')
+        self._file.write(f"    }};\n    {macro}({name});\n")
+
+    def _add_layout(self, rules: Rules):
+        for engine in self._layouts.values():
+            engine.add(rules)
+
+    def _layout_checks(self, name: str):
+        """
+        Check that the layout computed by `layout.LayoutEngine` matches the compiler's.
+        """
+        lp64 = self._layouts["LP64"].layout(name)
+        llp64 = self._layouts["LLP64"].layout(name)
+
+        def check(lay: Layout) -> str:
+            return f"    static_assert(sizeof({name}) == {lay.size} && alignof({name}) == {lay.align});\n"
+
+        if lp64 is None or llp64 is None:
+            return
+        elif (lp64.size, lp64.align) == (llp64.size, llp64.align):
+            self._file.write(
+                f"#if defined(_WIN64) || defined(__LP64__)\n{check(lp64)}#endif\n"
+            )
+        else:
+            self._file.write(
+                f"#if defined(_WIN64)\n{check(llp64)}#elif defined(__LP64__)\n{check(lp64)}#endif\n"
+            )
+
+    def _use_enum(self, ty: str):
+        """
+        Record that the current partition refers to enum `ty`.
+        """
+        part = self._enum.get(ty)
+        if part is not None and part != self._part:
+            self._deps.add(part)
+
     def start_platform_code(self, platforms: list[str]):
         self._file.write(
             f"#if {' || '.join(map(lambda p: f'defined({p})', platforms))}\n"
@@ -142,6 +313,22 @@ class Visitor(VisitorBase):
     def end_platform_code(self):
         self._file.write("#endif\n\n")
 
+    def visit_functions(self, items: list[Item[FuncRules]]):
+        # functions of the same platforms share a single `#if` block
+        platforms = []
+        for item in items:
+            if item.platforms != platforms:
+                if platforms:
+                    self.end_platform_code()
+                if item.platforms:
+                    self.start_platform_code(item.platforms)
+                platforms = item.platforms
+
+            self.visit_function(item.rules)
+
+        if platforms:
+            self.end_platform_code()
+
     def visit_function(self, rules: FuncRules):
         name = rules.function_name
         ret = rules.function_return.text.decode()
@@ -149,7 +336,7 @@ class Visitor(VisitorBase):
 
         if rules.function_return_ptr:
             ret += "*"
-        if any(only("type_qualifier", rules.function_decl)):
+        if first("type_qualifier", rules.function_decl) is not None:
             ret = "const " + ret
 
         body_ret = "" if ret == "void" else "return "
@@ -164,8 +351,9 @@ class Visitor(VisitorBase):
             if ty[4:] in self._enum:
                 ty = ty[4:]
 
-            if node.named_children[0].type == "type_qualifier":
-                ty = node.named_children[0].text.decode() + " " + ty
+            qualifier = node.named_child(0)
+            if qualifier.type == "type_qualifier":
+                ty = qualifier.text.decode() + " " + ty
 
             while decl is not None and decl.type == "pointer_declarator":
                 decl = decl.child_by_field_name("declarator")
@@ -190,7 +378,7 @@ class Visitor(VisitorBase):
                     case "function_declarator":
                         # function_declarator > parenthesized_declarator > pointer_declarator > identifier
                         decl = decl.child_by_field_name("declarator")
-                        decl = decl.named_children[0]
+                        decl = decl.named_child(0)
                         decl = decl.child_by_field_name("declarator")
 
                     case "array_declarator":
@@ -221,6 +409,18 @@ class Visitor(VisitorBase):
         ps_types = [extract_type(p) for p in ps]
         ps_name = [extract_name(p) for p in ps]
 
+        for ty in ps_types:
+            self._use_enum(ty.removeprefix("const ").rstrip("*"))
+
+        if self._alias and all(
+            cast_if_enum(t, n) == n for t, n in zip(ps_types, ps_name)
+        ):
+            # nothing to forward, so don't make every importer parse and inline a wrapper
+            self._file.write(
+                f"\n    inline constexpr auto& {name.text[4:].decode()} = ::{name.text.decode()};\n"
+            )
+            return
+
         for i, n in enumerate(ps_name):
             if n == "" and ps_types[i] != "void":
                 print(f"Note: Skipping {name.text.decode()} due to unnamed parameter")
@@ -237,6 +437,7 @@ class Visitor(VisitorBase):
 """)
 
     def visit_enum(self, rules: EnumRules):
+        self._add_layout(rules)
         name = rules.enum_name
         entries = rules.enum_entries
 
@@ -245,22 +446,26 @@ class Visitor(VisitorBase):
     {{
 """)
 
+        clean_names = []
         for entry in only("enumerator", entries):
             entry_name = entry.child_by_field_name("name")
             clean_name = _cut_similarity(
                 name.text[4:].decode(),
                 entry_name.text[4:].decode(),
             )
+            clean_names.append(clean_name)
 
             self._file.write(f"        {clean_name} = {entry_name.text.decode()},\n")
 
         self._file.write(f"    }};\n    REGULAR_ENUM({name.text[4:].decode()});\n")
+        self._reflect(name.text[4:].decode(), clean_names, "REFLECT_ENUM")
 
-        self._enum.add(name.text[4:].decode())
+        self._enum[name.text[4:].decode()] = self._part
 
         pass
 
     def visit_opaque(self, rules: OpaqueRules):
+        self._add_layout(rules)
         name = rules.opaque_name
 
         al = name.text[4:].decode() if name.text[4:] == b"_" else name.text.decode()
@@ -269,27 +474,30 @@ class Visitor(VisitorBase):
         pass
 
     def visit_struct(self, rules: StructRules):
+        self._add_layout(rules)
         name = rules.struct_name
 
         self._file.write(
             f"\n    using {name.text[4:].decode()} = {name.text.decode()};\n"
         )
-        pass
+        self._layout_checks(name.text.decode())
 
     def visit_union(self, rules: UnionRules):
+        self._add_layout(rules)
         name = rules.union_name
 
         self._file.write(
             f"\n    using {name.text[4:].decode()} = {name.text.decode()};\n"
         )
-        pass
+        self._layout_checks(name.text.decode())
 
     def visit_bitflag(self, rules: BitflagRules):
+        self._add_layout(rules)
         name = rules.bitflag_name
         ty = rules.bitflag_type
         flags = rules.flags
 
-        self._enum.add(name.text[4:].decode())
+        self._enum[name.text[4:].decode()] = self._part
         name = name.text[4:].decode()
 
         self._file.write(f"""
@@ -297,20 +505,24 @@ class Visitor(VisitorBase):
     {{
 """)
 
+        clean_names = []
         for entry in filter(lambda x: x.type == "preproc_def", flags):
             entry_name = entry.child_by_field_name("name")
             clean_name = _cut_similarity(
                 name,
                 entry_name.text[4:].decode(),
             )
+            clean_names.append(clean_name)
 
             self._file.write(f"        {clean_name} = {entry_name.text.decode()},\n")
 
         self._file.write(f"    }};\n    BITFLAG_ENUM({name});\n")
+        self._reflect(name, clean_names, "REFLECT_BITFLAG")
 
         pass
 
     def visit_alias(self, rules: AliasRules):
+        self._add_layout(rules)
         name = rules.alias_name
         ty = rules.alias_type
 
@@ -319,6 +531,7 @@ class Visitor(VisitorBase):
         )
 
     def visit_callback(self, rules: CallbackRules):
+        self._add_layout(rules)
         pass
 
     def visit_fn_macro(self, rules: FnMacroRules):
@@ -335,6 +548,7 @@ class Visitor(VisitorBase):
         )
 
     def visit_const(self, rules: ConstRules):
+        self._add_layout(rules)
         name = rules.const_name.text
         value = rules.const_value.text
 
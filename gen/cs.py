@@ -1,10 +1,28 @@
-from typing import Literal
-from tree_sitter import Node
-import utils
+import io
+import os
 import re
+from typing import Iterator, Literal
 
+from tree_sitter import Node
 
-from visitor import visitor
+import run
+from layout import TARGETS, Layout, LayoutEngine
+from rules import (
+    AliasRules,
+    BitflagRules,
+    CallbackRules,
+    ConstRules,
+    EnumRules,
+    FnMacroRules,
+    FuncRules,
+    OpaqueRules,
+    PropertyRules,
+    Rules,
+    StructRules,
+    UnionRules,
+)
+from utils import fields, only
+from visitor import VisitorBase
 
 # TODO:
 # - add comment if the previous node is one
@@ -33,10 +51,12 @@ namespace SDL3
     using Sint32 = int;
     using Sint64 = long;
 
-    public static class {0}
+    public static {3}class {0}
     {{
-        private const string lib = "{1}";
+{1}
+"""
 
+_LIB: str = """        private const string lib = "{0}";
 """
 
 _TYPE_MAP = {
@@ -69,18 +89,35 @@ _NATIVE_TYPES = {
     "double",
 }
 
+# element types of array members, as C#'s `char` is 2 bytes while C's is 1
+_ARRAY_ELEMENT_MAP = {
+    "char": "byte",
+    "signed char": "sbyte",
+    "unsigned char": "byte",
+}
+
 # thanks a lot, C#
 _PARAM_BLACKLIST = {"lock", "event", "string", "override"}
 
 
-_UNSAFE_STRUCT_QUERY = utils.query("""
-(field_declaration_list
-    (_ declarator: (array_declarator) @fixed)
-)""")
+def _has_array(members: Node) -> bool:
+    return any(
+        decl.type == "array_declarator"
+        for member in only("field_declaration", members)
+        for decl in fields(member, "declarator")
+    )
 
 
-def _only(ty: str, node: Node):
-    return filter(lambda x: x.type == ty, node.children)
+def _array_types(members: Node) -> Iterator[str]:
+    """
+    C# element type of each array member.
+    """
+    for member in only("field_declaration", members):
+        ty_node = member.child_by_field_name("type")
+        for decl in fields(member, "declarator"):
+            if decl.type == "array_declarator":
+                ty, _, _ = _format_member(ty_=ty_node, decl_=decl)
+                yield _ARRAY_ELEMENT_MAP.get(ty, ty)
 
 
 def _parse_const(text: str) -> int:
@@ -109,7 +146,7 @@ def _format_type_name(*, ty: Node, decl: Node) -> tuple[str, str, str]:
     node = ty.parent  # get this before it's too late
     ty = ty.text.decode()
 
-    if node.children[0].text == b"const":
+    if node.child(0).text == b"const":
         cst = "const"
     else:
         cst = ""
@@ -131,7 +168,7 @@ def _format_type_name(*, ty: Node, decl: Node) -> tuple[str, str, str]:
             case "function_declarator":
                 # function_declarator > parenthesized_declarator > pointer_declarator > identifier
                 decl = decl.child_by_field_name("declarator")
-                decl = decl.named_children[0]
+                decl = decl.named_child(0)
                 decl = decl.child_by_field_name("declarator")
 
                 ty = "IntPtr"
@@ -153,7 +190,9 @@ def _format_type_name(*, ty: Node, decl: Node) -> tuple[str, str, str]:
     return f"{cst} {ty} {ptr}".strip(), name, comment
 
 
-def _format_member(*, ty_: Node, decl_: Node) -> tuple[str, str, str]:
+def _format_member(
+    *, ty_: Node, decl_: Node, blittable: bool = False
+) -> tuple[str, str, str]:
     ty, name, comment = _format_type_name(
         ty=ty_,
         decl=decl_,
@@ -161,29 +200,64 @@ def _format_member(*, ty_: Node, decl_: Node) -> tuple[str, str, str]:
 
     if ty.endswith("*"):
         if ty.endswith("char *"):
-            ty = "String"
+            ty = "byte*" if blittable else "String"
         else:
             ty = "IntPtr"
+    elif blittable and ty == "bool":
+        ty = "CBool"
+    elif blittable and ty in _ARRAY_ELEMENT_MAP:
+        # C#'s `char` is 2 bytes and not blittable
+        ty = _ARRAY_ELEMENT_MAP[ty]
 
     return ty, name, comment
 
 
-# These are needed across all visitors, so we keep them here
-_sdl_opaques = set()
-_callbacks = set()
-_fn_macros: dict[re.Pattern[str], tuple] = {
-    re.compile(r"\bSDL_UINT64_C\b"): ([r"\bN\b"], "N"),
-    re.compile(r"\bSDL_VERSIONNUM\b"): (
-        [r"\bX\b", r"\bY\b", r"\bZ\b"],
-        "X * 1000 + Y * 100 + Z",
-    ),
-}
-_const_map = dict()
+def _shared() -> dict:
+    """
+    State needed across all visitors of a run (eg. extensions need the opaques of `SDL`).
+    """
+    return run.current().state.setdefault(
+        "cs",
+        {
+            "sdl_opaques": set(),
+            "callbacks": set(),
+            "fn_macros": {
+                re.compile(r"\bSDL_UINT64_C\b"): ([r"\bN\b"], "N"),
+                re.compile(r"\bSDL_VERSIONNUM\b"): (
+                    [r"\bX\b", r"\bY\b", r"\bZ\b"],
+                    "X * 1000 + Y * 100 + Z",
+                ),
+            },
+            "const_map": dict(),
+            "layouts": {target: LayoutEngine(target) for target in TARGETS},
+        },
+    )
+
 
+class Visitor(VisitorBase):
+    def __init__(
+        self,
+        unit: str,
+        *,
+        shard: bool = False,
+        blittable: bool = False,
+        suppress_gc: str = "",
+    ) -> None:
+        """
+        Generate C# bindings from the parsed SDL header file.
+
+        Args:
+            unit (str): The SDL unit to generate the bindings for.
+            shard (bool, optional): Emit one `partial class` file per SDL header (eg. `SDL_video.g.cs`)
+                next to the main file, which keeps only the library name. Needs `--split-units`. Defaults to False.
+            blittable (bool, optional): Emit `[LibraryImport]` functions and `delegate* unmanaged[Cdecl]` callbacks
+                that only use blittable types (`byte*` for strings, `CBool` for `bool`, pointers for everything else)
+                and disable runtime marshalling for the assembly. Defaults to False.
+            suppress_gc (str, optional): Comma-separated functions that get `[SuppressGCTransition]` when `blittable`
+                is set. Only list short functions that never block or call back into managed code. Defaults to "".
+        """
+        super().__init__(unit)
 
-@visitor
-class CsVisitor:
-    def __init__(self, unit: str) -> None:
         if unit != "SDL":
             unit = f"SDL_{unit}"
             dll = f"{unit}.dll"
@@ -192,33 +266,76 @@ class CsVisitor:
             dll = "SDL3.dll"
             imp = ""
 
-        self._file = open(f"out/cs/{unit}.g.cs", "w")
-        self._file.write(_PRELUDE.format(unit, dll, imp))
+        partial = "partial " if shard else ""
+
+        main_imp = imp
+        if blittable:
+            # `[LibraryImport]` needs a partial class, and pointers need an unsafe one
+            partial = "unsafe partial "
+            imp += "\nusing System.Runtime.CompilerServices;"
+            main_imp = imp
+            if unit == "SDL":
+                # can only be applied once per assembly
+                main_imp += "\n\n[assembly: DisableRuntimeMarshalling]"
+
+        # outputs are kept in memory until the macros are expanded
+        self._file = io.StringIO()
+        self._file.write(_PRELUDE.format(unit, _LIB.format(dll), main_imp, partial))
+
+        shared = _shared()
+        self._sdl_opaques = shared["sdl_opaques"]
+        self._callbacks = shared["callbacks"]
+        self._fn_macros = shared["fn_macros"]
+        self._const_map = shared["const_map"]
+        self._layouts = shared["layouts"]
+
+        self._unit = unit
+        self._imp = imp
+        self._shard = shard
+        self._partial = partial
+        self._blittable = blittable
+        self._suppress_gc = set(filter(None, suppress_gc.split(",")))
+        self._out = [(f"cs/{unit}.g.cs", self._file)]
+
+    def end_unit(self):
+        self._file.write("    }\n}\n")
 
-        self._sdl_opaques = _sdl_opaques
-        self._callbacks = _callbacks
-        self._fn_macros = _fn_macros
-        self._const_map = _const_map
+        # the next unit keeps adding to the shared macros while this one is expanded
+        self._fn_macros = dict(self._fn_macros)
+        return self._write
 
-        self._out = f"out/cs/{unit}.g.cs"
+    def _write(self):
+        # macros can be used before they are defined, and in other shards, so expand at the very end
+        for out, buffer in self._out:
+            self._data = buffer.getvalue()
 
-    def __del__(self) -> None:
-        self._file.write("    }\n}\n")
-        self._file.close()
+            while self._expand():
+                # keep expanding until no more expansions are possible
+                # TODO: as an optimization, expand only on the expanded text
+                pass
+
+            # thanks a lot, C#
+            self._data = self._data.replace("<<", "<< (int)")
+
+            with run.open_output(out) as f:
+                f.write(self._data)
+
+    def start_header(self, header: str):
+        if not self._shard:
+            return
 
-        with open(self._out, "r") as f:
-            self._data = f.read()
+        self._main = self._file
+        self._file = io.StringIO()
+        self._out.append((f"cs/{os.path.splitext(header)[0]}.g.cs", self._file))
 
-        while self._expand():
-            # keep expanding until no more expansions are possible
-            # TODO: as an optimization, expand only on the expanded text
-            pass
+        self._file.write(_PRELUDE.format(self._unit, "", self._imp, self._partial))
 
-        # thanks a lot, C#
-        self._data = self._data.replace("<<", "<< (int)")
+    def end_header(self):
+        if not self._shard:
+            return
 
-        with open(self._out, "w") as f:
-            f.write(self._data)
+        self._file.write("    }\n}\n")
+        self._file = self._main
 
     def start_platform_code(self, platforms: list[str]):
         self._file.write(f"#if {' || '.join(platforms)}\n")
@@ -226,59 +343,63 @@ class CsVisitor:
     def end_platform_code(self):
         self._file.write("#endif\n\n")
 
-    def visit_function(self, rules):
-        name = rules["function.name"].text.decode()
-        docs = rules["function.docs"]
+    def visit_function(self, rules: FuncRules):
+        if self._blittable:
+            self._visit_blittable_function(rules)
+            return
+
+        name = rules.function_name.text.decode()
+        docs = rules.function_docs.text.decode() if rules.function_docs else ""
 
-        ret = rules["function.return"].text.decode()
+        ret = rules.function_return.text.decode()
         ret = _TYPE_MAP.get(ret, ret)
 
         ret_comment = ""
 
-        if "function.return_ptr" in rules and ret not in self._sdl_opaques:
+        if rules.function_return_ptr is not None and ret not in self._sdl_opaques:
             if name.endswith("s"):  # probably always an array
                 ret = f"{ret}[]"
             elif ret == "char":
-                ret = (
-                    "String"
-                    if docs.text.find(b"\\returns[own]") == -1
-                    else "HeapString"
-                )
+                ret = "String" if docs.find("\\returns[own]") == -1 else "HeapString"
             else:
                 ret_comment = f" // {ret} *"
                 ret = "IntPtr"
 
-        if rules["function.params"].text != b"(void)":
+        if rules.function_params.text != b"(void)":
             self._file.write(f"""        [DllImport(lib, CallingConvention = CallingConvention.Cdecl)]
         public static extern {ret} {name}(
 """)
 
-            params = list(_only("parameter_declaration", rules["function.params"]))
+            params = list(only("parameter_declaration", rules.function_params))
+            formatted = []
             mx = len(params)
             for i, param in enumerate(params):
-                ty, name, comment = self._format_param(
-                    param=param, docs=docs.text.decode()
-                )
+                ty, pname, comment = self._format_param(param=param, docs=docs)
+                formatted.append((ty, pname))
 
                 delim = "" if i == mx - 1 else ","
 
-                self._file.write(f"            {ty} {name}{delim}{comment}\n")
+                self._file.write(f"            {ty} {pname}{delim}{comment}\n")
 
             self._file.write(f"        );{ret_comment}\n\n")
+
+            self._write_span_overloads(rules, ret, formatted)
+            self._write_property_overloads(rules, ret, formatted)
         else:
             self._file.write(f"""        [DllImport(lib, CallingConvention = CallingConvention.Cdecl)]
         public static extern {ret} {name}();{ret_comment}
 
 """)
 
-    def visit_enum(self, rules):
-        name = rules["enum.name"].text.decode()
+    def visit_enum(self, rules: EnumRules):
+        self._add_layout(rules)
+        name = rules.enum_name.text.decode()
 
         self._file.write(f"""        public enum {name}
         {{
 """)
 
-        for entry in _only("enumerator", rules["enum.entries"]):
+        for entry in only("enumerator", rules.enum_entries):
             entry_name = entry.child_by_field_name("name").text.decode()
             entry_value = entry.child_by_field_name("value")
 
@@ -290,7 +411,7 @@ class CsVisitor:
 
         self._file.write("        }\n\n")
 
-        for entry in _only("enumerator", rules["enum.entries"]):
+        for entry in only("enumerator", rules.enum_entries):
             entry_name = entry.child_by_field_name("name").text.decode()
 
             # HACK: needed just so C# doesn't complain about enum values not being in scope
@@ -302,8 +423,9 @@ class CsVisitor:
 
         self._file.write("\n")
 
-    def visit_opaque(self, rules):
-        name = rules["opaque.name"].text.decode()
+    def visit_opaque(self, rules: OpaqueRules):
+        self._add_layout(rules)
+        name = rules.opaque_name.text.decode()
         self._sdl_opaques.add(name)
 
         self._file.write(f"""        [StructLayout(LayoutKind.Sequential)]
@@ -316,75 +438,77 @@ class CsVisitor:
 
 """)
 
-    def visit_struct(self, rules):
-        name = rules["struct.name"].text.decode()
+    def visit_struct(self, rules: StructRules):
+        self._add_layout(rules)
+        name = rules.struct_name.text.decode()
 
         # TODO: recheck this
-        if rules["struct.members"].named_child_count == 0:
+        if rules.struct_members.named_child_count == 0:
             return
 
-        unsafe_query = _UNSAFE_STRUCT_QUERY.matches(rules["struct.members"])
-        unsafe = ""
-        if len(unsafe_query) > 0:
-            if len(unsafe_query[0][1]) > 0:
-                unsafe = "unsafe "
+        layout = self._layout(name, rules.struct_members)
+        unsafe = "unsafe " if _has_array(rules.struct_members) else ""
 
-        self._file.write(f"""        [StructLayout(LayoutKind.Sequential)]
+        if layout is not None:
+            attr = f"[StructLayout(LayoutKind.Explicit, Size = {layout.size})]"
+        else:
+            attr = "[StructLayout(LayoutKind.Sequential)]"
+
+        self._file.write(f"""        {attr}
         public {unsafe}struct {name}
         {{
 """)
 
         if name != "SDL_GamepadBinding":
-            for member in _only("field_declaration", rules["struct.members"]):
-                ty_node = member.child_by_field_name("type")
-
-                for decl_node in member.children_by_field_name("declarator"):
-                    ty, name, comment = _format_member(
-                        ty_=ty_node,
-                        decl_=decl_node,
-                    )
-
-                    pre = ""
-
-                    if name.find("padding") != -1:
-                        pre = "private"
-                    else:
-                        pre = "public"
-
-                    if (s := name.find("[")) != -1:
-                        e = name.find("]", s)
-                        old_len = name[s + 1 : e]
-
-                        pre += " fixed"
-                        if ty not in _NATIVE_TYPES:
-                            pre = f"""[MarshalAs(UnmanagedType.ByValArray, ArraySubType = UnmanagedType.Struct, SizeConst = ((int){old_len}))]
-            public"""
-                            ty += "[]"
-                            name = name[:s]
-
-                    self._file.write(f"""            {pre} {ty} {name};{comment}
-""")
+            self._write_members(rules.struct_members, layout)
 
         self._file.write("        }\n\n")
 
-    def visit_union(self, rules):
-        name = rules["union.name"].text.decode()
+    def visit_union(self, rules: UnionRules):
+        self._add_layout(rules)
+        name = rules.union_name.text.decode()
 
-        if rules["union.members"].named_child_count == 0:
+        if rules.union_members.named_child_count == 0:
             return
 
-        unsafe_query = _UNSAFE_STRUCT_QUERY.matches(rules["union.members"])
-        unsafe = ""
-        if len(unsafe_query) > 0:
-            if len(unsafe_query[0][1]) > 0:
-                unsafe = "unsafe "
+        layout = self._layout(name, rules.union_members)
+        unsafe = "unsafe " if _has_array(rules.union_members) else ""
+        size = f", Size = {layout.size}" if layout is not None else ""
 
-        self._file.write(f"""        [StructLayout(LayoutKind.Explicit)]
+        self._file.write(f"""        [StructLayout(LayoutKind.Explicit{size})]
         public {unsafe}struct {name}
         {{
 """)
 
-        for member in _only("field_declaration", rules["union.members"]):
+        self._write_members(rules.union_members, layout, union=True)
+
+        self._file.write("        }\n\n")
+
+    def _add_layout(self, rules: Rules):
+        for engine in self._layouts.values():
+            engine.add(rules)
+
+    def _layout(self, name: str, members: Node) -> Layout | None:
+        """
+        Get the layout of `name`, if it's the same on every target, 32-bit ones included. Records holding pointers
+        or `long`s differ, and keep the sequential layout the runtime computes for the process.
+        Only the size and offsets are compared, as the alignment isn't part of the C# output.
+
+        Without `--blittable`, records with arrays of other than primitive types keep the sequential layout
+        and `MarshalAs` arrays, as the `[InlineArray]` buffers they would need are only in .NET 8 and later.
+        """
+        if not self._blittable and any(ty not in _NATIVE_TYPES for ty in _array_types(members)):
+            return None
+
+        layouts = [engine.layout(name) for engine in self._layouts.values()]
+        if any(lay is None for lay in layouts) or any(
+            (lay.size, lay.fields) != (layouts[0].size, layouts[0].fields) for lay in layouts
+        ):
+            return None
+        return layouts[0]
+
+    def _write_members(self, members: Node, layout: Layout | None, *, union=False):
+        for member in only("field_declaration", members):
             ty_node = member.child_by_field_name("type")
             assert ty_node is not None
 
@@ -393,26 +517,52 @@ class CsVisitor:
                 ty, name, comment = _format_member(
                     ty_=ty_node,
                     decl_=decl_node,
+                    blittable=self._blittable,
                 )
 
-                pre = ""
+                pre = "private" if name.find("padding") != -1 else "public"
+                buffer = ""
+                field = layout and layout.field(name.partition("[")[0])
 
-                if name.find("padding") != -1:
-                    pre = "private"
-                else:
-                    pre = "public"
+                if (s := name.find("[")) != -1:
+                    e = name.find("]", s)
+                    old_len = f"{field.count}" if field else f"(int){name[s + 1 : e]}"
+                    ty = _ARRAY_ELEMENT_MAP.get(ty, ty)
 
-                if name.find("[") != -1:
-                    pre += " fixed"
+                    if ty in _NATIVE_TYPES:
+                        pre += " fixed"
+                        if field:
+                            # multi-dimensional arrays are flattened
+                            name = f"{name[:s]}[{field.count}]"
+                    elif self._blittable:
+                        # blittable, unlike `MarshalAs`, but needs .NET 8
+                        name = name[:s]
+                        buffer = f"""[InlineArray({old_len})]
+            public struct {name}_Buffer {{ private {ty} _element0; }}
+
+            """
+                        ty = f"{name}_Buffer"
+                    else:
+                        pre = f"""[MarshalAs(UnmanagedType.ByValArray, ArraySubType = UnmanagedType.Struct, SizeConst = ({old_len}))]
+            public"""
+                        ty += "[]"
+                        name = name[:s]
 
-                self._file.write(f"""            [FieldOffset(0)] {pre} {ty} {name};{comment}
-    """)
+                if field:
+                    offset = f"[FieldOffset({field.offset})] "
+                elif union:
+                    offset = "[FieldOffset(0)] "
+                else:
+                    offset = ""
 
-        self._file.write("        }\n\n")
+                self._file.write(
+                    f"            {buffer}{offset}{pre} {ty} {name};{comment}\n"
+                )
 
-    def visit_bitflag(self, rules):
-        name = rules["bitflag.name"].text.decode()
-        ty = rules["bitflag.type"].text.decode()
+    def visit_bitflag(self, rules: BitflagRules):
+        self._add_layout(rules)
+        name = rules.bitflag_name.text.decode()
+        ty = rules.bitflag_type.text.decode()
         ty = _TYPE_MAP.get(ty, ty)
 
         self._file.write(f"""        [Flags]
@@ -420,7 +570,7 @@ class CsVisitor:
         {{
 """)
 
-        for entry in filter(lambda x: x.type == "preproc_def", rules["flag"]):
+        for entry in filter(lambda x: x.type == "preproc_def", rules.flags):
             entry_name = entry.child_by_field_name("name").text.decode()
 
             entry_value = entry.child_by_field_name("value").text.decode()
@@ -433,7 +583,7 @@ class CsVisitor:
 
         self._file.write("        }\n\n")
 
-        for entry in filter(lambda x: x.type == "preproc_def", rules["flag"]):
+        for entry in filter(lambda x: x.type == "preproc_def", rules.flags):
             entry_name = entry.child_by_field_name("name").text.decode()
 
             entry_value = entry.child_by_field_name("value").text.decode()
@@ -443,13 +593,14 @@ class CsVisitor:
                 f"        internal const {ty} {entry_name} = ({ty}){name}.{entry_name};\n"
             )
 
-    def visit_alias(self, rules):
-        name = rules["alias.name"].text.decode()
+    def visit_alias(self, rules: AliasRules):
+        self._add_layout(rules)
+        name = rules.alias_name.text.decode()
 
-        if "alias.ptr" in rules:
+        if rules.alias_ptr is not None:
             ty = "IntPtr"
         else:
-            ty = rules["alias.type"].text.decode()
+            ty = rules.alias_type.text.decode()
             ty = _TYPE_MAP.get(ty, ty)
 
         self._file.write(f"""        [StructLayout(LayoutKind.Sequential)]
@@ -464,22 +615,27 @@ class CsVisitor:
 
 """)
 
-    def visit_callback(self, rules):
-        name = rules["callback.name"].text.decode()
+    def visit_callback(self, rules: CallbackRules):
+        self._add_layout(rules)
+        name = rules.callback_name.text.decode()
         self._callbacks.add(name)
 
-        ret = rules["callback.return"].text.decode()
+        if self._blittable:
+            self._visit_blittable_callback(rules)
+            return
+
+        ret = rules.callback_return.text.decode()
 
-        if "callback.return_ptr" in rules and ret not in self._sdl_opaques:
+        if rules.callback_return_ptr is not None and ret not in self._sdl_opaques:
             comment = f" // {ret} *"
             ret = "IntPtr"
 
-        if rules["callback.params"].text != b"(void)":
+        if rules.callback_params.text != b"(void)":
             self._file.write(f"""        [UnmanagedFunctionPointer(CallingConvention.Cdecl)]
         public delegate {ret} {name}(
 """)
 
-            params = list(_only("parameter_declaration", rules["callback.params"]))
+            params = list(only("parameter_declaration", rules.callback_params))
             mx = len(params)
             for i, param in enumerate(params):
                 ty, name, comment = self._format_param(param=param, docs="")
@@ -495,24 +651,37 @@ class CsVisitor:
 
 """)
 
-    def visit_fn_macro(self, rules):
-        name = rules["fn_macro.name"].text.decode()
+    def visit_fn_macro(self, rules: FnMacroRules):
+        name = rules.fn_macro_name.text.decode()
         if name in self._fn_macros:
             return
 
-        params = rules["fn_macro.params"]
-        body = rules["fn_macro.body"].text.decode()
+        params = rules.fn_macro_params
+        body = rules.fn_macro_body.text.decode()
 
         ps_reg = [
-            rf"\b{node.text.decode().strip()}\b" for node in _only("identifier", params)
+            rf"\b{node.text.decode().strip()}\b" for node in only("identifier", params)
         ]
 
         name_re = re.compile(rf"\b{name}\b")
         self._fn_macros[name_re] = (ps_reg, body)
 
-    def visit_const(self, rules):
-        name = rules["const.name"].text.decode()
-        value = rules["const.value"].text.decode()
+    def visit_property(self, rules: PropertyRules):
+        name = rules.prop_name.text.decode()
+        key = rules.prop_key.text.decode()
+
+        self._const_map[name] = "ReadOnlySpan<byte>"
+
+        if key.startswith('"'):
+            # UTF-8, and the terminator is part of the span, so the property overloads pass it to SDL as it is
+            key = f'{key[:-1]}\\0"u8'
+
+        self._file.write(f"        public static ReadOnlySpan<byte> {name} => {key};\n\n")
+
+    def visit_const(self, rules: ConstRules):
+        self._add_layout(rules)
+        name = rules.const_name.text.decode()
+        value = rules.const_value.text.decode()
 
         # these are macros that alias to other functions, we don't need them
         # so just skip them
@@ -539,7 +708,14 @@ class CsVisitor:
         ty = "int"
         end = len(value)
 
-        if value.startswith('"') or value.startswith("SDL_PROP"):
+        if value.startswith("SDL_PROP"):
+            # an alias of a property
+            self._const_map[name] = "ReadOnlySpan<byte>"
+            self._file.write(
+                f"        public static ReadOnlySpan<byte> {name} => {value};\n\n"
+            )
+            return
+        elif value.startswith('"'):
             prelude = "static readonly"
             ty = "string"
         else:
@@ -564,6 +740,262 @@ class CsVisitor:
 
         self._file.write(f"        public {prelude} {ty} {name} = {value[:end]};\n\n")
 
+    def _blittable_type(self, ty: str) -> str:
+        """
+        Map a type from `_format_type_name` to its blittable counterpart.
+        """
+        ty = ty.removeprefix("const ").strip()
+        ptr = ty.count("*")
+        ty = ty.rstrip("* ")
+
+        if ty == "char":
+            ty = "byte"
+        elif ty == "bool":
+            ty = "CBool"
+        elif ptr > 0 and (ty in self._sdl_opaques or ty in self._callbacks):
+            # these are already pointers on the C# side
+            ptr -= 1
+
+        return ty + "*" * ptr
+
+    def _blittable_params(self, params: Node) -> list[tuple[str, str, str]]:
+        out = []
+
+        for i, param in enumerate(only("parameter_declaration", params)):
+            ty_node = param.child_by_field_name("type")
+            decl_node = param.child_by_field_name("declarator")
+
+            if decl_node is None:
+                ty = _TYPE_MAP.get(ty_node.text.decode(), ty_node.text.decode())
+                name, comment = f"arg{i}", ""
+            else:
+                ty, name, comment = _format_type_name(ty=ty_node, decl=decl_node)
+
+            out.append((self._blittable_type(ty), name, comment))
+
+        return out
+
+    def _visit_blittable_function(self, rules: FuncRules):
+        name = rules.function_name.text.decode()
+
+        ret = rules.function_return.text.decode()
+        ret = _TYPE_MAP.get(ret, ret)
+        if rules.function_return_ptr is not None:
+            decl = rules.function_return_ptr.text
+            ret += " " + "*" * decl[: decl.find(rules.function_name.text)].count(b"*")
+        ret = self._blittable_type(ret)
+
+        gc = "\n        [SuppressGCTransition]" if name in self._suppress_gc else ""
+
+        self._file.write(f"""        [LibraryImport(lib)]
+        [UnmanagedCallConv(CallConvs = new[] {{ typeof(CallConvCdecl) }})]{gc}
+        public static partial {ret} {name}(""")
+
+        if rules.function_params.text == b"(void)":
+            self._file.write(");\n\n")
+            return
+
+        params = self._blittable_params(rules.function_params)
+        self._file.write("\n")
+        for i, (ty, pname, comment) in enumerate(params):
+            delim = "" if i == len(params) - 1 else ","
+            self._file.write(f"            {ty} {pname}{delim}{comment}\n")
+
+        self._file.write("        );\n\n")
+
+        params = [(ty, pname) for ty, pname, _ in params]
+        self._write_span_overloads(rules, ret, params)
+        self._write_property_overloads(rules, ret, params)
+
+    def _write_property_overloads(
+        self, rules: FuncRules, ret: str, params: list[tuple[str, str]]
+    ):
+        """
+        Write overloads of the `SDL_*Property` functions taking the name of the property as `byte*`
+        and as `ReadOnlySpan<byte>`, so that the `SDL_PROP_*` keys can be passed as they are.
+        Spans that don't end with a null terminator (eg. slices) are copied to a terminated buffer first.
+        """
+        key = next(
+            (
+                i
+                for i, (ty, pname) in enumerate(params)
+                if pname == "name"
+                and ty in ("InString", "byte*")
+                and i > 0
+                and params[i - 1][0] == "SDL_PropertiesID"
+            ),
+            None,
+        )
+        if key is None:
+            return
+
+        name = rules.function_name.text.decode()
+        ret_kw = "" if ret == "void" else "return "
+
+        if not self._blittable:
+            # the import above takes an `InString`, so add one that takes the pointer
+            ptr_decls = ",\n            ".join(
+                f"{'byte*' if i == key else ty} {pname}"
+                for i, (ty, pname) in enumerate(params)
+            )
+            self._file.write(f"""        [DllImport(lib, CallingConvention = CallingConvention.Cdecl)]
+        public static unsafe extern {ret} {name}(
+            {ptr_decls}
+        );
+
+""")
+
+        decls = ",\n            ".join(
+            f"{'ReadOnlySpan<byte>' if i == key else ty} {pname}"
+            for i, (ty, pname) in enumerate(params)
+        )
+        args = ", ".join(
+            (
+                "__name"
+                if i == key
+                else (
+                    f"{ty.split()[0]} {pname}"
+                    if ty.startswith(("ref ", "out "))
+                    else pname
+                )
+            )
+            for i, (ty, pname) in enumerate(params)
+        )
+
+        call = f"{ret_kw}{name}({args});"
+        early = call if ret_kw else f"{call}\n                return;"
+
+        # the `SDL_PROP_*` keys end with their terminator, so the pointer can be passed as it is
+        self._file.write(f"""        public static unsafe {ret} {name}(
+            {decls}
+        )
+        {{
+            if (!name.IsEmpty && name[^1] == 0)
+            {{
+                fixed (byte* __name = name)
+                {{
+                    {early}
+                }}
+            }}
+
+            Span<byte> __copy = name.Length < 256 ? stackalloc byte[name.Length + 1] : new byte[name.Length + 1];
+            name.CopyTo(__copy);
+            __copy[^1] = 0;
+            fixed (byte* __name = __copy)
+            {{
+                {call}
+            }}
+        }}
+
+""")
+
+    def _write_span_overloads(
+        self, rules: FuncRules, ret: str, params: list[tuple[str, str]]
+    ):
+        """
+        Write an overload of the function taking `Span<T>`/`ReadOnlySpan<T>` instead of each pointer+length pair.
+        The spans are pinned and passed as they are, so nothing is copied.
+        """
+        spans = {}
+        for span in rules.function_spans:
+            elem = _TYPE_MAP.get(span.elem, span.elem)
+            if elem == "void":
+                elem = "byte"
+
+            if elem in self._sdl_opaques or elem in self._callbacks:
+                continue  # these are handles, not buffers
+            if elem == "bool":
+                if not self._blittable:
+                    continue  # `bool` is marshalled as 4 bytes, so it would be copied
+                elem = "CBool"
+            if params[span.ptr][0].endswith("[]"):
+                continue
+
+            spans[span.ptr] = span, elem
+
+        if not spans:
+            return
+
+        name = rules.function_name.text.decode()
+
+        decls = []
+        fixed = []
+        args = []
+        skip = set()
+
+        for i, (ty, pname) in enumerate(params):
+            if i in skip:
+                continue
+
+            if i not in spans:
+                decls.append(f"{ty} {pname}")
+                if ty.startswith(("ref ", "out ")):
+                    args.append(f"{ty.split()[0]} {pname}")
+                else:
+                    args.append(pname)
+                continue
+
+            span, elem = spans[i]
+            skip.add(span.count)
+
+            kind = "ReadOnlySpan" if span.readonly else "Span"
+            ptr = f"__{pname.lstrip('@')}"
+
+            decls.append(f"{kind}<{elem}> {pname}")
+            fixed.append(f"            fixed ({elem}* {ptr} = {pname})\n")
+
+            if ty.startswith(("ref ", "out ")):
+                args.append(f"{ty.split()[0]} *{ptr}")
+            elif ty == "IntPtr":
+                args.append(f"(IntPtr){ptr}")
+            else:
+                args.append(ptr)
+
+            count = f"{pname}.Length"
+            if span.bytes and elem != "byte":
+                count = f"({count} * sizeof({elem}))"
+
+            count_ty = params[span.count][0]
+            args.append(count if count_ty == "int" else f"({count_ty}){count}")
+
+        ret_kw = "" if ret == "void" else "return "
+        decls = ",\n            ".join(decls)
+
+        self._file.write(f"""        public static unsafe {ret} {name}(
+            {decls}
+        )
+        {{
+{"".join(fixed)}            {{
+                {ret_kw}{name}({", ".join(args)});
+            }}
+        }}
+
+""")
+
+    def _visit_blittable_callback(self, rules: CallbackRules):
+        name = rules.callback_name.text.decode()
+
+        ret = rules.callback_return.text.decode()
+        ret = _TYPE_MAP.get(ret, ret)
+        if rules.callback_return_ptr is not None:
+            ret += " *"
+        ret = self._blittable_type(ret)
+
+        types = []
+        if rules.callback_params.text != b"(void)":
+            types = [ty for ty, _, _ in self._blittable_params(rules.callback_params)]
+
+        ptr = f"delegate* unmanaged[Cdecl]<{', '.join([*types, ret])}>"
+
+        self._file.write(f"""        public readonly struct {name}
+        {{
+            public {name}({ptr} pointer) {{ Pointer = pointer; }}
+
+            public readonly {ptr} Pointer;
+        }}
+
+""")
+
     def _format_param(self, *, param: Node, docs: str):
         ty_node = param.child_by_field_name("type")
         decl_node = param.child_by_field_name("declarator")
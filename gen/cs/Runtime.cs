@@ -14,6 +14,19 @@ namespace SDL3
             SDL_TRUE = 1,
         }
 
+        // C `bool`, used by bindings generated with `--blittable`.
+        // Always a single byte, so it can be passed without runtime marshalling.
+        [StructLayout(LayoutKind.Sequential, Size = 1)]
+        public readonly struct CBool
+        {
+            public static implicit operator bool(CBool value) { return value._value != 0; }
+            public static implicit operator CBool(bool value) { return new CBool(value); }
+
+            private CBool(bool value) { _value = (byte)(value ? 1 : 0); }
+
+            private readonly byte _value;
+        }
+
         [StructLayout(LayoutKind.Sequential)]
         public struct SDL_Time
         {
@@ -1,9 +1,24 @@
-from tree_sitter import Node
-
+import hashlib
 import json
 
-from visitor import visitor
-from utils import only, split_type_name
+from tree_sitter import Node
+
+import run
+from rules import (
+    AliasRules,
+    BitflagRules,
+    CallbackRules,
+    ConstRules,
+    EnumRules,
+    FnMacroRules,
+    FuncRules,
+    OpaqueRules,
+    PropertyRules,
+    StructRules,
+    UnionRules,
+)
+from utils import children, only, split_type_name
+from visitor import VisitorBase
 
 # TODO:
 # strip `struct` from members
@@ -87,115 +102,228 @@ def _parse_return_docs(docs: str) -> str | None:
     return docs[e + 1 : f].strip()
 
 
-@visitor
-class JsonVisitor:
-    def __init__(self, unit: str) -> None:
-        self._data = {}
-        self._unit = unit
-        pass
-
-    def __del__(self) -> None:
-        name = "SDL" if self._unit == "SDL" else f"SDL_{self._unit}"
-
-        with open(f"out/json/{name}.g.json", "w") as f:
-            json.dump(self._data, f, indent=4)
-
-    def visit_function(self, rules: dict[str, Node | list[Node]]):
-        ty, name = split_type_name(rules["function.decl"])
-        docs = rules["function.docs"].text.decode()
-
-        self._data[name] = {
-            "type": "function",
-            "return": ty,
-            "docs": _parse_return_docs(docs) or "",
-            "params": [
-                _parse_doc(docs, split_type_name(param))
-                for param in rules["function.params"].named_children
-                if param.child_by_field_name("declarator") is not None
-            ],
-        }
-
-    def visit_enum(self, rules: dict[str, Node | list[Node]]):
-        name = rules["enum.name"].text.decode()
-
-        self._data[name] = {
-            "type": "enum",
-            "members": dict(
-                _name_value(entry)
-                for entry in only("enumerator", rules["enum.entries"])
-            ),
-        }
-
-    def visit_opaque(self, rules: dict[str, Node | list[Node]]):
-        name = rules["opaque.name"].text.decode()
-
-        self._data[name] = {
-            "type": "opaque",
-        }
-
-    def visit_struct(self, rules: dict[str, Node | list[Node]]):
-        name = rules["struct.name"].text.decode()
+_FORMATS = {"pretty", "compact", "ndjson"}
 
-        self._data[name] = {
-            "type": "struct",
-            "members": [
-                split_type_name(member)
-                for member in rules["struct.members"].named_children
-                if member.child_by_field_name("declarator") is not None
-            ],
-        }
 
-    def visit_union(self, rules: dict[str, Node | list[Node]]):
-        name = rules["union.name"].text.decode()
+class Visitor(VisitorBase):
+    def __init__(self, unit: str, *, output_format: str = "pretty") -> None:
+        """
+        Generate a JSON description of the parsed SDL header file.
 
-        self._data[name] = {
-            "type": "union",
-            "members": [
-                split_type_name(member)
-                for member in rules["union.members"].named_children
-                if member.child_by_field_name("declarator") is not None
-            ],
-        }
+        Outside of `pretty`, every declaration also carries `offset`, its byte offset in the preprocessed header
+        (`out/json/pp/`), and `hash`, a hash of its source text, so tools can tell which declarations changed
+        between runs.
 
-    def visit_bitflag(self, rules: dict[str, Node | list[Node]]):
-        name = rules["bitflag.name"].text.decode()
+        Args:
+            unit (str): The SDL unit to generate the description for.
+            output_format (str, optional): One of `pretty` (a single object, indented, as before),
+                `compact` (a single object, without whitespace) or
+                `ndjson` (one object per line, with a `name` key, written as soon as it is visited).
+                Defaults to "pretty".
+        """
+        super().__init__(unit)
 
-        self._data[name] = {
-            "type": "bitflag",
-            "flags": dict(
-                _name_value(flag)
-                for flag in filter(lambda x: x.type == "preproc_def", rules["flag"])
-            ),
-        }
+        if output_format not in _FORMATS:
+            raise run.UsageError(
+                f"Unknown JSON format `{output_format}`, expected one of {sorted(_FORMATS)}"
+            )
 
-    def visit_alias(self, rules: dict[str, Node | list[Node]]):
-        ty, name = split_type_name(rules["alias"])
+        name = "SDL" if unit == "SDL" else f"SDL_{unit}"
 
-        self._data[name] = {
-            "type": "alias",
-            "alias": ty,
-        }
+        self._format = output_format
+        self._data = {}
+        self._header: str | None = None
+        self._platforms: list[str] | None = None
+
+        if output_format == "ndjson":
+            self._file = run.open_output(f"json/{name}.g.ndjson")
+        else:
+            self._file = run.open_output(f"json/{name}.g.json")
+
+    def end_unit(self):
+        # nothing is added to `self._data` anymore, so it can be serialized in the background
+        return self._write
+
+    def _write(self):
+        if self._format == "pretty":
+            json.dump(self._data, self._file, indent=4)
+        elif self._format == "compact":
+            json.dump(self._data, self._file, separators=(",", ":"))
+
+        self._file.close()
+
+    def _emit(self, root: Node, name: str, record: dict):
+        """
+        Add a declaration, or write it right away when streaming.
+        """
+        if self._format != "pretty":
+            record["offset"] = root.start_byte
+            record["hash"] = hashlib.blake2b(root.text, digest_size=8).hexdigest()
+        if self._header is not None:
+            record["header"] = self._header
+        if self._platforms is not None:
+            record["platforms"] = self._platforms
+
+        if self._format == "ndjson":
+            self._file.write(
+                json.dumps({"name": name, **record}, separators=(",", ":"))
+            )
+            self._file.write("\n")
+        else:
+            self._data[name] = record
+
+    def start_header(self, header: str):
+        self._header = header
+
+    def end_header(self):
+        self._header = None
+
+    def start_platform_code(self, platforms: list[str]):
+        self._platforms = platforms
+
+    def end_platform_code(self):
+        self._platforms = None
+
+    def visit_function(self, rules: FuncRules):
+        ty, name = split_type_name(rules.function_decl)
+        docs = rules.function_docs.text.decode() if rules.function_docs else ""
+
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "function",
+                "return": ty,
+                "docs": _parse_return_docs(docs) or "",
+                "params": [
+                    _parse_doc(docs, split_type_name(param))
+                    for param in children(rules.function_params)
+                    if param.child_by_field_name("declarator") is not None
+                ],
+            },
+        )
+
+    def visit_enum(self, rules: EnumRules):
+        name = rules.enum_name.text.decode()
+
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "enum",
+                "members": dict(
+                    _name_value(entry)
+                    for entry in only("enumerator", rules.enum_entries)
+                ),
+            },
+        )
+
+    def visit_opaque(self, rules: OpaqueRules):
+        name = rules.opaque_name.text.decode()
+
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "opaque",
+            },
+        )
+
+    def visit_struct(self, rules: StructRules):
+        name = rules.struct_name.text.decode()
+
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "struct",
+                "members": [
+                    split_type_name(member)
+                    for member in children(rules.struct_members)
+                    if member.child_by_field_name("declarator") is not None
+                ],
+            },
+        )
+
+    def visit_union(self, rules: UnionRules):
+        name = rules.union_name.text.decode()
+
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "union",
+                "members": [
+                    split_type_name(member)
+                    for member in children(rules.union_members)
+                    if member.child_by_field_name("declarator") is not None
+                ],
+            },
+        )
+
+    def visit_bitflag(self, rules: BitflagRules):
+        name = rules.bitflag_name.text.decode()
+
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "bitflag",
+                "flags": dict(
+                    _name_value(flag)
+                    for flag in filter(lambda x: x.type == "preproc_def", rules.flags)
+                ),
+            },
+        )
+
+    def visit_alias(self, rules: AliasRules):
+        ty, name = split_type_name(rules.root)
+
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "alias",
+                "alias": ty,
+            },
+        )
+
+    def visit_callback(self, rules: CallbackRules):
+        ty, _ = split_type_name(rules.root)
+        name = rules.callback_name.text.decode()
+
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "callback",
+                "return": ty,
+                "params": [
+                    split_type_name(param)
+                    for param in children(rules.callback_params)
+                    if param.child_by_field_name("declarator") is not None
+                ],
+            },
+        )
+
+    def visit_fn_macro(self, rules: FnMacroRules):
+        pass
 
-    def visit_callback(self, rules: dict[str, Node | list[Node]]):
-        ty, _ = split_type_name(rules["callback"])
-        name = rules["callback.name"].text.decode()
-
-        self._data[name] = {
-            "type": "callback",
-            "return": ty,
-            "params": [
-                split_type_name(param)
-                for param in rules["callback.params"].named_children
-                if param.child_by_field_name("declarator") is not None
-            ],
-        }
+    def visit_property(self, rules: PropertyRules):
+        name = rules.prop_name.text.decode()
 
-    def visit_fn_macro(self, rules: dict[str, Node | list[Node]]):
-        pass
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "property",
+                "key": rules.prop_key.text.decode().strip('"'),
+            },
+        )
 
-    def visit_const(self, rules: dict[str, Node | list[Node]]):
-        name = rules["const.name"].text.decode()
-        value = rules["const.value"].text.decode()
+    def visit_const(self, rules: ConstRules):
+        name = rules.const_name.text.decode()
+        value = rules.const_value.text.decode()
 
         # these are macros that alias to other functions, we don't need them
         # so just skip them
@@ -206,7 +334,11 @@ class JsonVisitor:
         if value.find("__") != -1:
             return
 
-        self._data[name] = {
-            "type": "const",
-            "value": value,
-        }
+        self._emit(
+            rules.root,
+            name,
+            {
+                "type": "const",
+                "value": value,
+            },
+        )
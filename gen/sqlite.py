@@ -0,0 +1,351 @@
+import sqlite3
+from typing import Iterator
+
+from tree_sitter import Node
+
+import run
+from rules import (
+    AliasRules,
+    BitflagRules,
+    CallbackRules,
+    ConstRules,
+    EnumRules,
+    FnMacroRules,
+    FuncRules,
+    OpaqueRules,
+    PropertyRules,
+    StructRules,
+    UnionRules,
+)
+from utils import children, fields, only, split_type_name
+from visitor import VisitorBase
+
+# the database is built in memory, so there's nothing to recover on a crash
+_SCHEMA: str = """
+PRAGMA journal_mode = OFF;
+PRAGMA synchronous = OFF;
+
+CREATE TABLE functions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    return_type TEXT NOT NULL,
+    header TEXT,
+    platforms TEXT,
+    docs TEXT
+);
+
+CREATE TABLE params (
+    function_id INTEGER NOT NULL REFERENCES functions(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    base_type TEXT NOT NULL,
+    PRIMARY KEY (function_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE structs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('struct', 'union')),
+    header TEXT,
+    platforms TEXT
+);
+
+CREATE TABLE members (
+    struct_id INTEGER NOT NULL REFERENCES structs(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    base_type TEXT NOT NULL,
+    PRIMARY KEY (struct_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE enums (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('enum', 'bitflag')),
+    type TEXT,
+    header TEXT,
+    platforms TEXT
+);
+
+CREATE TABLE entries (
+    enum_id INTEGER NOT NULL REFERENCES enums(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (enum_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE types (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('alias', 'opaque', 'callback')),
+    type TEXT,
+    header TEXT,
+    platforms TEXT
+);
+
+CREATE TABLE callback_params (
+    type_id INTEGER NOT NULL REFERENCES types(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    base_type TEXT NOT NULL,
+    PRIMARY KEY (type_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE constants (
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    header TEXT,
+    platforms TEXT
+);
+
+CREATE TABLE properties (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    header TEXT,
+    platforms TEXT
+);
+
+CREATE INDEX functions_name ON functions(name);
+CREATE INDEX functions_return_type ON functions(return_type);
+CREATE INDEX params_type ON params(type);
+CREATE INDEX params_base_type ON params(base_type);
+CREATE INDEX callback_params_type ON callback_params(type);
+CREATE INDEX structs_name ON structs(name);
+CREATE INDEX members_type ON members(type);
+CREATE INDEX members_base_type ON members(base_type);
+CREATE INDEX enums_name ON enums(name);
+CREATE INDEX types_name ON types(name);
+CREATE INDEX constants_name ON constants(name);
+CREATE INDEX properties_name ON properties(name);
+CREATE INDEX entries_name ON entries(name);
+CREATE INDEX properties_key ON properties(key);
+"""
+
+
+def _base_type(node: Node) -> str:
+    """
+    Get the type of a declaration without qualifiers or pointers (eg. `SDL_Window` for `const SDL_Window *`).
+    """
+    ty = node.child_by_field_name("type")
+    if ty.type in ("struct_specifier", "union_specifier", "enum_specifier"):
+        name = ty.child_by_field_name("name")
+        return name.text.decode() if name is not None else ty.type.split("_")[0]
+    return ty.text.decode()
+
+
+def _type_name(node: Node, decl: Node | None) -> tuple[str, str]:
+    """
+    Like `split_type_name`, but handles anonymous structs and unions.
+    """
+    ty = node.child_by_field_name("type")
+    if (
+        ty.type in ("struct_specifier", "union_specifier")
+        and ty.child_by_field_name("name") is None
+    ):
+        return ty.type.split("_")[0], decl.text.decode() if decl is not None else ""
+
+    return split_type_name(node, decl)
+
+
+def _members(members: Node) -> Iterator[tuple[Node, Node | None]]:
+    """
+    Iterate over the `(field_declaration, declarator)` of each member, eg. both `x` and `y` of `int x, y;`.
+    Anonymous structs and unions have no declarator.
+    """
+    for member in only("field_declaration", members):
+        decls = list(fields(member, "declarator"))
+        for decl in decls or [None]:
+            yield member, decl
+
+
+class Visitor(VisitorBase):
+    def __init__(self, unit: str) -> None:
+        """
+        Write the declarations of the parsed SDL header file to a SQLite database (`out/sqlite/<unit>.g.db`).
+        Types are stored as they are written in C (eg. `const char*`), with the bare type in `base_type`.
+        Like functions and structs, every declaration gets a row, so the variants of each platform (or `#if` branch) are kept.
+        """
+        super().__init__(unit)
+
+        if unit != "SDL":
+            unit = f"SDL_{unit}"
+
+        # built in memory and written as a whole at the end
+        self._path = f"sqlite/{unit}.g.db"
+        # written from the thread of `run.defer` once the unit is done
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+        self._header: str | None = None
+        self._platforms: str | None = None
+
+    def end_unit(self):
+        return self._write
+
+    def _write(self):
+        self._db.commit()
+
+        with run.open_output(self._path, binary=True) as f:
+            f.write(self._db.serialize())
+
+        self._db.close()
+
+    def start_header(self, header: str):
+        self._header = header
+
+    def end_header(self):
+        self._header = None
+
+    def start_platform_code(self, platforms: list[str]):
+        self._platforms = ",".join(platforms)
+
+    def end_platform_code(self):
+        self._platforms = None
+
+    def visit_function(self, rules: FuncRules):
+        ret, name = split_type_name(rules.root)
+        docs = rules.function_docs.text.decode() if rules.function_docs else None
+
+        fn = self._db.execute(
+            "INSERT INTO functions (name, return_type, header, platforms, docs) VALUES (?, ?, ?, ?, ?)",
+            (name, ret, self._header, self._platforms, docs),
+        ).lastrowid
+
+        if rules.function_params.text == b"(void)":
+            return
+
+        self._db.executemany(
+            "INSERT INTO params VALUES (?, ?, ?, ?, ?)",
+            (
+                (fn, i, *reversed(split_type_name(param)), _base_type(param))
+                for i, param in enumerate(
+                    only("parameter_declaration", rules.function_params)
+                )
+            ),
+        )
+
+    def _add_record(self, name: Node, members: Node, kind: str):
+        record = self._db.execute(
+            "INSERT INTO structs (name, kind, header, platforms) VALUES (?, ?, ?, ?)",
+            (name.text.decode(), kind, self._header, self._platforms),
+        ).lastrowid
+
+        self._db.executemany(
+            "INSERT INTO members VALUES (?, ?, ?, ?, ?)",
+            (
+                (record, i, *reversed(_type_name(member, decl)), _base_type(member))
+                for i, (member, decl) in enumerate(_members(members))
+            ),
+        )
+
+    def visit_struct(self, rules: StructRules):
+        self._add_record(rules.struct_name, rules.struct_members, "struct")
+
+    def visit_union(self, rules: UnionRules):
+        self._add_record(rules.union_name, rules.union_members, "union")
+
+    def visit_enum(self, rules: EnumRules):
+        enum = self._db.execute(
+            "INSERT INTO enums (name, kind, header, platforms) VALUES (?, 'enum', ?, ?)",
+            (rules.enum_name.text.decode(), self._header, self._platforms),
+        ).lastrowid
+
+        self._db.executemany(
+            "INSERT INTO entries VALUES (?, ?, ?, ?)",
+            (
+                (
+                    enum,
+                    i,
+                    entry.child_by_field_name("name").text.decode(),
+                    value.text.decode() if value is not None else None,
+                )
+                for i, entry in enumerate(only("enumerator", rules.enum_entries))
+                for value in (entry.child_by_field_name("value"),)
+            ),
+        )
+
+    def visit_bitflag(self, rules: BitflagRules):
+        enum = self._db.execute(
+            "INSERT INTO enums (name, kind, type, header, platforms) VALUES (?, 'bitflag', ?, ?, ?)",
+            (
+                rules.bitflag_name.text.decode(),
+                rules.bitflag_type.text.decode(),
+                self._header,
+                self._platforms,
+            ),
+        ).lastrowid
+
+        self._db.executemany(
+            "INSERT INTO entries VALUES (?, ?, ?, ?)",
+            (
+                (
+                    enum,
+                    i,
+                    flag.child_by_field_name("name").text.decode(),
+                    flag.child_by_field_name("value").text.decode().strip(),
+                )
+                for i, flag in enumerate(
+                    filter(lambda x: x.type == "preproc_def", rules.flags)
+                )
+            ),
+        )
+
+    def _add_type(self, name: Node, kind: str, ty: str | None) -> int:
+        return self._db.execute(
+            "INSERT INTO types (name, kind, type, header, platforms) VALUES (?, ?, ?, ?, ?)",
+            (name.text.decode(), kind, ty, self._header, self._platforms),
+        ).lastrowid
+
+    def visit_opaque(self, rules: OpaqueRules):
+        self._add_type(rules.opaque_name, "opaque", None)
+
+    def visit_alias(self, rules: AliasRules):
+        ty = rules.alias_type.text.decode()
+        if rules.alias_ptr is not None:
+            ty += "*"
+        self._add_type(rules.alias_name, "alias", ty)
+
+    def visit_callback(self, rules: CallbackRules):
+        ret, _ = split_type_name(rules.root)
+        callback = self._add_type(rules.callback_name, "callback", ret)
+
+        self._db.executemany(
+            "INSERT INTO callback_params VALUES (?, ?, ?, ?, ?)",
+            (
+                (callback, i, *reversed(split_type_name(param)), _base_type(param))
+                for i, param in enumerate(
+                    param
+                    for param in children(rules.callback_params)
+                    if param.child_by_field_name("declarator") is not None
+                )
+            ),
+        )
+
+    def visit_fn_macro(self, rules: FnMacroRules):
+        pass
+
+    def visit_property(self, rules: PropertyRules):
+        self._db.execute(
+            "INSERT INTO properties VALUES (?, ?, ?, ?)",
+            (
+                rules.prop_name.text.decode(),
+                rules.prop_key.text.decode().strip('"'),
+                self._header,
+                self._platforms,
+            ),
+        )
+
+    def visit_const(self, rules: ConstRules):
+        self._db.execute(
+            "INSERT INTO constants VALUES (?, ?, ?, ?)",
+            (
+                rules.const_name.text.decode(),
+                rules.const_value.text.decode().strip(),
+                self._header,
+                self._platforms,
+            ),
+        )
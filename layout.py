@@ -0,0 +1,402 @@
+import ast
+import re
+from dataclasses import dataclass
+
+from tree_sitter import Node
+
+from rules import (
+    AliasRules,
+    BitflagRules,
+    CallbackRules,
+    ConstRules,
+    EnumRules,
+    OpaqueRules,
+    Rules,
+    StructRules,
+    UnionRules,
+)
+from utils import first, only
+
+# TODO:
+# - bitfields
+
+_COMMON_SIZES = {
+    "char": 1,
+    "signed char": 1,
+    "unsigned char": 1,
+    "bool": 1,
+    "_Bool": 1,
+    "short": 2,
+    "unsigned short": 2,
+    "int": 4,
+    "signed": 4,
+    "unsigned": 4,
+    "signed int": 4,
+    "unsigned int": 4,
+    "long long": 8,
+    "unsigned long long": 8,
+    "float": 4,
+    "double": 8,
+    "int8_t": 1,
+    "uint8_t": 1,
+    "int16_t": 2,
+    "uint16_t": 2,
+    "int32_t": 4,
+    "uint32_t": 4,
+    "int64_t": 8,
+    "uint64_t": 8,
+    # these come from `SDL_stdinc.h`, which is never parsed
+    "Uint8": 1,
+    "Sint8": 1,
+    "Uint16": 2,
+    "Sint16": 2,
+    "Uint32": 4,
+    "Sint32": 4,
+    "Uint64": 8,
+    "Sint64": 8,
+    "SDL_Time": 8,
+    "SDL_bool": 4,
+}
+
+_POINTER_SIZES = {
+    "size_t": 8,
+    "intptr_t": 8,
+    "uintptr_t": 8,
+    "ptrdiff_t": 8,
+    "void *": 8,
+}
+_POINTER_SIZES_32 = {name: 4 for name in _POINTER_SIZES}
+
+# Sizes of the primitive types for each data model, `void *` being the size of pointers.
+# Alignment is the same as the size, up to the `_MAX_ALIGN` of the target.
+TARGETS: dict[str, dict[str, int]] = {
+    # Linux, macOS, ...
+    "LP64": _COMMON_SIZES
+    | _POINTER_SIZES
+    | {
+        "long": 8,
+        "unsigned long": 8,
+        "long int": 8,
+        "wchar_t": 4,
+    },
+    # 64-bit Windows
+    "LLP64": _COMMON_SIZES
+    | _POINTER_SIZES
+    | {
+        "long": 4,
+        "unsigned long": 4,
+        "long int": 4,
+        "wchar_t": 2,
+    },
+    # 32-bit Windows and ARM (eg. armv7 Android)
+    "ILP32": _COMMON_SIZES
+    | _POINTER_SIZES_32
+    | {
+        "long": 4,
+        "unsigned long": 4,
+        "long int": 4,
+        "wchar_t": 4,
+    },
+    # 32-bit x86 outside of Windows, where 8-byte types are only 4-byte aligned in records
+    "i386": _COMMON_SIZES
+    | _POINTER_SIZES_32
+    | {
+        "long": 4,
+        "unsigned long": 4,
+        "long int": 4,
+        "wchar_t": 4,
+    },
+}
+
+_MAX_ALIGN = {"i386": 4}
+
+# types that are pointers in disguise
+_POINTER_TYPES = {"SDL_FunctionPointer", "va_list"}
+
+# words of a type that don't change its layout
+_QUALIFIERS = {"const", "volatile", "restrict", "struct", "union", "enum"}
+
+_CAST_REGEX = re.compile(
+    r"\(\s*(?:const\s+)?(?:unsigned\s+|signed\s+)?(?:int|char|short|long|Uint\d+|Sint\d+|size_t)\s*\)"
+)
+_INT_REGEX = re.compile(r"\b(0[xX][0-9a-fA-F]+|\d+)[uUlL]*\b")
+_COMMENT_REGEX = re.compile(r"/\*.*?\*/|//[^\n]*", re.S)
+
+
+@dataclass
+class Field:
+    name: str
+    offset: int
+    size: int  # size of a single element
+    count: int  # number of elements if this is an array, 0 otherwise
+
+
+@dataclass
+class Layout:
+    size: int
+    align: int
+    fields: list[Field]
+
+    def field(self, name: str) -> Field | None:
+        return next((f for f in self.fields if f.name == name), None)
+
+
+class _Unknown(Exception):
+    pass
+
+
+def _align_up(n: int, align: int) -> int:
+    return (n + align - 1) // align * align
+
+
+def _div(a: int, b: int) -> int:
+    # C truncates toward zero, where Python floors
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+class LayoutEngine:
+    """
+    Compute the size, alignment and member offsets of structs and unions for a target data model
+    (`LP64` for Linux/macOS/etc., `LLP64` for 64-bit Windows, `ILP32`/`i386` for 32-bit targets),
+    following the usual C rules.
+
+    Feed every parsed declaration to `add` in source order, then query with `layout`.
+    Types the engine can't figure out (eg. bitfields or arrays sized by unknown macros) have no layout.
+    """
+
+    def __init__(self, target: str = "LP64") -> None:
+        self._sizes = TARGETS[target]
+        self._max_align = _MAX_ALIGN.get(target, 8)
+        size = self._sizes["void *"]
+        self._pointer = (size, size)
+        self._types: dict[str, tuple[int, int]] = {}  # name -> (size, align)
+        self._layouts: dict[str, Layout] = {}
+        self._consts: dict[str, int] = {}
+
+    def add(self, rules: Rules):
+        match rules:
+            case StructRules():
+                self._add_record(rules.struct_name, rules.struct_members, union=False)
+            case UnionRules():
+                self._add_record(rules.union_name, rules.union_members, union=True)
+            case EnumRules():
+                self._add_enum(rules)
+            case BitflagRules():
+                self._add_alias(rules.bitflag_name, rules.bitflag_type.text.decode())
+                for flag in rules.flags:
+                    if flag.type == "preproc_def":
+                        self._add_const(flag)
+            case AliasRules():
+                ty = rules.alias_type.text.decode()
+                self._add_alias(rules.alias_name, ty, ptr=rules.alias_ptr is not None)
+            case CallbackRules():
+                self._types[rules.callback_name.text.decode()] = self._pointer
+            case OpaqueRules():
+                if rules.root.child_by_field_name("declarator").type.startswith(
+                    "pointer"
+                ):
+                    self._types[rules.opaque_name.text.decode()] = self._pointer
+            case ConstRules():
+                self._add_const(rules.root)
+
+    def layout(self, name: str) -> Layout | None:
+        return self._layouts.get(name)
+
+    def _add_alias(self, name: Node, ty: str, *, ptr: bool = False):
+        if ptr:
+            self._types[name.text.decode()] = self._pointer
+            return
+
+        try:
+            self._types[name.text.decode()] = self._type(ty)
+        except _Unknown:
+            pass
+
+    def _add_enum(self, rules: EnumRules):
+        self._types[rules.enum_name.text.decode()] = (4, 4)
+
+        value = -1
+        for entry in only("enumerator", rules.enum_entries):
+            val = entry.child_by_field_name("value")
+            try:
+                value = self._eval(val.text.decode()) if val else value + 1
+            except _Unknown:
+                return  # the rest of the entries depend on this one
+
+            self._consts[entry.child_by_field_name("name").text.decode()] = value
+
+    def _add_const(self, node: Node):
+        value = node.child_by_field_name("value")
+        if value is None:
+            return
+
+        try:
+            self._consts[node.child_by_field_name("name").text.decode()] = self._eval(
+                value.text.decode()
+            )
+        except _Unknown:
+            pass
+
+    def _add_record(self, name: Node, members: Node, *, union: bool):
+        try:
+            layout = self._record(members, union=union)
+        except _Unknown:
+            return
+
+        self._layouts[name.text.decode()] = layout
+        self._types[name.text.decode()] = (layout.size, layout.align)
+
+    def _eval(self, text: str) -> int:
+        """
+        Evaluate a C integer constant expression made of literals and known constants.
+        """
+        text = _COMMENT_REGEX.sub("", text)
+        text = _CAST_REGEX.sub("", text)
+        text = _INT_REGEX.sub(lambda m: str(int(m[1], 0)), text)
+        text = text.replace("/", "//").strip()
+
+        try:
+            tree = ast.parse(text, mode="eval")
+        except SyntaxError:
+            raise _Unknown()
+
+        def ev(node: ast.expr) -> int:
+            match node:
+                case ast.Constant(value=int() as v):
+                    return v
+                case ast.Name(id=n) if n in self._consts:
+                    return self._consts[n]
+                case ast.UnaryOp(op=ast.USub(), operand=x):
+                    return -ev(x)
+                case ast.UnaryOp(op=ast.UAdd(), operand=x):
+                    return ev(x)
+                case ast.UnaryOp(op=ast.Invert(), operand=x):
+                    return ~ev(x)
+                case ast.BinOp(left=a, op=op, right=b):
+                    a, b = ev(a), ev(b)
+                    match op:
+                        case ast.Add():
+                            return a + b
+                        case ast.Sub():
+                            return a - b
+                        case ast.Mult():
+                            return a * b
+                        case ast.FloorDiv() if b != 0:
+                            return _div(a, b)
+                        case ast.LShift():
+                            return a << b
+                        case ast.RShift():
+                            return a >> b
+                        case ast.BitOr():
+                            return a | b
+                        case ast.BitAnd():
+                            return a & b
+                        case ast.BitXor():
+                            return a ^ b
+
+            raise _Unknown()
+
+        return ev(tree.body)
+
+    def _type(self, ty: str) -> tuple[int, int]:
+        ty = " ".join(word for word in ty.split() if word not in _QUALIFIERS)
+
+        if ty in self._sizes:
+            return self._sizes[ty], min(self._sizes[ty], self._max_align)
+        if ty in self._types:
+            return self._types[ty]
+        if ty in _POINTER_TYPES:
+            return self._pointer
+
+        raise _Unknown()
+
+    def _record(self, members: Node, *, union: bool) -> Layout:
+        fields: list[Field] = []
+        offset, size, align = 0, 0, 1
+
+        def place(name: str, elem: tuple[int, int], count: int):
+            nonlocal offset, size, align
+
+            esize, ealign = elem
+            at = 0 if union else _align_up(offset, ealign)
+
+            fields.append(Field(name, at, esize, count))
+
+            end = at + esize * max(count, 1)
+            offset = end
+            size = max(size, end)
+            align = max(align, ealign)
+
+        for member in only("field_declaration", members):
+            if first("bitfield_clause", member) is not None:
+                raise _Unknown()
+
+            ty = member.child_by_field_name("type")
+            decls = member.children_by_field_name("declarator")
+
+            if ty.child_by_field_name("body") is not None:
+                inner = self._record(
+                    ty.child_by_field_name("body"),
+                    union=ty.type == "union_specifier",
+                )
+                elem = (inner.size, inner.align)
+
+                if not decls:
+                    # anonymous struct/union, its members belong to us
+                    at = 0 if union else _align_up(offset, inner.align)
+                    place("", elem, 0)
+                    fields.pop()
+                    fields.extend(
+                        Field(f.name, at + f.offset, f.size, f.count)
+                        for f in inner.fields
+                    )
+                    continue
+            elif ty.type == "enum_specifier":
+                elem = (4, 4)
+            else:
+                elem = None
+
+            for decl in decls:
+                # declarators nest outside-in, but apply inside-out: `*p[4]` is an array of 4 pointers,
+                # while `(*p)[4]` is a single pointer to an array
+                chain = []
+                while decl.type != "field_identifier":
+                    match decl.type:
+                        case "parenthesized_declarator":
+                            decl = decl.named_child(0)
+                            continue
+                        case (
+                            "pointer_declarator"
+                            | "function_declarator"
+                            | "array_declarator"
+                        ):
+                            chain.append(decl)
+                        case _:
+                            raise _Unknown()
+
+                    decl = decl.child_by_field_name("declarator")
+
+                count = 0
+                is_ptr = False
+                for d in reversed(chain):
+                    if d.type != "array_declarator":
+                        # what's outside the pointer is what it points to
+                        is_ptr = True
+                        break
+
+                    dim = d.child_by_field_name("size")
+                    if dim is None:
+                        raise _Unknown()  # flexible array member
+                    count = max(count, 1) * self._eval(dim.text.decode())
+
+                if is_ptr:
+                    e = self._pointer
+                elif elem is not None:
+                    e = elem
+                else:
+                    e = self._type(ty.text.decode())
+
+                place(decl.text.decode(), e, count)
+
+        return Layout(_align_up(size, align), align, fields)
@@ -0,0 +1,296 @@
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable
+
+import run
+from _codegen_module_impl import (
+    _make_visitor,
+    _os_args,
+    _prelude,
+    _preprocess_unit,
+    _sub_headers,
+    _token_cache,
+    parse_preprocessed,
+    preprocess_file,
+)
+from rules import group_bitflags
+from utils import QueryPool
+from visitor import VisitorBase
+
+# number of units parsed ahead of the one being visited, and preprocessed ahead of the one being parsed
+_DEPTH = 2
+
+
+@dataclass
+class Stage:
+    name: str
+    # threads or processes doing the work of the stage
+    workers: int
+    # time spent working, summed over the workers, in seconds
+    busy: float = 0.0
+
+    def utilization(self, wall: float) -> float:
+        return self.busy / (wall * self.workers) if wall > 0 else 0.0
+
+
+@dataclass
+class Summary:
+    """
+    How busy each stage of a pipelined run was.
+    """
+
+    units: int
+    # number of preprocessed files, more than `units` with `--split-units`
+    jobs: int
+    wall: float = 0.0
+    stages: list[Stage] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        lines = [f"Pipeline: {self.units} units, {self.jobs} jobs in {self.wall:.2f}s"]
+        for stage in self.stages:
+            workers = f"{stage.workers} worker{'s' if stage.workers != 1 else ''}"
+            lines.append(
+                f"    {stage.name:<11} {workers:<11} busy {stage.busy:>6.2f}s  utilization {stage.utilization(self.wall):>4.0%}"
+            )
+        return "\n".join(lines)
+
+
+@dataclass
+class _Job:
+    unit: str
+    # header of `SDL.h` with `--split-units`, `None` for a whole unit
+    header: str | None
+    # preprocesses the job on a worker, returning the path of the output
+    preprocess: Callable[[], str]
+
+
+def free_threaded() -> bool:
+    """
+    Whether the interpreter runs without the GIL (eg. CPython 3.13t), so that threads run Python code in parallel.
+    """
+    # only exists since 3.13
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _timed(fn: Callable[[], str]) -> tuple[str, float]:
+    start = time.perf_counter()
+    output = fn()
+    return output, time.perf_counter() - start
+
+
+def _preprocess(*args, output: str, **kwargs) -> str:
+    preprocess_file(*args, output=output, **kwargs)
+    return output
+
+
+def _jobs(gen: str, split_units: bool) -> list[_Job]:
+    """
+    List what has to be preprocessed, in the order the units are visited.
+    """
+    ctx = run.current()
+    pp = f"{ctx.work_dir}/{gen}/pp"
+    common = dict(token_cache=_token_cache(ctx), prelude=_prelude(ctx))
+    jobs = []
+
+    if "SDL" in ctx.path_by_unit:
+        main = f"{ctx.sdl_root}/{ctx.path_by_unit['SDL']}"
+
+        if split_units:
+            headers = _sub_headers(main)
+            guards = [guard for _, guard in headers]
+            os.makedirs(f"{pp}/SDL", exist_ok=True)
+
+            for path, guard in headers:
+                args = [
+                    "-I",
+                    ctx.sdl_root,
+                    *_os_args(ctx),
+                    *(arg for g in guards if g != guard for arg in ("-D", g)),
+                ]
+                output = f"{pp}/SDL/{os.path.basename(path)[:-2]}.i"
+                jobs.append(
+                    _Job(
+                        "SDL",
+                        os.path.basename(path),
+                        partial(
+                            _preprocess_unit,
+                            args,
+                            path,
+                            output,
+                            common["token_cache"],
+                            common["prelude"],
+                        ),
+                    )
+                )
+        else:
+            jobs.append(
+                _Job(
+                    "SDL",
+                    None,
+                    partial(
+                        _preprocess,
+                        "-I",
+                        ctx.sdl_root,
+                        *_os_args(ctx),
+                        input=main,
+                        output=f"{pp}/SDL.i",
+                        **common,
+                    ),
+                )
+            )
+
+    for sdl_ext, path in ctx.path_by_unit.items():
+        if sdl_ext == "SDL":
+            continue
+        jobs.append(
+            _Job(
+                sdl_ext[4:],
+                None,
+                partial(
+                    _preprocess,
+                    *_os_args(ctx),
+                    input=f"{ctx.sdl_root}/{path}",
+                    output=f"{pp}/{sdl_ext}.i",
+                    **common,
+                ),
+            )
+        )
+
+    return jobs
+
+
+class _Pipeline:
+    def __init__(self, jobs: list[_Job], workers: int, query: QueryPool) -> None:
+        self._jobs = jobs
+        self._query = query
+        self._parsed: queue.Queue = queue.Queue(maxsize=_DEPTH)
+        self._stop = threading.Event()
+
+        self.summary = Summary(
+            units=len({job.unit for job in jobs}),
+            jobs=len(jobs),
+            stages=[
+                Stage("preprocess", workers),
+                Stage("parse", 1),
+                Stage("visit", 1),
+            ],
+        )
+        # without the GIL, threads avoid spawning processes and pickling the jobs (and their prelude)
+        executor = ThreadPoolExecutor if free_threaded() else ProcessPoolExecutor
+        self._pool = executor(max_workers=workers)
+
+    def _put(self, item: Any) -> bool:
+        # blocks while the visit stage is `_DEPTH` units behind, unless the run was stopped
+        while not self._stop.is_set():
+            try:
+                self._parsed.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _parse(self):
+        preprocess, parse, _ = self.summary.stages
+        pending: list[Future] = []
+        submitted = 0
+
+        try:
+            for job in self._jobs:
+                # keep the preprocess workers busy, without running too far ahead of the parser
+                while submitted < len(self._jobs) and len(pending) < (
+                    preprocess.workers + _DEPTH
+                ):
+                    pending.append(
+                        self._pool.submit(_timed, self._jobs[submitted].preprocess)
+                    )
+                    submitted += 1
+
+                output, elapsed = pending.pop(0).result()
+                preprocess.busy += elapsed
+
+                start = time.perf_counter()
+                tree = parse_preprocessed(output)
+                root = tree.root_node
+                matches = list(group_bitflags(root, self._query.matches(root)))
+                parse.busy += time.perf_counter() - start
+
+                if not self._put((job, tree, matches)):
+                    return
+        except BaseException as e:
+            self._put(e)
+            return
+
+        self._put(None)
+
+    def run(self, visitor: type[VisitorBase], **kwargs):
+        visit = self.summary.stages[2]
+        start = time.perf_counter()
+
+        thread = threading.Thread(
+            target=copy_context().run, args=(self._parse,), name="parse", daemon=True
+        )
+
+        try:
+            thread.start()
+
+            unit, vis = None, None
+            while (item := self._parsed.get()) is not None:
+                if isinstance(item, BaseException):
+                    raise item
+
+                job, tree, matches = item
+                begin = time.perf_counter()
+
+                if job.unit != unit:
+                    if vis is not None:
+                        vis.finish()
+                    unit, vis = job.unit, _make_visitor(visitor, job.unit, **kwargs)
+
+                if job.header is not None:
+                    vis.start_header(job.header)
+                for _, rules in matches:
+                    vis.visit(rules)
+                if job.header is not None:
+                    vis.end_header()
+
+                visit.busy += time.perf_counter() - begin
+
+            if vis is not None:
+                begin = time.perf_counter()
+                vis.finish()
+                visit.busy += time.perf_counter() - begin
+        finally:
+            self._stop.set()
+            thread.join()
+            self._pool.shutdown(cancel_futures=True)
+            self.summary.wall = time.perf_counter() - start
+
+
+def parse_pipelined(
+    gen: str,
+    query: QueryPool,
+    visitor: type[VisitorBase],
+    split_units: bool = False,
+    jobs: int | None = None,
+    **kwargs,
+) -> Summary:
+    """
+    Parse and visit every unit of the run, overlapping the stages of consecutive units:
+    preprocessing runs on `jobs` processes (pcpp is pure Python) or threads when `free_threaded()`,
+    parsing and querying on a thread, and visiting on the calling thread, in the same order as without the pipeline.
+    The stages are connected by bounded queues, so at most a few units are kept in memory.
+    """
+    todo = _jobs(gen, split_units)
+    workers = max(1, min(jobs or os.cpu_count() or 1, len(todo)))
+
+    pipeline = _Pipeline(todo, workers, query)
+    pipeline.run(visitor, **kwargs)
+    return pipeline.summary
@@ -0,0 +1,241 @@
+import dataclasses
+from typing import IO
+
+from tree_sitter import Node
+
+import run
+from rules import _match_root
+from utils import first
+from visitor import VisitorBase, _Visitor
+
+# Macros defined on each platform of `--platforms`, both the OS ones predefined by compilers and those of `SDL_platform_defines.h`.
+# Any other OS or `SDL_PLATFORM_*` macro is considered undefined on all of them.
+PLATFORMS: dict[str, frozenset[str]] = {
+    "windows": frozenset(
+        {"_WIN32", "_WIN64", "SDL_PLATFORM_WINDOWS", "SDL_PLATFORM_WIN32"}
+    ),
+    "linux": frozenset(
+        {
+            "__linux__",
+            "__linux",
+            "linux",
+            "__unix__",
+            "__unix",
+            "unix",
+            "SDL_PLATFORM_LINUX",
+            "SDL_PLATFORM_UNIX",
+        }
+    ),
+    "macos": frozenset(
+        {"__APPLE__", "__MACH__", "SDL_PLATFORM_APPLE", "SDL_PLATFORM_MACOS"}
+    ),
+    "ios": frozenset(
+        {"__APPLE__", "__MACH__", "__IOS__", "SDL_PLATFORM_APPLE", "SDL_PLATFORM_IOS"}
+    ),
+    "android": frozenset(
+        {
+            "__ANDROID__",
+            "ANDROID",
+            "__linux__",
+            "__linux",
+            "linux",
+            "__unix__",
+            "__unix",
+            "unix",
+            # SDL undefines `SDL_PLATFORM_LINUX` on Android
+            "SDL_PLATFORM_ANDROID",
+            "SDL_PLATFORM_UNIX",
+        }
+    ),
+    "emscripten": frozenset(
+        {"__EMSCRIPTEN__", "__unix__", "__unix", "unix", "SDL_PLATFORM_EMSCRIPTEN"}
+    ),
+}
+
+# Compiler macros `(defined, undefined)` on each platform, like `os_defines` does for Windows (MSVC).
+# The other platforms are built with GCC or Clang, which both define `__GNUC__`; any other compiler macro
+# (eg. `__clang__` outside of Windows) depends on more than the platform.
+_MSVC = (
+    frozenset({"_MSC_VER"}),
+    frozenset({"__GNUC__", "__clang__", "__MWERKS__", "__BORLANDC__"}),
+)
+_GNUC = (frozenset({"__GNUC__"}), frozenset({"_MSC_VER", "__MWERKS__", "__BORLANDC__"}))
+
+COMPILER_MACROS: dict[str, tuple[frozenset[str], frozenset[str]]] = {
+    platform: _MSVC if platform == "windows" else _GNUC for platform in PLATFORMS
+}
+
+# OS macros that don't belong to any platform above, but are still known to be undefined
+_OTHER_OS_MACROS = {"_AIX", "__CYGWIN__", "__wasi__", "__WINRT__", "__GDK__"}
+
+_OS_MACROS = _OTHER_OS_MACROS.union(*PLATFORMS.values())
+
+_CONDITIONALS = {"preproc_if", "preproc_ifdef", "preproc_elif", "preproc_elifdef"}
+
+
+def _is_os_macro(name: str) -> bool:
+    return name in _OS_MACROS or name.startswith("SDL_PLATFORM_")
+
+
+def _defined(name: str, platform: str) -> bool | None:
+    """
+    Whether `name` is defined on `platform`, `None` if it doesn't only depend on the platform.
+    """
+    if _is_os_macro(name):
+        return name in PLATFORMS[platform]
+
+    defined, undefined = COMPILER_MACROS[platform]
+    if name in defined:
+        return True
+    return False if name in undefined else None
+
+
+def _not(value: bool | None) -> bool | None:
+    return None if value is None else not value
+
+
+def _eval(node: Node, platform: str) -> bool | None:
+    """
+    Evaluate a preprocessor condition on a platform.
+    `None` means that the condition depends on something other than the platform.
+    """
+    match node.type:
+        case "identifier":
+            name = node.text.decode()
+            return _defined(name, platform)
+
+        case "preproc_defined":
+            name = first("identifier", node)
+            return _eval(name, platform)
+
+        case "number_literal":
+            try:
+                return int(node.text.decode().rstrip("uUlL"), 0) != 0
+            except ValueError:
+                return None
+
+        case "parenthesized_expression":
+            return _eval(node.named_child(0), platform)
+
+        case "unary_expression" if node.child(0).type == "!":
+            return _not(_eval(node.child_by_field_name("argument"), platform))
+
+        case "binary_expression":
+            op = node.child_by_field_name("operator").type
+            lhs = _eval(node.child_by_field_name("left"), platform)
+            rhs = _eval(node.child_by_field_name("right"), platform)
+
+            if op == "&&":
+                if lhs is False or rhs is False:
+                    return False
+                return None if lhs is None or rhs is None else True
+            if op == "||":
+                if lhs is True or rhs is True:
+                    return True
+                return None if lhs is None or rhs is None else False
+
+    return None
+
+
+def _test(cond: Node, platform: str) -> bool | None:
+    """
+    Evaluate the condition of `#if`, `#ifdef`, `#ifndef`, `#elif`, ...
+    """
+    if cond.type in ("preproc_if", "preproc_elif"):
+        return _eval(cond.child_by_field_name("condition"), platform)
+
+    value = _eval(cond.child_by_field_name("name"), platform)
+    # `#ifndef`, `#elifndef`
+    return _not(value) if cond.child(0).type.endswith("ndef") else value
+
+
+def _branches(node: Node) -> list[tuple[Node, bool]]:
+    """
+    List the conditionals enclosing `node`, with whether `node` is on their `#else`/`#elif` side.
+    """
+    branches = []
+    child, parent = node, node.parent
+
+    while parent is not None:
+        if parent.type in _CONDITIONALS:
+            alternative = parent.child_by_field_name("alternative")
+            branches.append((parent, alternative is not None and alternative == child))
+
+        child, parent = parent, parent.parent
+
+    return branches
+
+
+def _available(branches: list[tuple[Node, bool]], platform: str) -> bool:
+    for cond, alternative in branches:
+        value = _test(cond, platform)
+        if (_not(value) if alternative else value) is False:
+            return False
+
+    return True
+
+
+def available(node: Node, platform: str) -> bool:
+    """
+    Check if the declaration at `node` is compiled on `platform`.
+    Conditions that don't depend on the platform (eg. `SDL_FUNCTION_POINTER_IS_VOID_POINTER`) are considered true.
+    """
+    return _available(_branches(node), platform)
+
+
+class _PlatformSink(run.Sink):
+    """
+    Put the files of a platform under `<gen>/<platform>/`.
+    """
+
+    def __init__(self, inner: run.Sink, platform: str) -> None:
+        self._inner = inner
+        self._platform = platform
+
+    def open(self, path: str, binary: bool = False) -> IO:
+        gen, _, rest = path.partition("/")
+        return self._inner.open(f"{gen}/{self._platform}/{rest}", binary)
+
+
+class _MatrixVisitor:
+    """
+    Same interface as `_Visitor`, but with one generator per platform of the run.
+    Each declaration is only visited by the generators of the platforms that compile it.
+    The generators run in their own context (see `run.bind`), so their files end up in `<gen>/<platform>/`.
+    """
+
+    def __init__(self, cls: type[VisitorBase], unit: str, *args, **kwargs) -> None:
+        ctx = run.current()
+        # each platform has its own state, shared by all the units of the run
+        runs = ctx.state.setdefault("platforms", {})
+        self._targets = []
+
+        for platform in ctx.platforms:
+            if platform not in runs:
+                runs[platform] = dataclasses.replace(
+                    ctx, sink=_PlatformSink(ctx.sink, platform), state={}
+                )
+
+            context = run.bind(runs[platform])
+            vis = context.run(_Visitor, cls, unit, *args, **kwargs)
+            self._targets.append((platform, context, vis))
+
+    def start_header(self, header: str):
+        for _, context, vis in self._targets:
+            context.run(vis.start_header, header)
+
+    def end_header(self):
+        for _, context, vis in self._targets:
+            context.run(vis.end_header)
+
+    def finish(self):
+        for _, context, vis in self._targets:
+            context.run(vis.finish)
+
+    def visit(self, rules):
+        # `#if` blocks are seen by everyone, so that `start_platform_code` keeps working
+        branches = [] if "cond" in rules else _branches(_match_root(rules))
+
+        for platform, context, vis in self._targets:
+            if _available(branches, platform):
+                context.run(vis.visit, rules)
@@ -0,0 +1,257 @@
+import hashlib
+import marshal
+import os
+import pickle
+import re
+import threading
+
+import pcpp
+from pcpp.parser import LexToken
+from pcpp.pcmd import CmdPreprocessor
+from pcpp.preprocessor import Preprocessor
+
+import cache as _cache
+
+# bump when the layout of the cached tokens changes
+_FORMAT = 1
+
+_KEY_PREFIX = f"{_FORMAT}:{pcpp.__version__}:".encode()
+
+
+# string and char literals are matched too, so that comment markers inside them are left alone
+_COMMENT_REGEX = re.compile(
+    r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')|//[^\n]*|/\*.*?\*/""", re.S
+)
+# the start of whatever follows a comment, `None` at the end of the text
+_NEXT_REGEX = re.compile(r"\s*(\S\S?)?")
+
+
+def filter_comments(text: str) -> str:
+    """
+    Drop all the comments of `text` except doc comments attached to a declaration,
+    so that tree-sitter has less to parse. A doc comment is kept if it is either:
+    - a `/** ... */` followed by something other than a comment, such as a function (see `rules._docs`), or
+    - a trailing `/**< ... */`, such as those of struct members and bitflags.
+
+    Dropped comments become a space (if not already preceded by one), which is what they are to C anyway.
+    """
+
+    def _sub(m: re.Match) -> str:
+        if m[1] is not None:  # literal
+            return m[0]
+
+        comment = m[0]
+        if comment.startswith("/**<"):
+            return comment
+
+        if comment.startswith("/**") and comment != "/**/":
+            next = _NEXT_REGEX.match(text, m.end())[1]
+            if next is not None and next not in ("/*", "//"):
+                return comment
+
+        # `a/**/b` is `a b`, while `a /**/` is just `a `
+        before = text[m.start() - 1] if m.start() > 0 else "\n"
+        return "" if before.isspace() else " "
+
+    return _COMMENT_REGEX.sub(_sub, text)
+
+
+def split_prelude(args: list[str]) -> tuple[list[str], list[str]]:
+    """
+    Split pcpp arguments into the `-D`/`-U` pairs, which can go in a `Prelude`, and everything else.
+    """
+    prelude, rest = [], []
+    it = iter(args)
+
+    for arg in it:
+        if arg in ("-D", "-U"):
+            prelude += [arg, next(it)]
+        else:
+            rest.append(arg)
+
+    return prelude, rest
+
+
+class Prelude:
+    """
+    The macros of a fixed list of `-D`/`-U` arguments, defined once and copied into each `CachedPreprocessor`
+    instead of being parsed again for every unit.
+
+    It can be pickled, so it can be sent to worker processes or saved for later runs (see `load_prelude`).
+    """
+
+    def __init__(self, args: list[str]) -> None:
+        pp = Preprocessor()
+        builtin = set(pp.macros)
+
+        defines = [name for flag, name in zip(args[::2], args[1::2]) if flag == "-D"]
+        self.undefines = [
+            name for flag, name in zip(args[::2], args[1::2]) if flag == "-U"
+        ]
+
+        # same as `CmdPreprocessor`: all the defines first, then the undefines
+        for d in defines:
+            if "=" not in d:
+                d += "=1"
+            pp.define(d.replace("=", " ", 1))
+        for d in self.undefines:
+            pp.undef(d)
+
+        macros = {k: v for k, v in pp.macros.items() if k not in builtin}
+        for macro in macros.values():
+            for tok in macro.value:
+                # not needed after lexing, and it can't be pickled
+                tok.__dict__.pop("lexer", None)
+
+        self._macros = pickle.dumps(macros)
+
+    def macros(self) -> dict:
+        """
+        Get a copy of the macros, which the caller is free to change.
+        """
+        return pickle.loads(self._macros)
+
+
+def load_prelude(args: list[str], cache: str | None) -> Prelude:
+    """
+    Get the `Prelude` of `args`, from `cache` (or the shared cache, see `cache.shared`)
+    if it was saved there by an earlier run.
+    """
+    shared = _cache.shared()
+    if cache is None and shared is None:
+        return Prelude(args)
+
+    key = hashlib.sha1(_KEY_PREFIX + "\0".join(args).encode()).hexdigest()
+    if shared is None:
+        path = os.path.join(cache, f"prelude-{key}")
+        data = _load(path)
+    else:
+        data = shared.get("prelude", key)
+
+    prelude = None
+    if data is not None:
+        try:
+            prelude = pickle.loads(data)
+        except (pickle.UnpicklingError, AttributeError, EOFError):
+            pass
+
+    if prelude is None:
+        prelude = Prelude(args)
+        if shared is None:
+            _store(path, pickle.dumps(prelude))
+        else:
+            shared.put("prelude", key, pickle.dumps(prelude))
+
+    if shared is not None:
+        shared.flush()
+    return prelude
+
+
+class CachedPreprocessor(CmdPreprocessor):
+    """
+    pcpp's command line preprocessor, except that the tokens of every file it reads are cached in `token_cache`
+    (or the shared cache, see `cache.shared`), keyed by the hash of the file's contents.
+    Lexing doesn't depend on the defines, so a header that was lexed once is replayed from the cache
+    on later runs, even with other defines, and only macro expansion and conditional evaluation are done again.
+
+    If `prelude` is given, its macros are added to those of `argv` before preprocessing, the `-U`s of `argv` still winning.
+
+    Once done, `sources` holds the hash of every file that was read, by absolute path.
+
+    Like `CmdPreprocessor`, all the work is done by the constructor.
+    """
+
+    def __init__(
+        self,
+        argv: list[str],
+        *,
+        token_cache: str | None,
+        prelude: Prelude | None = None,
+    ) -> None:
+        # set before `super().__init__`, which runs the preprocessor
+        self._token_cache = token_cache
+        self._prelude = prelude
+        self._shared = _cache.shared()
+        self.sources: dict[str, str] = {}
+        super().__init__(argv)
+
+    def parse(self, input, source=None, ignore={}):
+        # called by `CmdPreprocessor.__init__` once the command line macros are defined
+        if self._prelude is not None:
+            undefines = self.args.undefines or []
+
+            # the command line wins over the prelude: its `-D`s over the prelude's, and, as with pcpp,
+            # its `-U`s over every `-D`
+            macros = {**self._prelude.macros(), **self.macros}
+            for name in undefines:
+                macros.pop(name, None)
+            self.macros = macros
+
+            # pcpp's hooks check these to treat the macros as known to be undefined
+            self.args.undefines = [
+                *(name for name in self._prelude.undefines if name not in macros),
+                *undefines,
+            ]
+
+        return super().parse(input, source, ignore)
+
+    def group_lines(self, input, abssource):
+        if abssource is not None and os.path.isfile(abssource):
+            self.sources[os.path.abspath(abssource)] = _cache.file_digest(abssource)
+
+        if self._token_cache is None and self._shared is None:
+            yield from super().group_lines(input, abssource)
+            return
+
+        key = hashlib.sha1(_KEY_PREFIX + input.encode()).hexdigest()
+        if self._shared is None:
+            path = os.path.join(self._token_cache, key[:2], key)
+            data = _load(path)
+        else:
+            data = self._shared.get("tokens", key)
+
+        try:
+            lines = marshal.loads(data) if data is not None else None
+        except (EOFError, ValueError, TypeError):
+            lines = None
+
+        if lines is None:
+            lines = [
+                [(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in line]
+                for line in super().group_lines(input, abssource)
+            ]
+            if self._shared is None:
+                _store(path, marshal.dumps(lines))
+            else:
+                self._shared.put("tokens", key, marshal.dumps(lines))
+
+        # tokens are modified while expanding macros, so each run gets new ones
+        for line in lines:
+            out = []
+            for ty, value, lineno, lexpos in line:
+                tok = LexToken()
+                tok.type = ty
+                tok.value = value
+                tok.lineno = lineno
+                tok.lexpos = lexpos
+                tok.source = abssource
+                out.append(tok)
+            yield out
+
+
+def _load(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _store(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # other processes (or threads) may be reading or writing the same entry
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
@@ -1,3 +1,4 @@
+; NOTE: after editing, run `python bench/query.py` to see the matches and time of each pattern
 
 (
     (declaration
@@ -72,23 +73,7 @@
     ]
 )
 
-(
-    (type_definition
-        type: [
-            (type_identifier)
-            (primitive_type)
-            (sized_type_specifier)
-        ] @bitflag.type
-        declarator: (type_identifier) @bitflag.name
-    )
-    . [
-        (preproc_function_def)
-        (preproc_def
-            name: (_) @flag.name
-            value: (_) @flag.value
-        ) @flag
-    ]+
-) @bitflag
+; NOTE: bitflags (a typedef followed by #defines) are grouped by `rules.group_bitflags`
 
 (preproc_function_def
     name: (_) @fn_macro.name
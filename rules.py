@@ -1,8 +1,12 @@
+import re
+import sys
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 from tree_sitter import Node
 
+from utils import children, fields, only
+
 # TODO:
 # - should you only store the contents (bytes) for some nodes (eg. name?)
 # - cut the prefix from members here
@@ -16,6 +20,120 @@ def _one(rules: _MultiRules, name: str) -> Node:
     return rules[name][0]
 
 
+def _docs(node: Node) -> Optional[Node]:
+    """
+    Get the doc comment (`/** ... */`) right before `node`, if any.
+    """
+    prev = node.prev_sibling
+    if prev is not None and prev.type == "comment" and prev.text.startswith(b"/**"):
+        return prev
+    return None
+
+
+# integer types a buffer length can have
+_COUNT_TYPES = {
+    "int",
+    "size_t",
+    "Sint32",
+    "Uint32",
+    "Sint64",
+    "Uint64",
+}
+
+# names of a length parameter that don't mention the buffer
+_COUNT_NAMES = {"count", "len", "length", "size", "num", "n"}
+
+_PARAM_DOC_REGEX = re.compile(rb"\\param(?:\[[^\]]*\])?\s+(\w+)\s+([^\\]*)")
+_COUNT_DOC_REGEX = re.compile(rb"\b(?:number|count|length|size) of\b")
+_BYTES_DOC_REGEX = re.compile(rb"\bbytes\b")
+
+
+@dataclass
+class SpanParam:
+    """
+    A `(T *ptr, int count)` pair of parameters describing a buffer.
+    """
+
+    ptr: int  # index of the pointer parameter
+    count: int  # index of the length parameter, always `ptr + 1`
+    elem: str  # element type, without `const` and `*`
+    readonly: bool  # the pointer is `const`
+    bytes: bool  # the length is in bytes rather than elements
+
+
+def _pointer_depth(decl: Optional[Node]) -> int:
+    depth = 0
+    while decl is not None and decl.type == "pointer_declarator":
+        depth += 1
+        decl = decl.child_by_field_name("declarator")
+    return depth
+
+
+def _param_name(param: Node) -> str:
+    decl = param.child_by_field_name("declarator")
+    while decl is not None and decl.type != "identifier":
+        decl = decl.child_by_field_name("declarator")
+    return decl.text.decode() if decl is not None else ""
+
+
+def _span_params(params: Node, docs: Optional[Node]) -> list[SpanParam]:
+    """
+    Find the pointer+length pairs of parameters of a function.
+    A pair is a pointer to a single level of non-`char` data, followed by an integer whose name
+    (`count`, `num_<ptr>`, `<ptr>_count`, ...) or `\\param` docs (`the number of ...`) say it is a length.
+    """
+    param_docs = {}
+    if docs is not None:
+        param_docs = {m[1].decode(): m[2] for m in _PARAM_DOC_REGEX.finditer(docs.text)}
+
+    ps = list(only("parameter_declaration", params))
+    spans = []
+
+    for i, (ptr, count) in enumerate(zip(ps, ps[1:])):
+        if _pointer_depth(ptr.child_by_field_name("declarator")) != 1:
+            continue
+
+        elem = ptr.child_by_field_name("type")
+        if elem.type == "struct_specifier":
+            elem = elem.child_by_field_name("name")
+        elem = elem.text.decode()
+        if elem == "char":
+            continue  # strings
+
+        count_ty = count.child_by_field_name("type").text.decode()
+        count_decl = count.child_by_field_name("declarator")
+        if count_ty not in _COUNT_TYPES or count_decl is None:
+            continue
+        if count_decl.type != "identifier":
+            continue
+
+        ptr_name = _param_name(ptr)
+        count_name = count_decl.text.decode()
+        count_doc = param_docs.get(count_name, b"")
+
+        bytes_ = _BYTES_DOC_REGEX.search(count_doc) is not None
+
+        by_name = count_name in _COUNT_NAMES or count_name in (
+            f"num_{ptr_name}",
+            f"n{ptr_name}",
+            f"{ptr_name}_count",
+            f"{ptr_name}count",
+            f"{ptr_name}_len",
+        )
+        by_docs = _COUNT_DOC_REGEX.search(count_doc) is not None
+
+        if not (by_name or by_docs):
+            continue
+        if elem == "void" and not (bytes_ or count_name in ("len", "size")):
+            continue  # we can't tell what the buffer holds
+
+        readonly = any(c.text == b"const" for c in only("type_qualifier", ptr))
+
+        spans.append(SpanParam(i, i + 1, elem, readonly, bytes_ or elem == "void"))
+
+    return spans
+
+
 @dataclass
 class FuncRules:
     root: Node
@@ -27,17 +145,21 @@ class FuncRules:
     function_params: (
         Node  # TODO: do you ever need the whole node or just the named children?
     )
+    function_spans: list[SpanParam]  # pointer+length pairs in `function_params`
 
 
 def _func_rules(rules: _MultiRules) -> FuncRules:
+    docs = rules.get("function.docs", [None])[0] or _docs(_one(rules, "function"))
+
     return FuncRules(
         root=_one(rules, "function"),
-        function_docs=rules.get("function.docs", [None])[0],
+        function_docs=docs,
         function_name=_one(rules, "function.name"),
         function_decl=_one(rules, "function.decl"),
         function_return=_one(rules, "function.return"),
         function_return_ptr=rules.get("function.return_ptr", [None])[0],
         function_params=_one(rules, "function.params"),
+        function_spans=_span_params(_one(rules, "function.params"), docs),
     )
 
 
@@ -157,6 +279,7 @@ class AliasRules:
     root: Node
     alias_name: Node
     alias_type: Node
+    alias_ptr: Optional[Node]  # if present, the alias is a pointer
 
 
 def _alias_rules(rules: _MultiRules) -> AliasRules:
@@ -164,6 +287,7 @@ def _alias_rules(rules: _MultiRules) -> AliasRules:
         root=_one(rules, "alias"),
         alias_name=_one(rules, "alias.name"),
         alias_type=_one(rules, "alias.type"),
+        alias_ptr=rules.get("alias.ptr", [None])[0],
     )
 
 
@@ -254,3 +378,146 @@ def _parse_rules(rules: _MultiRules) -> Rules:
         return _property_rules(rules)
 
     assert False, "Unknown rule"
+
+
+# capture holding the whole declaration for each kind of match
+_ROOTS = (
+    "function",
+    "bitflag",
+    "enum",
+    "opaque",
+    "struct",
+    "union",
+    "alias",
+    "callback",
+    "fn_macro",
+    "const",
+    "prop",
+    "cond",
+)
+
+# pattern index of the bitflags made by `group_bitflags`, which don't come from `query.scm`
+BITFLAG_PATTERN = -1
+
+_BITFLAG_TYPES = {"type_identifier", "primitive_type", "sized_type_specifier"}
+
+
+def _match_root(rules: _MultiRules) -> Node:
+    for k in _ROOTS:
+        if k in rules:
+            return rules[k][0]
+
+    assert False, "Unknown rule"
+
+
+def _is_flag(node: Node) -> bool:
+    return node.type == "preproc_def" and node.child_by_field_name("value") is not None
+
+
+# nodes whose children can hold bitflags, the same levels that `classify.CursorEngine` walks
+_CONTAINERS = {
+    "translation_unit",
+    "preproc_if",
+    "preproc_ifdef",
+    "preproc_elif",
+    "preproc_elifdef",
+    "preproc_else",
+    "ERROR",
+}
+
+
+@dataclass
+class _Run:
+    typedef: Node
+    type: Node
+    names: list[Node]
+    flags: list[Node]
+    end: int
+
+
+def _start_run(typedef: Node) -> _Run | None:
+    ty = typedef.child_by_field_name("type")
+    names = [d for d in fields(typedef, "declarator") if d.type == "type_identifier"]
+    if ty is None or ty.type not in _BITFLAG_TYPES or not names:
+        return None
+
+    return _Run(typedef, ty, names, [], typedef.end_byte)
+
+
+def _runs(node: Node, runs: list[_Run]):
+    """
+    Find every integer `typedef` under `node` that is directly followed by `#define`s, in order.
+    `#define`s without a value and comments end the run, function-like macros don't.
+    """
+    run = None
+
+    for child in children(node):
+        if run is not None:
+            if _is_flag(child):
+                run.flags.append(child)
+                run.end = child.end_byte
+                continue
+            if child.type == "preproc_function_def":
+                run.end = child.end_byte
+                continue
+
+            if run.flags:
+                runs.append(run)
+            run = None
+
+        if child.type in _CONTAINERS:
+            _runs(child, runs)
+        elif child.type == "type_definition":
+            run = _start_run(child)
+
+    if run is not None and run.flags:
+        runs.append(run)
+
+
+def group_bitflags(
+    root: Node, matches: Iterable[tuple[int, _MultiRules]]
+) -> Iterator[tuple[int, _MultiRules]]:
+    """
+    Turn each integer `typedef` followed by `#define`s into a single bitflag match, given the `matches` of `root`.
+    The `typedef` and the constants are not matched on their own anymore, but properties and function-like macros
+    are. The bitflag comes right after the matches of its `#define`s, like it used to with the query.
+
+    The tree is swept once before the matches are seen, so this is O(n).
+    """
+    runs: list[_Run] = []
+    _runs(root, runs)
+
+    # ids of the typedefs and constants that are part of a bitflag
+    grouped = {run.typedef.id for run in runs}
+    grouped.update(f.id for run in runs for f in run.flags)
+
+    # runs don't overlap, so they also end in order
+    pending = iter(runs)
+    next_run = next(pending, None)
+
+    def _flush(until: int) -> Iterator[tuple[int, _MultiRules]]:
+        nonlocal next_run
+        while next_run is not None and next_run.end <= until:
+            run = next_run
+            next_run = next(pending, None)
+            for name in run.names:
+                yield BITFLAG_PATTERN, {
+                    "bitflag.type": [run.type],
+                    "bitflag.name": [name],
+                    "bitflag": [run.typedef],
+                    "flag.name": [f.child_by_field_name("name") for f in run.flags],
+                    "flag.value": [f.child_by_field_name("value") for f in run.flags],
+                    "flag": list(run.flags),
+                }
+
+    for i, rules in matches:
+        node = _match_root(rules)
+        if next_run is not None and next_run.end <= node.start_byte:
+            yield from _flush(node.start_byte)
+
+        if ("const" in rules or "alias" in rules) and node.id in grouped:
+            continue
+
+        yield i, rules
+
+    yield from _flush(sys.maxsize)
@@ -0,0 +1,168 @@
+import io
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from dataclasses import dataclass, field
+from typing import IO, Any, Callable, Iterator
+
+
+class UsageError(ValueError):
+    """
+    Invalid arguments or settings of a run (eg. an unknown platform or generator option).
+    `sdl_parser.py` prints these without a traceback, unlike errors of the generators themselves.
+    """
+
+
+class Sink:
+    """
+    Destination of the generated files.
+    `path` is relative to the output root, starting with the generator name (eg. `cpp/SDL.g.cppm`).
+
+    Subclasses implement `open`, to stream the files as they are generated, or `write`, to get each file whole.
+    """
+
+    def open(self, path: str, binary: bool = False) -> IO:
+        """
+        Open `path` for writing. By default, the contents are kept in memory and handed to `write` on close.
+        """
+        return _BinaryOutput(self, path) if binary else _TextOutput(self, path)
+
+    def write(self, path: str, data: str | bytes):
+        """
+        Write the whole contents of `path`. By default, through `open`.
+        """
+        with self.open(path, binary=isinstance(data, bytes)) as f:
+            f.write(data)
+
+
+class FileSink(Sink):
+    """
+    Write the generated files under `root`, which is what `sdl_parser.py` does with `out/`.
+    Files are written to disk as they are generated.
+    """
+
+    def __init__(self, root: str = "out") -> None:
+        self.root = root
+
+    def open(self, path: str, binary: bool = False) -> IO:
+        full = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        return open(full, "wb" if binary else "w")
+
+
+class MemorySink(Sink):
+    """
+    Keep the generated files in `files`, by path.
+    """
+
+    def __init__(self) -> None:
+        self.files: dict[str, str | bytes] = {}
+
+    def write(self, path: str, data: str | bytes):
+        self.files[path] = data
+
+
+@dataclass
+class RunContext:
+    sdl_root: str
+    path_by_unit: dict[str, str]
+    sink: Sink
+    # intermediate files (eg. preprocessed headers) go to `<work_dir>/<gen>/pp/`
+    work_dir: str = "out"
+    # generator state shared by all the units of a run
+    state: dict[str, Any] = field(default_factory=dict)
+    # platforms of `--platforms`, empty when generating for the host only
+    platforms: list[str] = field(default_factory=list)
+
+
+_CURRENT: ContextVar[RunContext] = ContextVar("run")
+# thread running the work passed to `defer`, and what was passed so far
+_BACKGROUND: ContextVar[tuple[ThreadPoolExecutor, list[Future]]] = ContextVar(
+    "background"
+)
+
+
+def current() -> RunContext:
+    """
+    Get the context of the run in progress.
+    """
+    return _CURRENT.get()
+
+
+@contextmanager
+def running(ctx: RunContext) -> Iterator[RunContext]:
+    """
+    Make `ctx` the run in progress. On exit, wait for the work passed to `defer` and raise its first error, if any.
+    """
+    token = _CURRENT.set(ctx)
+    futures: list[Future] = []
+
+    try:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="defer") as pool:
+            background = _BACKGROUND.set((pool, futures))
+            try:
+                yield ctx
+            finally:
+                _BACKGROUND.reset(background)
+    finally:
+        _CURRENT.reset(token)
+
+    for future in futures:
+        future.result()
+
+
+def defer(fn: Callable[[], Any]):
+    """
+    Run `fn` on a background thread, in the current context, while the run goes on (eg. with the next unit).
+    Deferred work is done one at a time, in order, and always before `running` returns.
+    Outside of `running`, `fn` is called right away.
+    """
+    background = _BACKGROUND.get(None)
+    if background is None:
+        fn()
+        return
+
+    pool, futures = background
+    futures.append(pool.submit(copy_context().run, fn))
+
+
+def bind(ctx: RunContext) -> Context:
+    """
+    Copy the current context, with `ctx` as the run in progress.
+    Use `Context.run` to call code that should see `ctx` from `current()`.
+    """
+    context = copy_context()
+    context.run(_CURRENT.set, ctx)
+    return context
+
+
+class _TextOutput(io.StringIO):
+    def __init__(self, sink: Sink, path: str) -> None:
+        super().__init__()
+        self._sink = sink
+        self._path = path
+
+    def close(self):
+        if not self.closed:
+            self._sink.write(self._path, self.getvalue())
+        super().close()
+
+
+class _BinaryOutput(io.BytesIO):
+    def __init__(self, sink: Sink, path: str) -> None:
+        super().__init__()
+        self._sink = sink
+        self._path = path
+
+    def close(self):
+        if not self.closed:
+            self._sink.write(self._path, self.getvalue())
+        super().close()
+
+
+def open_output(path: str, binary: bool = False) -> IO:
+    """
+    Open a generated file for writing, like `open(f"out/{path}", "w")`, through the sink of the current run.
+    """
+    return current().sink.open(path, binary)
@@ -1,20 +1,45 @@
 import sys
 import time
 
-from _codegen_module_impl import codegen
+# NOTE: everything heavy (pcpp, tree-sitter, the generators) is imported only after the arguments are checked
 
 if __name__ == "__main__":
     if len(sys.argv) < 2 or sys.argv[1] == "--help":
-        print(
-            """Usage:
+        print("""Usage:
     python sdl_parser.py <path-to-bind-gen-module> <gen-args>...
+    python sdl_parser.py cache stats|prune [--max-size=SIZE]
+
+    Options:
+        --split-units   Preprocess and parse each header included by `SDL.h` separately, in parallel.
+        --jobs=N        Number of worker processes used by `--split-units` and `--pipeline`.
+        --platforms[=windows,linux,...]
+                        Generate for several platforms from one preprocessing pass, in `out/<gen>/<platform>/`.
+                        Without a value: windows, linux, macos, ios, android and emscripten.
+        --engine=cursor Find declarations with a hand-written tree walk instead of `query.scm`.
+        --pipeline      Preprocess the next units while the current one is visited, and print how busy each stage was.
+
+    Shared cache:
+        Set SDL_PARSER_CACHE to a directory to share the preprocessed headers between runs (and CI jobs).
+        SDL_PARSER_CACHE_SIZE caps its size (eg. `512M`, 1G by default), evicting the least recently used entries.
+        SDL_PARSER_CACHE_COMPRESSION is `zlib` (the default) or `lzma`.
+        `cache stats` shows the entries and hit rates, `cache prune` evicts entries down to the cap
+        (or `--max-size`, `--max-size=0` clearing the cache).
+        Entries are loaded with pickle/marshal: only trusted users should be able to write to the directory.
 
     To write your own generator, make a new `gen/<my_gen>.py` file and derive a `Visitor` class from `visitor.VisitorBase`.
     Then you can use it as `python sdl_parser.py gen.my_gen`.
-"""
-        )
+""")
         sys.exit(1)
 
+    if sys.argv[1] == "cache":
+        from cache import main
+
+        main(sys.argv[2:])
+        sys.exit(0)
+
     start = time.time()
-    codegen(sys.argv[1])
+
+    from _codegen_module_impl import codegen
+
+    codegen(*sys.argv[1:])
     print(f"Elapsed: {time.time() - start:.2f}s")
@@ -1,4 +1,3 @@
-import sys
 from pathlib import Path
 
 # NOTE: this is relative to `sdl_parser.py` if a relative path.
@@ -21,20 +20,21 @@ PATH_BY_UNIT = {
 
 # Validation, don't touch
 
-if not Path(SDL_ROOT).exists():
-    print("Error: SDL_ROOT is not a valid path. Please edit setup.py.")
+_SDL_MODULES = {"SDL", "SDL_main", "SDL_vulkan", "SDL_image", "SDL_mixer", "SDL_ttf"}
 
-if not PATH_BY_UNIT:
-    print("Error: no units chosen to parse. Please edit PATH_BY_UNIT in setup.py.")
-    sys.exit(1)
 
-_SDL_MODULES = {"SDL", "SDL_main", "SDL_vulkan", "SDL_image", "SDL_mixer", "SDL_ttf"}
-for k, v in PATH_BY_UNIT.items():
-    if k not in _SDL_MODULES:
-        print(
-            f"Unsupported module {k} in setup.py/PATH_BY_UNIT. Expected one of {_SDL_MODULES}."
-        )
-        sys.exit(1)
-    if not (Path(SDL_ROOT) / v).exists():
-        print(f"Invalid path {v} for module {k} in setup.py/PATH_BY_UNIT.")
-        sys.exit(1)
+def validate(sdl_root: str, path_by_unit: dict[str, str]):
+    """
+    Check that the units to parse are known and their headers exist. Raises `ValueError` otherwise.
+    """
+    if not Path(sdl_root).exists():
+        raise ValueError(f"SDL root {sdl_root} is not a valid path.")
+
+    if not path_by_unit:
+        raise ValueError("No units chosen to parse.")
+
+    for k, v in path_by_unit.items():
+        if k not in _SDL_MODULES:
+            raise ValueError(f"Unsupported module {k}. Expected one of {_SDL_MODULES}.")
+        if not (Path(sdl_root) / v).exists():
+            raise ValueError(f"Invalid path {v} for module {k}.")
@@ -0,0 +1,81 @@
+/* A preprocessed SDL-like header, with a bit of everything the query looks for. */
+
+typedef Uint32 SDL_DisplayID;
+typedef struct SDL_Window SDL_Window;
+typedef struct SDL_GLContextState *SDL_GLContext;
+
+/**
+ * The flags on a window.
+ */
+typedef Uint64 SDL_WindowFlags;
+
+#define SDL_WINDOW_FULLSCREEN SDL_UINT64_C(0x0000000000000001) /**< window is in fullscreen mode */
+#define SDL_WINDOW_OPENGL SDL_UINT64_C(0x0000000000000002)
+#define SDL_WINDOWPOS_CENTERED_MASK 0x2FFF0000u
+#define SDL_WINDOWPOS_CENTERED_DISPLAY(X) (SDL_WINDOWPOS_CENTERED_MASK|(X))
+
+/**
+ * Display orientation values.
+ */
+typedef enum SDL_DisplayOrientation
+{
+    SDL_ORIENTATION_UNKNOWN, /**< The display orientation can't be determined */
+    SDL_ORIENTATION_LANDSCAPE,
+#if defined(SDL_PLATFORM_IOS)
+    SDL_ORIENTATION_PORTRAIT = 4,
+#endif
+} SDL_DisplayOrientation;
+
+typedef struct SDL_DisplayMode
+{
+    SDL_DisplayID displayID;
+    int w, h;
+    float pixel_density;
+    char name[32];
+    struct { int x, y; } origin;
+    void *internal;
+} SDL_DisplayMode;
+
+typedef union SDL_Thing
+{
+    Uint32 type;
+    Uint8 padding[128];
+} SDL_Thing, *SDL_ThingPtr;
+
+typedef bool (*SDL_HitTest)(SDL_Window *win, const SDL_Point *area, void *data);
+typedef const char *(*SDL_NameCallback)(void *userdata);
+
+#define SDL_PROP_WINDOW_CREATE_TITLE_STRING "SDL.window.create.title"
+#define SDL_PROP_WINDOW_CREATE_WIDTH_NUMBER "SDL.window.create.width"
+#define SDL_MAX_WINDOWS 16
+
+/**
+ * Create a window with the specified dimensions and flags.
+ *
+ * \param title the title of the window, in UTF-8 encoding.
+ * \param w the width of the window.
+ * \param h the height of the window.
+ * \param flags 0, or one or more SDL_WindowFlags OR'd together.
+ * \returns the window that was created or NULL on failure.
+ */
+extern SDL_Window * SDL_CreateWindow(const char *title, int w, int h, SDL_WindowFlags flags);
+extern void SDL_DestroyWindow(SDL_Window *window);
+extern const char * const *SDL_GetWindowNames(int *count);
+extern int SDL_SetWindowShape(SDL_Window *window, const SDL_Point *points, int count), SDL_Other(void);
+
+#if defined(SDL_PLATFORM_WINDOWS)
+/**
+ * Windows only.
+ */
+extern void * SDL_GetWindowHWND(SDL_Window *window);
+#elif defined(SDL_PLATFORM_MACOS)
+extern void * SDL_GetWindowNSWindow(SDL_Window *window);
+#else
+extern int SDL_GetWindowX11(SDL_Window *window);
+#endif
+
+#ifdef SDL_PLATFORM_LINUX
+typedef Uint32 SDL_X11Flags;
+#define SDL_X11_A 0x1u
+#define SDL_X11_B 0x2u
+#endif
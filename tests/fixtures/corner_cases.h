@@ -0,0 +1,61 @@
+/* Corner cases of the query: bitflags broken by other declarations, several declarators, nested blocks. */
+
+typedef Uint32 F;
+#define A 1
+#define M(x) x
+#define B_PROP_X 2
+int x;
+#define C 3
+
+typedef Uint32 G;
+#define G_A 1
+/* c */
+#define G_B 2
+#define G_E
+#define G_C 3
+
+typedef Uint32 H;
+#define HM(x) x
+int y;
+
+typedef Uint32 I, J;
+#define I_A 1
+typedef unsigned int K;
+#define K_B 1
+
+#ifdef X
+typedef Uint32 L;
+#define L_A 1
+#endif
+#define L_B 2
+
+typedef struct X X, *PX;
+extern int a(void), *b(int);
+extern char **c(void);
+typedef Uint32 *P;
+
+typedef void (*cb)(int);
+typedef int *(*cb2)(int);
+typedef void (**cb3)(void);
+
+#if Q
+#elif R
+extern int f(void);
+#else
+extern int g(void);
+#endif
+#ifndef S
+#define T 1
+#endif
+
+typedef enum E { E_A,
+#if defined(Y)
+ E_B,
+#endif
+} E;
+typedef struct St { int a;
+#ifdef Z
+ int b;
+#endif
+} St, *PSt;
+typedef union U { int a; } U;
@@ -0,0 +1,147 @@
+"""
+Check `cache.Cache` on temporary directories: entries, size accounting, eviction and stats.
+
+Run from the root of the project with `python -m unittest discover tests` (or `python -m pytest tests`).
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+from cache import Cache
+
+
+def _data(size: int = 1000) -> bytes:
+    # random bytes don't compress, so each entry takes about `size` bytes
+    return os.urandom(size)
+
+
+def _key(i: int) -> str:
+    return f"{i:040x}"
+
+
+def _put(root: str, max_size: int, i: int):
+    Cache(root, max_size).put("tokens", _key(i), _data())
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def _size_file(self) -> int:
+        with open(os.path.join(self.root, "size")) as f:
+            return int(f.read())
+
+    def _disk_size(self, cache: Cache) -> int:
+        return sum(size for _, size, _ in cache._entries())
+
+    def _age(self, cache: Cache, kind: str, key: str, mtime: float):
+        path = cache._path(kind, key)
+        os.utime(path, (mtime, mtime))
+
+    def test_round_trip(self):
+        for compression in ("zlib", "lzma"):
+            with self.subTest(compression=compression):
+                cache = Cache(
+                    os.path.join(self.root, compression), compression=compression
+                )
+                cache.put("tokens", _key(1), b"hello" * 100)
+                self.assertEqual(cache.get("tokens", _key(1)), b"hello" * 100)
+                self.assertIsNone(cache.get("tokens", _key(2)))
+
+        # entries can be read whatever the setting
+        zlib_cache = Cache(os.path.join(self.root, "lzma"), compression="zlib")
+        self.assertEqual(zlib_cache.get("tokens", _key(1)), b"hello" * 100)
+
+    def test_overwrite(self):
+        cache = Cache(self.root)
+        cache.put("deps", _key(1), _data())
+        size = self._size_file()
+
+        # kept as is without `replace`
+        cache.put("deps", _key(1), b"other")
+        self.assertEqual(self._size_file(), size)
+        self.assertNotEqual(cache.get("deps", _key(1)), b"other")
+
+        cache.put("deps", _key(1), _data(), replace=True)
+        cache.put("deps", _key(1), _data(), replace=True)
+        self.assertEqual(self._size_file(), size)
+        self.assertEqual(self._size_file(), self._disk_size(cache))
+
+    def test_eviction(self):
+        cache = Cache(self.root)
+        for i in range(4):
+            cache.put("tokens", _key(i), _data())
+            self._age(cache, "tokens", _key(i), 1000 + i)
+        entry = self._disk_size(cache) // 4
+
+        # using the oldest entry makes it the last to be evicted
+        self.assertIsNotNone(cache.get("tokens", _key(0)))
+
+        # 5 entries go over the cap, and 4 over 90% of it
+        cache.max_size = int(4.2 * entry)
+        cache.put("tokens", _key(4), _data())
+
+        # down to 90% of the cap, the least recently used first
+        kept = [i for i in range(5) if cache.get("tokens", _key(i)) is not None]
+        self.assertEqual(kept, [0, 3, 4])
+        self.assertLessEqual(self._size_file(), int(cache.max_size * 0.9))
+        self.assertEqual(self._size_file(), self._disk_size(cache))
+
+    def test_prune_and_stats(self):
+        cache = Cache(self.root)
+        for i in range(3):
+            cache.put("tokens", _key(i), _data())
+            self._age(cache, "tokens", _key(i), 1000 + i)
+        cache.put("prelude", _key(0), _data())
+        entry = self._disk_size(cache) // 4
+
+        cache.get("tokens", _key(0))
+        cache.get("tokens", _key(9))
+        cache.flush()
+
+        stats = cache.stats()
+        self.assertEqual(stats["tokens"]["entries"], 3)
+        self.assertEqual(stats["tokens"]["size"], 3 * entry)
+        self.assertEqual((stats["tokens"]["hits"], stats["tokens"]["misses"]), (1, 1))
+        self.assertEqual(stats["prelude"]["entries"], 1)
+
+        # keeps the 2 most recently used: `prelude` and the `tokens` entry just read
+        self.assertEqual(cache.prune(2 * entry), (2, 2 * entry))
+        self.assertIsNotNone(cache.get("tokens", _key(0)))
+        self.assertEqual(self._size_file(), 2 * entry)
+
+        self.assertEqual(cache.prune(0), (2, 2 * entry))
+        stats = cache.stats()
+        self.assertEqual(sum(row["entries"] for row in stats.values()), 0)
+        self.assertEqual(self._size_file(), 0)
+
+    def test_concurrent_put(self):
+        cache = Cache(self.root)
+        cache.put("tokens", _key(0), _data())
+        max_size = 20 * self._disk_size(cache)
+
+        # more entries than fit, so that some are evicted while others are written
+        with ProcessPoolExecutor(4) as pool:
+            list(pool.map(_put, [self.root] * 60, [max_size] * 60, range(60)))
+
+        self.assertEqual(self._size_file(), self._disk_size(cache))
+        self.assertLessEqual(self._size_file(), max_size)
+        leftovers = [
+            name
+            for _, _, names in os.walk(self.root)
+            for name in names
+            if name.endswith(".tmp")
+        ]
+        self.assertEqual(leftovers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
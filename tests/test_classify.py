@@ -0,0 +1,57 @@
+"""
+Check that `classify.CursorEngine` gives the same matches as `query.scm` on the headers of `fixtures/`.
+
+Run from the root of the project with `python -m unittest discover tests` (or `python -m pytest tests`).
+"""
+
+import os
+import sys
+import unittest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+import utils
+from _codegen_module_impl import parse_query
+from classify import CursorEngine
+from rules import group_bitflags
+
+_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def _key(matches) -> list:
+    return [
+        (i, {k: [(n.type, n.start_byte, n.end_byte) for n in v] for k, v in c.items()})
+        for i, c in matches
+    ]
+
+
+class CursorEngineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.query = parse_query(os.path.join(_ROOT, "query.scm"))
+        cls.engine = CursorEngine()
+
+    def _roots(self):
+        for name in sorted(os.listdir(_FIXTURES)):
+            with open(os.path.join(_FIXTURES, name), "rb") as f:
+                yield name, utils.parser().parse(f.read()).root_node
+
+    def test_matches(self):
+        for name, root in self._roots():
+            with self.subTest(fixture=name):
+                expected = _key(self.query.matches(root))
+                self.assertTrue(expected, "the fixture should have matches")
+                self.assertEqual(_key(self.engine.matches(root)), expected)
+
+    def test_bitflags(self):
+        # what the visitors get
+        for name, root in self._roots():
+            with self.subTest(fixture=name):
+                expected = _key(group_bitflags(root, self.query.matches(root)))
+                got = _key(group_bitflags(root, self.engine.matches(root)))
+                self.assertEqual(got, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
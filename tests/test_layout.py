@@ -0,0 +1,140 @@
+"""
+Check the records of `layout.LayoutEngine` against the `sizeof`/`offsetof` a C compiler gives on each target.
+
+Run from the root of the project with `python -m unittest discover tests` (or `python -m pytest tests`).
+"""
+
+import os
+import sys
+import unittest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+import utils
+from _codegen_module_impl import parse_query
+from layout import LayoutEngine
+from rules import _parse_rules, group_bitflags
+
+_HEADER = b"""
+#define SDL_NAME_LEN (4 * 2 + 1)
+
+typedef struct SDL_Padded
+{
+    Uint8 tag;
+    Uint32 value;
+    Uint8 last;
+} SDL_Padded;
+
+typedef struct SDL_Outer
+{
+    Uint16 id;
+    SDL_Padded inner;
+    double weight;
+} SDL_Outer;
+
+typedef struct SDL_Named
+{
+    char name[SDL_NAME_LEN];
+    Uint16 flags[2][3];
+} SDL_Named;
+
+typedef union SDL_Value
+{
+    Uint8 byte;
+    Sint64 big;
+    void *ptr;
+} SDL_Value;
+
+typedef struct SDL_Handle
+{
+    Uint8 kind;
+    long value;
+    void *data;
+} SDL_Handle;
+
+typedef struct SDL_Bits
+{
+    Uint32 a : 4;
+    Uint32 b : 28;
+} SDL_Bits;
+
+typedef struct SDL_Blob
+{
+    Uint32 length;
+    Uint8 data[];
+} SDL_Blob;
+
+typedef struct SDL_UsesBlob
+{
+    SDL_Blob blob;
+} SDL_UsesBlob;
+"""
+
+# sizeof, then offsetof of each member, as given by gcc/clang (LP64) and MSVC (LLP64)
+_EXPECTED = {
+    "SDL_Padded": {
+        "LP64": (12, {"tag": 0, "value": 4, "last": 8}),
+        "LLP64": (12, {"tag": 0, "value": 4, "last": 8}),
+    },
+    "SDL_Outer": {
+        "LP64": (24, {"id": 0, "inner": 4, "weight": 16}),
+        "LLP64": (24, {"id": 0, "inner": 4, "weight": 16}),
+    },
+    "SDL_Named": {
+        "LP64": (22, {"name": 0, "flags": 10}),
+        "LLP64": (22, {"name": 0, "flags": 10}),
+    },
+    "SDL_Value": {
+        "LP64": (8, {"byte": 0, "big": 0, "ptr": 0}),
+        "LLP64": (8, {"byte": 0, "big": 0, "ptr": 0}),
+    },
+    "SDL_Handle": {
+        "LP64": (24, {"kind": 0, "value": 8, "data": 16}),
+        "LLP64": (16, {"kind": 0, "value": 4, "data": 8}),
+    },
+}
+
+
+class LayoutEngineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        query = parse_query(os.path.join(_ROOT, "query.scm"))
+        root = utils.parser().parse(_HEADER).root_node
+        matches = list(group_bitflags(root, query.matches(root)))
+
+        cls.engines = {}
+        for target in ("LP64", "LLP64"):
+            engine = LayoutEngine(target)
+            for _, rules in matches:
+                engine.add(_parse_rules(rules))
+            cls.engines[target] = engine
+
+    def test_records(self):
+        for name, targets in _EXPECTED.items():
+            for target, (size, offsets) in targets.items():
+                with self.subTest(record=name, target=target):
+                    layout = self.engines[target].layout(name)
+                    self.assertIsNotNone(layout)
+                    self.assertEqual(layout.size, size)
+                    self.assertEqual({f.name: f.offset for f in layout.fields}, offsets)
+
+    def test_arrays(self):
+        layout = self.engines["LP64"].layout("SDL_Named")
+        self.assertEqual(
+            (layout.field("name").size, layout.field("name").count), (1, 9)
+        )
+        self.assertEqual(
+            (layout.field("flags").size, layout.field("flags").count), (2, 6)
+        )
+
+    def test_unknown(self):
+        # bitfields and flexible arrays have no layout, nor do the records that hold them
+        for target, engine in self.engines.items():
+            for name in ("SDL_Bits", "SDL_Blob", "SDL_UsesBlob"):
+                with self.subTest(record=name, target=target):
+                    self.assertIsNone(engine.layout(name))
+
+
+if __name__ == "__main__":
+    unittest.main()
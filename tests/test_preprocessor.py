@@ -0,0 +1,49 @@
+"""
+Check which comments `preprocessor.filter_comments` keeps.
+
+Run from the root of the project with `python -m unittest discover tests` (or `python -m pytest tests`).
+"""
+
+import os
+import sys
+import unittest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+from preprocessor import filter_comments
+
+
+class FilterCommentsTest(unittest.TestCase):
+    def test_comment_in_string(self):
+        text = 'const char *s = "/* x */";'
+        self.assertEqual(filter_comments(text), text)
+
+    def test_slash_char_before_comment(self):
+        self.assertEqual(
+            filter_comments("char c = '/';/* c */int y;"), "char c = '/'; int y;"
+        )
+        self.assertEqual(
+            filter_comments("char c = '/'; /* c */ int y;"), "char c = '/';  int y;"
+        )
+
+    def test_doc_comments_in_a_row(self):
+        # only the last one is attached to the declaration
+        self.assertEqual(
+            filter_comments("/** a */ /** b */ int x;"), " /** b */ int x;"
+        )
+
+    def test_doc_comment_before_plain_comment(self):
+        self.assertEqual(filter_comments("/** doc */ /* plain */\nint x;"), " \nint x;")
+        self.assertEqual(filter_comments("/** doc */\n// plain\nint x;"), "\n\nint x;")
+
+    def test_trailing_doc_comment(self):
+        text = "typedef struct SDL_Point {\n    int x; /**< trailing */\n} SDL_Point;"
+        self.assertEqual(filter_comments(text), text)
+
+    def test_dropped_comment_separates_tokens(self):
+        self.assertEqual(filter_comments("int a/**/b;"), "int a b;")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Check the matches `rules.group_bitflags` gives for small headers.
+
+Run from the root of the project with `python -m unittest discover tests` (or `python -m pytest tests`).
+"""
+
+import os
+import sys
+import unittest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+import utils
+from _codegen_module_impl import parse_query
+from rules import BITFLAG_PATTERN, group_bitflags
+
+
+def _summary(matches) -> list:
+    """
+    `(kind, name)` for each match, and the flag names for bitflags.
+    """
+    out = []
+    for i, rules in matches:
+        if i == BITFLAG_PATTERN:
+            out.append(
+                (
+                    "bitflag",
+                    rules["bitflag.name"][0].text.decode(),
+                    [n.text.decode() for n in rules["flag.name"]],
+                )
+            )
+            continue
+
+        kind = next(k for k in rules if "." not in k)
+        name = rules.get(f"{kind}.name")
+        out.append((kind, name[0].text.decode() if name else None))
+    return out
+
+
+class GroupBitflagsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.query = parse_query(os.path.join(_ROOT, "query.scm"))
+
+    def _group(self, src: str) -> list:
+        root = utils.parser().parse(src.encode()).root_node
+        return _summary(group_bitflags(root, self.query.matches(root)))
+
+    def test_typedef_and_defines(self):
+        got = self._group(
+            "typedef Uint32 SDL_InitFlags;\n"
+            "#define SDL_INIT_AUDIO 0x00000010u\n"
+            "#define SDL_INIT_VIDEO 0x00000020u\n"
+            "extern int SDL_Init(SDL_InitFlags flags);\n"
+        )
+        self.assertEqual(
+            got,
+            [
+                ("bitflag", "SDL_InitFlags", ["SDL_INIT_AUDIO", "SDL_INIT_VIDEO"]),
+                ("function", "SDL_Init"),
+            ],
+        )
+
+    def test_split_by_comment(self):
+        got = self._group(
+            "typedef Uint32 SDL_InitFlags;\n"
+            "#define SDL_INIT_AUDIO 0x1u\n"
+            "/* not a flag anymore */\n"
+            "#define SDL_INIT_VIDEO 0x2u\n"
+        )
+        self.assertEqual(
+            got,
+            [
+                ("bitflag", "SDL_InitFlags", ["SDL_INIT_AUDIO"]),
+                ("const", "SDL_INIT_VIDEO"),
+            ],
+        )
+
+    def test_split_by_if(self):
+        got = self._group(
+            "typedef Uint32 SDL_InitFlags;\n"
+            "#define SDL_INIT_AUDIO 0x1u\n"
+            "#if defined(SDL_VIDEO)\n"
+            "#define SDL_INIT_VIDEO 0x2u\n"
+            "#endif\n"
+        )
+        self.assertEqual(got[0], ("bitflag", "SDL_InitFlags", ["SDL_INIT_AUDIO"]))
+        self.assertIn(("const", "SDL_INIT_VIDEO"), got)
+
+    def test_typedef_without_flags(self):
+        got = self._group(
+            "typedef Uint32 SDL_WindowID;\nextern int SDL_GetWindowID(void);\n"
+        )
+        self.assertEqual(
+            got, [("alias", "SDL_WindowID"), ("function", "SDL_GetWindowID")]
+        )
+
+    def test_adjacent_bitflags(self):
+        got = self._group(
+            "typedef Uint8 SDL_A;\n"
+            "#define SDL_A_X 1\n"
+            "#define SDL_A_Y 2\n"
+            "typedef Uint16 SDL_B;\n"
+            "#define SDL_B_X 1\n"
+        )
+        self.assertEqual(
+            got,
+            [
+                ("bitflag", "SDL_A", ["SDL_A_X", "SDL_A_Y"]),
+                ("bitflag", "SDL_B", ["SDL_B_X"]),
+            ],
+        )
+
+    def test_grouped_matches_suppressed(self):
+        root = (
+            utils.parser()
+            .parse(
+                b"typedef Uint32 SDL_InitFlags;\n"
+                b"#define SDL_INIT_AUDIO 0x1u\n"
+                b"#define SDL_INIT_VIDEO 0x2u\n"
+            )
+            .root_node
+        )
+
+        # the query alone matches the typedef and each define
+        raw = _summary(self.query.matches(root))
+        self.assertIn(("alias", "SDL_InitFlags"), raw)
+        self.assertIn(("const", "SDL_INIT_AUDIO"), raw)
+
+        got = _summary(group_bitflags(root, self.query.matches(root)))
+        self.assertEqual(
+            got, [("bitflag", "SDL_InitFlags", ["SDL_INIT_AUDIO", "SDL_INIT_VIDEO"])]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,32 +1,116 @@
-import tree_sitter_c as tsc
+import threading
+from typing import Iterator
+
 from tree_sitter import Language, Node, Parser, Query, QueryCursor
 
-_C_LANGUAGE = Language(tsc.language())
-_PARSER = Parser(_C_LANGUAGE)
+# loaded on first use, so that importing this module stays cheap
+_C_LANGUAGE: Language | None = None
+# parsers can't be used by two threads at once, so each thread has its own
+_LOCAL = threading.local()
+
+
+def language() -> Language:
+    global _C_LANGUAGE
+    if _C_LANGUAGE is None:
+        import tree_sitter_c as tsc
+
+        _C_LANGUAGE = Language(tsc.language())
+    return _C_LANGUAGE
+
+
+def parser() -> Parser:
+    """
+    Get the parser of the calling thread, created on first use.
+    """
+    parser = getattr(_LOCAL, "parser", None)
+    if parser is None:
+        parser = _LOCAL.parser = Parser(language())
+    return parser
+
+
+class QueryPool:
+    """
+    A compiled query, with a `QueryCursor` per thread.
+    The query itself is never changed once compiled, so all the threads share it,
+    but a cursor holds the state of the matching in progress.
+    """
+
+    def __init__(self, query: Query) -> None:
+        self.query = query
+        self._local = threading.local()
+
+    def cursor(self) -> QueryCursor:
+        """
+        Get the cursor of the calling thread, created on first use.
+        """
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = QueryCursor(self.query)
+        return cursor
 
+    def matches(self, node: Node) -> list[tuple[int, dict[str, list[Node]]]]:
+        return self.cursor().matches(node)
 
-def parser():
-    return _PARSER
 
+def query(text: str) -> QueryPool:
+    return QueryPool(Query(language(), text))
 
-def query(text: str) -> QueryCursor:
-    return QueryCursor(Query(_C_LANGUAGE, text))
 
+def children(node: Node, *, named: bool = True) -> Iterator[Node]:
+    """
+    Iterate over the (named, unless `named=False`) children of a node.
+    Unlike `node.named_children`, the children are walked with a `TreeCursor`, so no list is built.
+    """
+    cursor = node.walk()
+    if not cursor.goto_first_child():
+        return
+
+    while True:
+        child = cursor.node
+        if not named or child.is_named:
+            yield child
+        if not cursor.goto_next_sibling():
+            return
+
+
+def fields(node: Node, name: str) -> Iterator[Node]:
+    """
+    Iterate over the children of a node in field `name`. Same as `node.children_by_field_name`, but lazy.
+    """
+    cursor = node.walk()
+    if not cursor.goto_first_child():
+        return
 
-def only(ty: str, node: Node):
+    while True:
+        if cursor.field_name == name:
+            yield cursor.node
+        if not cursor.goto_next_sibling():
+            return
+
+
+def only(ty: str, node: Node) -> Iterator[Node]:
     """
     Get children of a node that are of a certain type. This is a lazy filter.
     """
-    return filter(lambda n: n.type == ty, node.named_children)
+    return (n for n in children(node) if n.type == ty)
 
 
-def split_type_name(node: Node) -> tuple[str, str]:
+def first(ty: str, node: Node) -> Node | None:
+    """
+    Get the first child of a node that is of a certain type, if any. The rest of the children are not visited.
+    """
+    return next(only(ty, node), None)
+
+
+def split_type_name(node: Node, decl: Node | None = None) -> tuple[str, str]:
     """
     Split a type and a name from a node.
     Can be used in parameters, members, and even functions to get return type and name.
+    For declarations of several names (eg. `int x, y;`), `decl` is the declarator to use instead of the first one.
     """
     ty = node.child_by_field_name("type")
-    decl = node.child_by_field_name("declarator")
+    if decl is None:
+        decl = node.child_by_field_name("declarator")
 
     if ty.type == "struct_specifier":
         ty = ty.child_by_field_name("name")
@@ -36,10 +120,10 @@ def split_type_name(node: Node) -> tuple[str, str]:
     if decl is None:
         return ty.decode(), ""
 
-    for n in node.children:
-        if n.type == "type_qualifier":
-            ty = n.text + b" " + ty
-            break  # logically there should be only one type_qualifier
+    # logically there should be only one type_qualifier
+    qualifier = first("type_qualifier", node)
+    if qualifier is not None:
+        ty = qualifier.text + b" " + ty
 
     while not decl.type == "identifier":
         match decl.type:
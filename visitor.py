@@ -1,7 +1,10 @@
 import re
 import sys
 from abc import ABCMeta, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, TypeVar
 
+import run
 from rules import (
     AliasRules,
     BitflagRules,
@@ -24,12 +27,49 @@ from rules import (
 # special handling for properties
 
 
-_BITFLAG_FILTER = {"preproc_def", "preproc_function_def"}
-
 _PLATFORM_REGEX = re.compile(r"\bSDL_PLATFORM_\w+\b")
 
+# phase of each kind of declaration, see `VisitorBase.phases`
+_PHASES = {
+    FuncRules: "functions",
+    EnumRules: "enums",
+    OpaqueRules: "opaques",
+    StructRules: "structs",
+    UnionRules: "unions",
+    BitflagRules: "bitflags",
+    AliasRules: "aliases",
+    CallbackRules: "callbacks",
+    FnMacroRules: "fn_macros",
+    PropertyRules: "properties",
+    ConstRules: "consts",
+}
+
+R = TypeVar("R")
+
+
+@dataclass
+class Item(Generic[R]):
+    """
+    A declaration passed to the batched `visit_*s` methods.
+    """
+
+    rules: R
+    # platforms of the block the declaration is in (eg. `["SDL_PLATFORM_WINDOWS"]`), empty if none
+    platforms: list[str]
+
 
 class VisitorBase(metaclass=ABCMeta):
+    phases: tuple[str, ...] = ()
+    """
+    Kinds of declarations (`"functions"`, `"enums"`, `"structs"`, ...) visited in batches rather than one by one.
+
+    The declarations of these kinds are kept until the end of the header (with `--split-units`) or unit,
+    then passed all at once to the matching `visit_*s` method (eg. `visit_functions`), one phase after the other
+    in the order of `phases` and after every declaration that is not batched.
+    For example, `phases = ("functions",)` visits the functions once all the types are known.
+    The batched declarations therefore come out after the others, not in declaration order.
+    """
+
     def __init__(self, unit: str) -> None:
         # The `unit` parameter is there just to tell you that's all you have
         pass
@@ -68,6 +108,39 @@ class VisitorBase(metaclass=ABCMeta):
         """
         raise NotImplementedError()
 
+    def begin_unit(self):
+        """
+        Called once the generator is constructed, before any declaration of the unit is visited.
+        """
+        pass
+
+    def end_unit(self) -> Callable[[], Any] | None:
+        """
+        Called once every declaration of the unit was visited. Write the outputs of the unit here.
+
+        If a function is returned, it is called on a background thread while the next unit is being parsed
+        (see `run.defer`), so slow work such as serializing the outputs can be left to it.
+        Such a function should only use what belongs to this generator, as the next unit may change shared state
+        (eg. `run.current().state`) in the meantime.
+        """
+        pass
+
+    def start_header(self, header: str):
+        """
+        Start the declarations of a header included by `SDL.h` (eg. `SDL_video.h`).
+
+        This is only called when each header is parsed separately (`--split-units`).
+        Everything visited until the matching `end_header` was declared in `header`.
+        Headers are visited in the order `SDL.h` includes them.
+        """
+        pass
+
+    def end_header(self):
+        """
+        End the declarations of the header passed to the last `start_header`.
+        """
+        pass
+
     @abstractmethod
     def visit_function(self, rules: FuncRules):
         """
@@ -145,6 +218,50 @@ class VisitorBase(metaclass=ABCMeta):
         """
         raise NotImplementedError()
 
+    # batched versions of the `visit_*` methods, called for the kinds in `phases`
+    # by default they visit each item on its own, inside `start_platform_code`/`end_platform_code` if needed
+
+    def visit_functions(self, items: list[Item[FuncRules]]):
+        self._visit_each(items, self.visit_function)
+
+    def visit_enums(self, items: list[Item[EnumRules]]):
+        self._visit_each(items, self.visit_enum)
+
+    def visit_opaques(self, items: list[Item[OpaqueRules]]):
+        self._visit_each(items, self.visit_opaque)
+
+    def visit_structs(self, items: list[Item[StructRules]]):
+        self._visit_each(items, self.visit_struct)
+
+    def visit_unions(self, items: list[Item[UnionRules]]):
+        self._visit_each(items, self.visit_union)
+
+    def visit_bitflags(self, items: list[Item[BitflagRules]]):
+        self._visit_each(items, self.visit_bitflag)
+
+    def visit_aliases(self, items: list[Item[AliasRules]]):
+        self._visit_each(items, self.visit_alias)
+
+    def visit_callbacks(self, items: list[Item[CallbackRules]]):
+        self._visit_each(items, self.visit_callback)
+
+    def visit_fn_macros(self, items: list[Item[FnMacroRules]]):
+        self._visit_each(items, self.visit_fn_macro)
+
+    def visit_properties(self, items: list[Item[PropertyRules]]):
+        self._visit_each(items, self.visit_property)
+
+    def visit_consts(self, items: list[Item[ConstRules]]):
+        self._visit_each(items, self.visit_const)
+
+    def _visit_each(self, items: list[Item[R]], visit: Callable[[R], None]):
+        for item in items:
+            if item.platforms:
+                self.start_platform_code(item.platforms)
+            visit(item.rules)
+            if item.platforms:
+                self.end_platform_code()
+
 
 class _Visitor:
     _inner: VisitorBase
@@ -153,28 +270,78 @@ class _Visitor:
         self._inner = cls(unit, *args, **kwargs)
         # The `unit` parameter is there just to tell you that's all you have
 
-        # There is no query that can tell tree sitter to
-        # ignore typedef/#defines that are used for bitflags
-        # so we have to do it manually
-        self._parsing_bitflag = False
         self._platforms = []
         self._platform_block = None
 
+        for phase in self._inner.phases:
+            if phase not in _PHASES.values():
+                raise ValueError(
+                    f"Unknown phase {phase!r} in {cls.__name__}.phases, expected one of {', '.join(_PHASES.values())}"
+                )
+        self._batches: dict[str, list[Item]] = {
+            phase: [] for phase in self._inner.phases
+        }
+
+        self._inner.begin_unit()
+
+    def start_header(self, header: str):
+        """
+        Called before visiting the tree of `header` when each header is parsed separately.
+        Rows are per tree, so any open platform block is closed here.
+        """
+        self._platform_block = None
+        self._inner.start_header(header)
+
+    def end_header(self):
+        self._flush()
+        self._inner.end_header()
+
+    def finish(self):
+        """
+        Called once every declaration of the unit was visited.
+        """
+        self._flush()
+
+        work = self._inner.end_unit()
+        if work is not None:
+            run.defer(work)
+
+    def _flush(self):
+        for phase, items in self._batches.items():
+            if items:
+                getattr(self._inner, f"visit_{phase}")(items)
+                self._batches[phase] = []
+
+    def _guard(self, rule: Rules) -> list[str]:
+        """
+        Get the platforms of the block `rule` is in, if any.
+        """
+        if self._platform_block:
+            if (
+                rule.root.start_point.row >= self._platform_block.start_point.row
+                and rule.root.end_point.row <= self._platform_block.end_point.row
+            ):
+                return self._platforms
+            else:  # reset
+                self._platform_block = None
+
+        return []
+
     def visit(self, rules: _MultiRules):
         # TODO: check if this is the child of the `cond` node, if the node is not `None`
         # when not the child, then the `cond` node becomes None
 
         def _platform_setup(rule: Rules):
-            if self._platform_block:
-                if (
-                    rule.root.start_point.row >= self._platform_block.start_point.row
-                    and rule.root.end_point.row <= self._platform_block.end_point.row
-                ):
-                    self._inner.start_platform_code(self._platforms)
-                else:  # reset
-                    self._platform_block = None
+            if platforms := self._guard(rule):
+                self._inner.start_platform_code(platforms)
 
         parsed = _parse_rules(rules)
+
+        phase = _PHASES.get(type(parsed))
+        if phase in self._batches:
+            self._batches[phase].append(Item(parsed, self._guard(parsed)))
+            return
+
         match parsed:
             case FuncRules():
                 _platform_setup(parsed)
@@ -182,7 +349,6 @@ class _Visitor:
             case BitflagRules():
                 _platform_setup(parsed)
                 self._inner.visit_bitflag(parsed)
-                self._parsing_bitflag = False
             case EnumRules():
                 _platform_setup(parsed)
                 self._inner.visit_enum(parsed)
@@ -196,10 +362,6 @@ class _Visitor:
                 _platform_setup(parsed)
                 self._inner.visit_union(parsed)
             case AliasRules():
-                if parsed.root.next_sibling.type in _BITFLAG_FILTER:
-                    self._parsing_bitflag = True
-                    return
-
                 _platform_setup(parsed)
                 self._inner.visit_alias(parsed)
             case CallbackRules():
@@ -209,10 +371,8 @@ class _Visitor:
                 _platform_setup(parsed)
                 self._inner.visit_fn_macro(parsed)
             case ConstRules():
-                if not self._parsing_bitflag:
-                    # skip constants inside bitflags and platform-specific code
-                    _platform_setup(parsed)
-                    self._inner.visit_const(parsed)
+                _platform_setup(parsed)
+                self._inner.visit_const(parsed)
             case CondRules():
                 self._platforms = _PLATFORM_REGEX.findall(
                     parsed.cond_text.text.decode()